@@ -0,0 +1,129 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from product.models import Product
+from .models import CartItem
+
+# Cart quantities are only ever changed by single UPDATE / INSERT / DELETE
+# statements, never read into Python, changed and saved back, so concurrent
+# requests (double clicks, several tabs) can't overwrite each other's
+# changes. (cart, product) is unique, which turns a concurrent first add of
+# the same product into an IntegrityError that is retried as an increment.
+
+
+def add_cart_item(cart_id, product_id, quantity=1):
+    """Add `quantity` of the product to the cart, creating the line if needed."""
+    with transaction.atomic():
+        updated = CartItem.objects.filter(cart_id=cart_id, product_id=product_id).update(
+            quantity=F('quantity') + quantity
+        )
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+        except IntegrityError:
+            # another request created the line first, add to it
+            CartItem.objects.filter(cart_id=cart_id, product_id=product_id).update(
+                quantity=F('quantity') + quantity
+            )
+
+
+def set_cart_item_quantity(cart_id, product_id, quantity):
+    # only changes a line that is in the cart
+    return CartItem.objects.filter(cart_id=cart_id, product_id=product_id).update(quantity=quantity)
+
+
+def remove_cart_item(cart_id, product_id):
+    removed, _ = CartItem.objects.filter(cart_id=cart_id, product_id=product_id).delete()
+    return removed
+
+
+def empty_cart(user_id):
+    """Delete the lines of the user's cart, returns {product id: quantity} of what was in it.
+
+    Run it in the transaction creating the order: the rows stay locked until
+    then, and a line added meanwhile stays in the cart.
+    """
+    lines = list(
+        CartItem.objects.select_for_update().filter(cart__user_id=user_id).values_list('id', 'product_id', 'quantity')
+    )
+    CartItem.objects.filter(id__in=[item_id for item_id, _, _ in lines]).delete()
+    return {product_id: quantity for _, product_id, quantity in lines}
+
+
+# operation => whether it takes a quantity
+OPERATIONS = {'add': True, 'update': True, 'remove': False}
+
+
+def parse_int(value):
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def parse_quantity(value):
+    # cart quantities are positive integers, None for anything else
+    quantity = parse_int(value)
+    return quantity if quantity is not None and quantity >= 1 else None
+
+
+def parse_operation(operation, existing):
+    """Return ((op, product id, quantity), None) or (None, errors) for one batch entry."""
+    if not isinstance(operation, dict):
+        return None, {'non_field_errors': ["Expected an object."]}
+    errors = {}
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        errors['op'] = [f"Expected one of {', '.join(OPERATIONS)}."]
+    product_id = parse_int(operation.get('product_id'))
+    if product_id is None:
+        errors['product_id'] = ["A valid integer is required."]
+    elif product_id not in existing:
+        errors['product_id'] = [f"Product {product_id} does not exist."]
+    quantity = parse_quantity(operation.get('quantity', 1))
+    if OPERATIONS.get(op) and quantity is None:
+        errors['quantity'] = ["Expected a positive integer."]
+    if errors:
+        return None, errors
+    return (op, product_id, quantity), None
+
+
+def parse_operations(operations):
+    """Validate a batch (one query for all the products), returns (parsed operations, errors per entry)."""
+    ids = {parse_int(operation.get('product_id')) for operation in operations if isinstance(operation, dict)}
+    existing = set(Product.objects.filter(id__in=ids - {None}).values_list('id', flat=True))
+
+    parsed, errors = [], []
+    for index, operation in enumerate(operations):
+        result, operation_errors = parse_operation(operation, existing)
+        if operation_errors:
+            errors.append({'index': index, 'errors': operation_errors})
+        else:
+            parsed.append(result)
+    return parsed, errors
+
+
+def apply_cart_operations(cart_id, operations):
+    """Apply a list of {"op": "add" | "update" | "remove", "product_id": .., "quantity": ..} in order.
+
+    Every entry is validated first; if any is invalid nothing is written and
+    the errors are returned per entry. Otherwise the operations run in one
+    transaction. Returns ({product id: quantity added}, errors).
+    """
+    parsed, errors = parse_operations(operations)
+    if errors:
+        return {}, errors
+
+    added = {}
+    with transaction.atomic():
+        for op, product_id, quantity in parsed:
+            if op == 'add':
+                add_cart_item(cart_id, product_id, quantity)
+                added[product_id] = added.get(product_id, 0) + quantity
+            elif op == 'update':
+                set_cart_item_quantity(cart_id, product_id, quantity)
+            else:
+                remove_cart_item(cart_id, product_id)
+    return added, []
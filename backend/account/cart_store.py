@@ -0,0 +1,392 @@
+import time
+import heapq
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from product.models import Product
+from .cart import (
+    add_cart_item, apply_cart_operations, empty_cart, parse_operations, remove_cart_item, set_cart_item_quantity,
+)
+from .models import Cart, CartItem
+from .serializers import CartSerializer, cart_product
+
+logger = logging.getLogger(__name__)
+
+# Where the cart endpoints keep the carts, chosen by CART_STORE:
+#
+#   'db'    (default) every call reads / writes the Cart and CartItem tables.
+#   'cache' the cart of a user is one cache entry (CART_CACHE_ALIAS):
+#
+#               cart:<user id> = {'cart_id': .., 'lines': [[product id, quantity, CartItem id], ..],
+#                                 'version': n, 'flushed': n}
+#
+#           Reads are answered from it (plus one query for the products'
+#           current name / price), writes change it under a short per-cart
+#           lock and are written to CartItem rows later (write-behind): the
+#           flusher thread of the process (one per process) writes the cart
+#           CART_FLUSH_DELAY seconds after its first unsaved change, so a
+#           burst of changes costs one flush. Checkout writes the cart,
+#           empties it and drops the entry, under the cart lock.
+#
+# Durability of the 'cache' store:
+#
+#   - a change is acknowledged once it is in the cache; it reaches the
+#     database within CART_FLUSH_DELAY seconds, or at checkout;
+#   - changes not flushed yet are lost if the cache loses the entry (restart
+#     of a non-persistent backend, eviction under memory pressure) - use a
+#     persistent shared backend (e.g. redis with AOF) and size it so carts
+#     are not evicted;
+#   - carts with unsaved changes are listed in DIRTY_SHARDS sets in the cache
+#     (by user id, each set with its own lock). If the process dies before
+#     flushing a cart, it stays listed and `manage.py flush_carts` (run it
+#     periodically / on deploy) sweeps the sets and writes it; a failed flush
+#     is retried after CART_FLUSH_DELAY;
+#   - the cache entry is the source of truth while it exists: changes made
+#     to CartItem rows some other way (admin) are overwritten by the next flush.
+#
+# Locks use cache.add(), which is atomic on the local-memory, memcached and
+# redis backends. The local-memory backend is per process and is only a
+# stand-in for tests and single-process development.
+
+CART_KEY = 'cart:{}'
+LOCK_KEY = 'cart:lock:{}'
+DIRTY_KEY = 'cart:dirty:{}'
+DIRTY_SHARDS = 64
+# a lock is given up after this long (seconds), in case its holder died
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+
+
+class CartBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The cart is being updated, try again."
+
+
+def get_cache():
+    return caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+
+
+def get_flush_delay():
+    return getattr(settings, 'CART_FLUSH_DELAY', 5)
+
+
+def get_timeout():
+    return getattr(settings, 'CART_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+@contextmanager
+def locked(name):
+    cache, key, token = get_cache(), LOCK_KEY.format(name), uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_WAIT
+    while not cache.add(key, token, timeout=LOCK_TIMEOUT):
+        if time.monotonic() > deadline:
+            raise CartBusy()
+        time.sleep(0.002)
+    try:
+        yield
+    finally:
+        if cache.get(key) == token:
+            cache.delete(key)
+
+
+def cart_total(total):
+    return serializers.DecimalField(max_digits=8, decimal_places=2).to_representation(total)
+
+
+class DatabaseCartStore:
+    """The Cart / CartItem tables, see account/cart.py."""
+
+    def cart(self, user):
+        return Cart.objects.get_or_create(user=user)[0]
+
+    def get(self, user):
+        return CartSerializer(self.cart(user)).data
+
+    def add(self, user, product_id, quantity):
+        cart = self.cart(user)
+        add_cart_item(cart.id, product_id, quantity)
+        return CartSerializer(cart).data
+
+    def update(self, user, product_id, quantity):
+        cart = self.cart(user)
+        set_cart_item_quantity(cart.id, product_id, quantity)
+        return CartSerializer(cart).data
+
+    def remove(self, user, product_id):
+        cart = self.cart(user)
+        remove_cart_item(cart.id, product_id)
+        return CartSerializer(cart).data
+
+    def apply(self, user, operations):
+        """Return (cart data, {product id: quantity added}, errors), see apply_cart_operations()."""
+        cart = self.cart(user)
+        added, errors = apply_cart_operations(cart.id, operations)
+        if errors:
+            return None, {}, errors
+        return CartSerializer(cart).data, added, []
+
+    @contextmanager
+    def checkout(self, user):
+        """Empty the cart for an order, yields {product id: quantity} of what was in it.
+
+        Create the order in the with block: it shares the transaction, so the
+        cart is only emptied if the order is saved.
+        """
+        with transaction.atomic():
+            yield empty_cart(user.id)
+
+    def flush(self, user_id):
+        return False
+
+
+class CacheCartStore:
+    """Carts in the cache, written to the database behind the requests."""
+
+    # building and storing the entries
+
+    def load(self, user_id):
+        cart = Cart.objects.get_or_create(user_id=user_id)[0]
+        lines = list(CartItem.objects.filter(cart=cart).order_by('id').values_list('product_id', 'quantity', 'id'))
+        return {'cart_id': cart.id, 'lines': [list(line) for line in lines], 'version': 0, 'flushed': 0}
+
+    def entry(self, user_id):
+        entry = get_cache().get(CART_KEY.format(user_id))
+        if entry is None:
+            entry = self.load(user_id)
+            # another request may have loaded (and changed) it meanwhile
+            if not get_cache().add(CART_KEY.format(user_id), entry, timeout=get_timeout()):
+                entry = get_cache().get(CART_KEY.format(user_id), entry)
+        return entry
+
+    def change(self, user_id, apply):
+        """Run apply(lines) on the cart of the user under its lock and schedule the flush."""
+        with locked(user_id):
+            entry = self.entry(user_id)
+            was_clean = entry['version'] == entry['flushed']
+            apply(entry['lines'])
+            entry['version'] += 1
+            if was_clean:
+                mark_dirty(user_id)
+            get_cache().set(CART_KEY.format(user_id), entry, timeout=get_timeout())
+        if was_clean:
+            schedule_flush(user_id)
+        return entry
+
+    def render(self, user_id, entry):
+        # same output as CartSerializer, with the products' current name / price
+        products = Product.objects.only('id', 'name', 'price', 'image').in_bulk([line[0] for line in entry['lines']])
+        items, total = [], Decimal(0)
+        for product_id, quantity, item_id in entry['lines']:
+            product = products.get(product_id)
+            if product is None:
+                continue
+            line_total = product.price * quantity
+            total += line_total
+            items.append({'id': item_id, 'product': cart_product(product), 'quantity': quantity, 'total_price': line_total})
+        return {'id': entry['cart_id'], 'user': user_id, 'items': items, 'total_price': cart_total(total)}
+
+    # the cart API
+
+    def get(self, user):
+        return self.render(user.id, self.entry(user.id))
+
+    def add(self, user, product_id, quantity):
+        return self.render(user.id, self.change(user.id, lambda lines: add_line(lines, product_id, quantity)))
+
+    def update(self, user, product_id, quantity):
+        return self.render(user.id, self.change(user.id, lambda lines: update_line(lines, product_id, quantity)))
+
+    def remove(self, user, product_id):
+        return self.render(user.id, self.change(user.id, lambda lines: remove_line(lines, product_id)))
+
+    def apply(self, user, operations):
+        parsed, errors = parse_operations(operations)
+        if errors:
+            return None, {}, errors
+
+        added = {}
+
+        def apply(lines):
+            for op, product_id, quantity in parsed:
+                if op == 'add':
+                    add_line(lines, product_id, quantity)
+                    added[product_id] = added.get(product_id, 0) + quantity
+                elif op == 'update':
+                    update_line(lines, product_id, quantity)
+                else:
+                    remove_line(lines, product_id)
+
+        return self.render(user.id, self.change(user.id, apply)), added, []
+
+    @contextmanager
+    def checkout(self, user):
+        """See DatabaseCartStore.checkout()."""
+        # the lock is held until the order is committed, so no change can be
+        # applied to the entry between emptying the rows and dropping it
+        with locked(user.id):
+            with transaction.atomic():
+                entry = get_cache().get(CART_KEY.format(user.id))
+                if entry is not None and entry['version'] != entry['flushed']:
+                    write_lines(entry)
+                yield empty_cart(user.id)
+            # loaded again from the (now empty) rows on next use
+            get_cache().delete(CART_KEY.format(user.id))
+            mark_clean(user.id)
+
+    # write-behind
+
+    def flush(self, user_id):
+        """Write the cart of the user to CartItem rows if it has unsaved changes."""
+        with locked(user_id):
+            entry = get_cache().get(CART_KEY.format(user_id))
+            if entry is not None and entry['version'] != entry['flushed']:
+                write_lines(entry)
+                entry['flushed'] = entry['version']
+                get_cache().set(CART_KEY.format(user_id), entry, timeout=get_timeout())
+                flushed = True
+            else:
+                flushed = False
+            mark_clean(user_id)
+        return flushed
+
+
+def add_line(lines, product_id, quantity):
+    for line in lines:
+        if line[0] == product_id:
+            line[1] += quantity
+            return
+    lines.append([product_id, quantity, None])
+
+
+def update_line(lines, product_id, quantity):
+    for line in lines:
+        if line[0] == product_id:
+            line[1] = quantity
+
+
+def remove_line(lines, product_id):
+    lines[:] = [line for line in lines if line[0] != product_id]
+
+
+def write_lines(entry):
+    """Make the CartItem rows of the cart match entry['lines'] (and record the new row ids)."""
+    cart_id = entry['cart_id']
+    with transaction.atomic():
+        # products deleted since they were added are dropped, like their rows were
+        existing_products = set(Product.objects.filter(id__in=[line[0] for line in entry['lines']]).values_list('id', flat=True))
+        entry['lines'] = [line for line in entry['lines'] if line[0] in existing_products]
+        CartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=existing_products).delete()
+
+        rows = {item.product_id: item for item in CartItem.objects.filter(cart_id=cart_id)}
+        to_update, to_create = [], []
+        for line in entry['lines']:
+            product_id, quantity, _ = line
+            item = rows.get(product_id)
+            if item is None:
+                to_create.append((line, CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)))
+            else:
+                line[2] = item.id
+                if item.quantity != quantity:
+                    item.quantity = quantity
+                    to_update.append(item)
+        CartItem.objects.bulk_update(to_update, ['quantity'])
+        CartItem.objects.bulk_create([item for _, item in to_create])
+        for line, item in to_create:
+            line[2] = item.id
+
+
+def mark_dirty(user_id):
+    shard = user_id % DIRTY_SHARDS
+    with locked(f'dirty:{shard}'):
+        dirty = get_cache().get(DIRTY_KEY.format(shard), set())
+        dirty.add(user_id)
+        get_cache().set(DIRTY_KEY.format(shard), dirty, timeout=None)
+
+
+def mark_clean(user_id):
+    shard = user_id % DIRTY_SHARDS
+    with locked(f'dirty:{shard}'):
+        dirty = get_cache().get(DIRTY_KEY.format(shard), set())
+        if user_id in dirty:
+            dirty.discard(user_id)
+            get_cache().set(DIRTY_KEY.format(shard), dirty, timeout=None)
+
+
+def get_dirty_user_ids():
+    shards = get_cache().get_many([DIRTY_KEY.format(shard) for shard in range(DIRTY_SHARDS)])
+    return sorted(user_id for dirty in shards.values() for user_id in dirty)
+
+
+class CartFlusher:
+    """A thread flushing carts once their delay has passed, one per process."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # (due at, user id), time.monotonic()
+        self.due = []
+        self.thread = None
+
+    def schedule(self, user_id, delay):
+        with self.condition:
+            heapq.heappush(self.due, (time.monotonic() + delay, user_id))
+            # started on first use, and again in a forked child (threads don't survive fork)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='cart-flusher', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def take_due(self):
+        # blocks until at least one cart is due, returns all the due ones
+        with self.condition:
+            while not self.due or self.due[0][0] > time.monotonic():
+                self.condition.wait(self.due[0][0] - time.monotonic() if self.due else None)
+            user_ids = []
+            while self.due and self.due[0][0] <= time.monotonic():
+                user_ids.append(heapq.heappop(self.due)[1])
+            return user_ids
+
+    def run(self):
+        while True:
+            flush_in_thread(self.take_due())
+
+
+_flusher = CartFlusher()
+
+
+def schedule_flush(user_id):
+    if not getattr(settings, 'CART_FLUSH_ASYNC', True):
+        return
+    _flusher.schedule(user_id, get_flush_delay())
+
+
+def flush_in_thread(user_ids):
+    store = CacheCartStore()
+    try:
+        for user_id in dict.fromkeys(user_ids):
+            try:
+                store.flush(user_id)
+            except Exception:
+                logger.exception("Flushing the cart of user %s failed, retrying in %ss", user_id, get_flush_delay())
+                schedule_flush(user_id)
+    finally:
+        connections.close_all()
+
+
+def flush_dirty_carts():
+    """Flush every cart with unsaved changes, returns how many were written."""
+    store = CacheCartStore()
+    return sum(store.flush(user_id) for user_id in get_dirty_user_ids())
+
+
+STORES = {'db': DatabaseCartStore, 'cache': CacheCartStore}
+
+
+def get_cart_store():
+    return STORES[getattr(settings, 'CART_STORE', 'db')]()
@@ -0,0 +1,82 @@
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from account import views
+from account.cart_store import CART_KEY, flush_dirty_carts, get_cache
+from product.models import Product
+
+
+class QueryCounter:
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def workload(user, product_ids):
+    # what a shopper does: look at the cart, add a few things, change a quantity, drop one
+    yield views.get_cart, 'get', {}
+    for product_id in product_ids:
+        yield views.add_to_cart, 'post', {"product_id": product_id, "quantity": 1}
+    yield views.update_cart_item, 'post', {"product_id": product_ids[0], "quantity": 3}
+    yield views.remove_from_cart, 'post', {"product_id": product_ids[-1]}
+    for _ in range(4):
+        yield views.get_cart, 'get', {}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the cart endpoints on the database and the cache cart store "
+        "(the fixture is created inside a transaction that is rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--items', type=int, default=5, help="products added per cart")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f'Cart benchmark {i}', description='', price=10 + i) for i in range(options['items'])
+            ])
+            product_ids = [product.id for product in products]
+
+            results = {}
+            for store in ['db', 'cache']:
+                users = User.objects.bulk_create([
+                    User(username=f'cart-benchmark-{store}-{i}') for i in range(options['users'])
+                ])
+                requests, queries = 0, QueryCounter()
+                with override_settings(CART_STORE=store, CART_FLUSH_ASYNC=False), connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    for user in users:
+                        for view, method, data in workload(user, product_ids):
+                            request = getattr(factory, method)('/', data, format='json')
+                            force_authenticate(request, user=user)
+                            view(request)
+                            requests += 1
+                    seconds = time.perf_counter() - started
+                    served = queries.count
+                    flush_started = time.perf_counter()
+                    flushed = flush_dirty_carts()
+                    flush_seconds = time.perf_counter() - flush_started
+                results[store] = (requests, seconds, served, flushed, flush_seconds)
+                # the users are rolled back, their ids will be used again
+                get_cache().delete_many([CART_KEY.format(user.id) for user in users])
+
+            transaction.set_rollback(True)
+
+        for store, (requests, seconds, served, flushed, flush_seconds) in results.items():
+            self.stdout.write(
+                f"{store:<6} {requests / seconds:8.0f} requests/s {served / requests:5.2f} queries/request"
+                + (f", then {flushed} carts flushed in {flush_seconds:.2f}s" if flushed else "")
+            )
+        speedup = (results['db'][1] / results['db'][0]) / (results['cache'][1] / results['cache'][0])
+        self.stdout.write(self.style.SUCCESS(f"cache store {speedup:.1f}x the database store"))
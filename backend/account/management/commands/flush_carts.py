@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from account.cart_store import flush_dirty_carts
+
+
+class Command(BaseCommand):
+    help = "Write every cart of the cache cart store with unsaved changes to the database (CART_STORE = 'cache')."
+
+    def handle(self, *args, **options):
+        flushed = flush_dirty_carts()
+        self.stdout.write(self.style.SUCCESS(f"{flushed} carts flushed"))
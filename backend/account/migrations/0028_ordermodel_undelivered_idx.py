@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0027_alter_stripemodel_card_number_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordermodel',
+            index=models.Index(condition=models.Q(('is_delivered', False)), fields=['paid_at', 'id'], name='order_undelivered_idx'),
+        ),
+    ]
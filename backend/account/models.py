@@ -1,4 +1,6 @@
+from decimal import Decimal
 from django.db import models
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum, Window
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
 from django.utils import timezone 
@@ -50,7 +52,22 @@ class Cart(models.Model):
 
     @property
     def total_price(self):
-        return sum(item.total_price for item in self.cartitem_set.all())
+        total = self.cartitem_set.aggregate(total=Sum(CartItemQuerySet.line_total()))['total']
+        return (total or Decimal(0)).quantize(Decimal('0.01'))
+
+
+class CartItemQuerySet(models.QuerySet):
+
+    @staticmethod
+    def line_total():
+        return ExpressionWrapper(F('product__price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    def with_totals(self):
+        """Load the items with their product, line_total and the cart_total of their cart in one query."""
+        return self.select_related('product').annotate(
+            line_total=self.line_total(),
+            cart_total=Window(Sum(self.line_total()), partition_by=F('cart_id')),
+        ).order_by('id')
 
 
 class CartItem(models.Model):
@@ -58,6 +75,14 @@ class CartItem(models.Model):
     product = models.ForeignKey('product.Product', on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # lets concurrent adds of the same product upsert one line (see account/cart.py)
+            models.UniqueConstraint(fields=['cart', 'product'], name='one_cart_item_per_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -77,3 +102,9 @@ class OrderModel(models.Model):
     is_delivered = models.BooleanField(default=False)
     delivered_at = models.CharField(max_length=200, null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # delivery queue of the staff order list (?is_delivered=false), oldest payment first
+            models.Index(fields=['paid_at', 'id'], condition=models.Q(is_delivered=False), name='order_undelivered_idx'),
+        ]
@@ -3,6 +3,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework_simplejwt.tokens import RefreshToken
 from product.models import Product
+from product.fieldsets import SparseFieldsetMixin
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,7 +39,7 @@ class CardsListSerializer(serializers.ModelSerializer):
 
 
 # billing address details
-class BillingAddressSerializer(serializers.ModelSerializer):
+class BillingAddressSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = BillingAddress
@@ -46,34 +47,47 @@ class BillingAddressSerializer(serializers.ModelSerializer):
 
 
 # all orders list
-class AllOrdersListSerializer(serializers.ModelSerializer):
+class AllOrdersListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = OrderModel
         fields = "__all__"
 
 
+def cart_product(product):
+    # the product as shown in a cart line
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'image': product.image.url if product.image else ''
+    }
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     product = serializers.SerializerMethodField()
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
+    # computed by the database, see CartItem.objects.with_totals()
+    total_price = serializers.ReadOnlyField(source='line_total')
 
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'total_price']
 
     def get_product(self, obj):
-        return {
-            'id': obj.product.id,
-            'name': obj.product.name,
-            'price': obj.product.price,
-            'image': obj.product.image.url if obj.product.image else ''
-        }
+        return cart_product(obj.product)
 
 
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(source='cartitem_set', many=True, read_only=True)
-    total_price = serializers.DecimalField(max_digits=8, decimal_places=2, read_only=True)
+    items = CartItemSerializer(source='lines', many=True, read_only=True)
+    total_price = serializers.DecimalField(source='lines_total', max_digits=8, decimal_places=2, read_only=True)
 
     class Meta:
         model = Cart
         fields = ['id', 'user', 'items', 'total_price']
+
+    def to_representation(self, cart):
+        # the items, their products and all the totals come from a single query
+        cart.lines = list(cart.cartitem_set.with_totals())
+        cart.lines_total = cart.lines[0].cart_total if cart.lines else 0
+        return super().to_representation(cart)
@@ -1,14 +1,25 @@
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from account import views
 from django.http import response
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework.test import force_authenticate
 from rest_framework.test import APIRequestFactory
 from django.contrib.auth.models import User
 from rest_framework.test import force_authenticate
-from .models import BillingAddress, OrderModel, StripeModel
+from product.models import Product
+from .cart import add_cart_item
+from .cart_store import DIRTY_SHARDS, CacheCartStore, get_dirty_user_ids
+from .models import BillingAddress, Cart, CartItem, OrderModel, StripeModel
+from product.tests import QueryPlanMixin
 from .views import CardsListView, ChangeOrderStatus, CreateUserAddressView, DeleteUserAddressView, OrdersListView, UpdateUserAddressView, UserAccountDeleteView, UserAccountDetailsView, UserAccountUpdateView, UserAddressDetailsView, UserAddressesListView
 
 
@@ -389,3 +400,337 @@ class AccountApisAuthTest(AccountApisSetUp):
     def test_fetching_of_user_stripe_card_when_logged_out(self):
         response = self.client.get('/account/stripe-cards/')
         self.assertEqual(response.status_code, 401) # Unauthorized
+
+    def test_streaming_all_orders_list_as_staff(self):
+        OrderModel.objects.create(name="admin", ordered_item="desk", total_price="99.99", user=self.admin_user)
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(reverse("all-orders-list"))
+        streamed = self.client.get(reverse("all-orders-list"), {"stream": "true"})
+        self.assertEqual(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        body = b''.join(streamed.streaming_content)
+        self.assertEqual(body, response.content)
+        self.assertEqual(len(json.loads(body)), 2)
+
+    def test_streaming_is_ignored_for_non_staff_users(self):
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.get(reverse("all-orders-list"), {"stream": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(len(response.json()), 1)
+
+    def test_orders_and_addresses_with_sparse_fieldsets(self):
+        self.client.force_authenticate(user=self.normal_user)
+        response = self.client.get(reverse("all-orders-list"), {"fields": "id,total_price"})
+        self.assertEqual(response.json(), [{"id": self.dummy_order.id, "total_price": "5999.99"}])
+
+        response = self.client.get(reverse("all-address-details"), {"exclude": "landmark,house_no"})
+        self.assertNotIn("landmark", response.json()[0])
+        self.assertEqual(response.json()[0]["city"], "new delhi")
+
+        response = self.client.get(reverse("address-details", args=[self.dummy_address.id]), {"fields": "city"})
+        self.assertEqual(response.json(), {"city": "new delhi"})
+
+        response = self.client.get(reverse("all-orders-list"), {"fields": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class AccountQueryPlanTest(QueryPlanMixin, AccountApisSetUp):
+
+    def test_order_and_address_queries_use_indexes(self):
+        self.client.force_authenticate(user=self.normal_user)
+        self.assertIndexed(reverse("all-orders-list"), {}, 'account_ordermodel')
+        self.assertIndexed(reverse("all-address-details"), {}, 'account_billingaddress')
+
+        self.client.force_authenticate(user=self.admin_user)
+        self.assertIndexed(reverse("all-orders-list"), {"is_delivered": "false"}, 'account_ordermodel')
+
+    def test_delivery_queue_is_oldest_payment_first(self):
+        older = OrderModel.objects.create(name="older", paid_at=timezone.now() - timezone.timedelta(days=1), user=self.normal_user)
+        OrderModel.objects.create(name="delivered", paid_at=timezone.now(), is_delivered=True, user=self.normal_user)
+        self.client.force_authenticate(user=self.admin_user)
+
+        response = self.client.get(reverse("all-orders-list"), {"is_delivered": "false"})
+        self.assertEqual([order["id"] for order in response.json()], [older.id, self.dummy_order.id])
+
+
+class CartSerializerTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        from product.models import Product
+        from .models import Cart, CartItem
+
+        self.cart = Cart.objects.create(user=self.normal_user)
+        self.products = [
+            Product.objects.create(name=f'Mug {i}', description='ceramic', price=price)
+            for i, price in enumerate(["19.99", "0.10", "5.00"])
+        ]
+        for product, quantity in zip(self.products[:2], [3, 2]):
+            CartItem.objects.create(cart=self.cart, product=product, quantity=quantity)
+        self.client.force_authenticate(user=self.normal_user)
+
+    def test_cart_is_read_with_one_query_for_any_number_of_items(self):
+        # the cart, then its items with products and totals
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("get-cart"))
+        data = response.json()
+        self.assertEqual([item["total_price"] for item in data["items"]], [59.97, 0.2])
+        self.assertEqual(data["items"][0]["product"]["name"], 'Mug 0')
+        self.assertEqual(data["total_price"], "60.17")
+
+        from .models import CartItem
+        CartItem.objects.create(cart=self.cart, product=self.products[2], quantity=1)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(reverse("get-cart")).json()["total_price"], "65.17")
+
+    def test_totals_after_cart_changes(self):
+        self.assertEqual(str(self.cart.total_price), "60.17")
+        response = self.client.post(reverse("update-cart-item"), {"product_id": self.products[0].id, "quantity": 1})
+        self.assertEqual(response.json()["total_price"], "20.19")
+        response = self.client.post(reverse("remove-from-cart"), {"product_id": self.products[0].id})
+        self.assertEqual(response.json()["total_price"], "0.20")
+        response = self.client.post(reverse("remove-from-cart"), {"product_id": self.products[1].id})
+        self.assertEqual((response.json()["items"], response.json()["total_price"]), ([], "0.00"))
+        self.assertEqual(self.cart.total_price, 0)
+
+
+class BatchCartTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        from product.models import Product
+        from .models import Cart, CartItem
+
+        self.products = [Product.objects.create(name=f'Pen {i}', description='ink', price="2.50") for i in range(3)]
+        cart = Cart.objects.create(user=self.normal_user)
+        for product in self.products[:2]:
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+        self.client.force_authenticate(user=self.normal_user)
+
+    def batch(self, operations):
+        return self.client.post(reverse("batch-cart"), {"operations": operations}, format='json')
+
+    def test_operations_are_applied_in_order(self):
+        from product.models import ProductSignal
+
+        first, second, third = [product.id for product in self.products]
+        response = self.batch([
+            {"op": "add", "product_id": third, "quantity": 2},
+            {"op": "update", "product_id": first, "quantity": 5},
+            {"op": "remove", "product_id": second},
+            {"op": "add", "product_id": third},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item["product"]["id"], item["quantity"]) for item in response.json()["items"]], [(first, 5), (third, 3)]
+        )
+        self.assertEqual(response.json()["total_price"], "20.00")
+        signal = ProductSignal.objects.get(kind=ProductSignal.Kind.CART)
+        self.assertEqual((signal.product_id, signal.quantity), (third, 3))
+
+    def test_an_invalid_operation_changes_nothing(self):
+        response = self.batch([
+            {"op": "remove", "product_id": self.products[0].id},
+            {"op": "add", "product_id": 999999},
+            {"op": "update", "product_id": self.products[1].id, "quantity": 0},
+            {"op": "clear"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [1, 2, 3])
+        self.assertEqual(len(self.client.get(reverse("get-cart")).json()["items"]), 2)
+
+        self.assertEqual(self.batch([]).status_code, 400)
+        self.assertEqual(self.batch([{"op": "remove", "product_id": 1}] * 201).status_code, 400)
+
+
+@override_settings(CART_STORE='cache', CART_FLUSH_ASYNC=False)
+class CacheCartStoreTest(AccountApisSetUp):
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from product.models import Product
+        from .models import Cart, CartItem
+
+        cache.clear()
+        self.products = [Product.objects.create(name=f'Cup {i}', description='tea', price="4.25") for i in range(3)]
+        self.cart = Cart.objects.create(user=self.normal_user)
+        self.saved = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=2)
+        self.client.force_authenticate(user=self.normal_user)
+
+    def test_changes_stay_in_the_cache_until_flushed(self):
+        from .cart_store import flush_dirty_carts
+        from .models import CartItem
+
+        first, second, third = [product.id for product in self.products]
+        self.client.post(reverse("add-to-cart"), {"product_id": second, "quantity": 3})
+        self.client.post(reverse("update-cart-item"), {"product_id": first, "quantity": 5})
+        self.client.post(reverse("batch-cart"), {"operations": [{"op": "add", "product_id": third}]}, format='json')
+        response = self.client.post(reverse("remove-from-cart"), {"product_id": third})
+        self.assertEqual(
+            [(item["id"], item["product"]["id"], item["quantity"]) for item in response.json()["items"]],
+            [(self.saved.id, first, 5), (None, second, 3)],
+        )
+        self.assertEqual(response.json()["total_price"], "34.00")
+        self.assertEqual(list(CartItem.objects.values_list('product_id', 'quantity')), [(first, 2)])
+
+        # reads only ask the database for the products
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse("get-cart")).json(), response.json())
+
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(flush_dirty_carts(), 0)
+        self.assertEqual(
+            sorted(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity')), [(first, 5), (second, 3)]
+        )
+        self.assertEqual(
+            [item["id"] for item in self.client.get(reverse("get-cart")).json()["items"]],
+            list(CartItem.objects.order_by('id').values_list('id', flat=True)),
+        )
+
+    def test_same_response_as_the_database_store(self):
+        operations = [
+            {"op": "add", "product_id": self.products[1].id, "quantity": 2},
+            {"op": "update", "product_id": self.products[0].id, "quantity": 1},
+        ]
+        cached = self.client.post(reverse("batch-cart"), {"operations": operations}, format='json').json()
+        with self.settings(CART_STORE='db'):
+            stored = self.client.post(reverse("batch-cart"), {"operations": operations}, format='json').json()
+        self.assertEqual(cached["total_price"], "12.75")
+        for item in cached["items"] + stored["items"]:
+            item.pop("id")
+        self.assertEqual(cached, stored)
+
+    def test_invalid_quantities_are_rejected(self):
+        first, second = self.products[0].id, self.products[1].id
+        for quantity in [-3, 0, "two", 1.5, True]:
+            response = self.client.post(reverse("add-to-cart"), {"product_id": second, "quantity": quantity}, format='json')
+            self.assertEqual(response.status_code, 400)
+            response = self.client.post(reverse("update-cart-item"), {"product_id": first, "quantity": quantity}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+        # nothing reached the cart
+        self.assertEqual(get_dirty_user_ids(), [])
+        items = self.client.get(reverse("get-cart")).json()["items"]
+        self.assertEqual([(item["product"]["id"], item["quantity"]) for item in items], [(first, 2)])
+        self.assertEqual(self.client.post(reverse("add-to-cart"), {"product_id": second, "quantity": "2"}).status_code, 201)
+
+    def test_flush_drops_deleted_products(self):
+        from .cart_store import CacheCartStore
+        from .models import CartItem
+
+        store = CacheCartStore()
+        store.add(self.normal_user, self.products[1].id, 1)
+        self.products[1].delete()
+        self.assertEqual(len(store.get(self.normal_user)["items"]), 1)
+        self.assertTrue(store.flush(self.normal_user.id))
+        self.assertEqual(list(CartItem.objects.values_list('product_id', flat=True)), [self.products[0].id])
+
+    def test_concurrent_changes_are_serialized(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .cart_store import CacheCartStore, add_line
+
+        store = CacheCartStore()
+        store.entry(self.normal_user.id)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(
+                lambda _: store.change(self.normal_user.id, lambda lines: add_line(lines, self.products[0].id, 1)),
+                range(200),
+            ))
+        self.assertEqual(store.entry(self.normal_user.id)["lines"], [[self.products[0].id, 202, self.saved.id]])
+
+
+class CartConcurrencyTest(TransactionTestCase):
+    """Hundreds of adds racing on a few cart lines must not lose an update."""
+
+    THREADS = 16
+    ADDS = 320
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="racer", password="racer1234")
+        self.cart = Cart.objects.create(user=self.user)
+        self.products = [Product.objects.create(name=f'Sock {i}', description='wool', price=3) for i in range(4)]
+
+    def retry(self, write, immediate=False):
+        if immediate and connection.vendor == 'sqlite':
+            # a request reads before it writes; SQLite fails whoever gets to the write
+            # second, so take the write lock at BEGIN (requests then run one at a time)
+            connection.ensure_connection()
+            connection.transaction_mode = 'IMMEDIATE'
+        try:
+            while True:
+                try:
+                    with transaction.atomic():
+                        return write()
+                except OperationalError:
+                    # SQLite allows one writer at a time and reports "locked" instead of
+                    # waiting; the transaction was rolled back, so retrying is safe
+                    time.sleep(random.uniform(0.001, 0.005))
+        finally:
+            connection.close()
+
+    def add(self, number):
+        return self.retry(lambda: add_cart_item(self.cart.id, self.products[number % len(self.products)].id, 1 + number % 3))
+
+    def post_add(self, number):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        data = {"product_id": self.products[number % len(self.products)].id, "quantity": 1 + number % 3}
+        response = self.retry(lambda: client.post(reverse("add-to-cart"), data, format='json'), immediate=True)
+        self.assertEqual(response.status_code, 201)
+
+    def expected_quantities(self, adds):
+        expected = {product.id: 0 for product in self.products}
+        for number in range(adds):
+            expected[self.products[number % len(self.products)].id] += 1 + number % 3
+        return expected
+
+    def test_parallel_adds_keep_every_quantity(self):
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            list(pool.map(self.add, range(self.ADDS)))
+
+        self.assertEqual(dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity')), self.expected_quantities(self.ADDS))
+
+    def test_parallel_add_to_cart_requests_keep_every_quantity(self):
+        adds = self.ADDS // 4
+        with ThreadPoolExecutor(max_workers=self.THREADS // 2) as pool:
+            list(pool.map(self.post_add, range(adds)))
+
+        self.assertEqual(dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity')), self.expected_quantities(adds))
+
+
+@override_settings(CART_STORE='cache', CART_FLUSH_ASYNC=True, CART_FLUSH_DELAY=0.3)
+class CacheCartWriteBehindTest(TransactionTestCase):
+
+    def test_changes_are_flushed_in_the_background(self):
+        cache.clear()
+        user = User.objects.create_user(username="later", password="later1234")
+        product = Product.objects.create(name='Tray', description='wood', price=12)
+        store = CacheCartStore()
+        for _ in range(3):
+            store.add(user, product.id, 1)
+        self.assertFalse(CartItem.objects.exists())
+
+        deadline = time.monotonic() + 5
+        while not CartItem.objects.filter(quantity=3).exists() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(CartItem.objects.get().quantity, 3)
+
+    def test_one_thread_flushes_every_cart(self):
+        cache.clear()
+        users = User.objects.bulk_create([User(username=f"later{i}") for i in range(DIRTY_SHARDS + 3)])
+        product = Product.objects.create(name='Tray', description='wood', price=12)
+        store = CacheCartStore()
+        for user in users:
+            store.add(user, product.id, 2)
+        self.assertEqual(len(get_dirty_user_ids()), len(users))
+        self.assertEqual([thread.name for thread in threading.enumerate()].count('cart-flusher'), 1)
+
+        # watched in the cache, SQLite fails reads of a table being written
+        deadline = time.monotonic() + 5
+        while get_dirty_user_ids() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(get_dirty_user_ids(), [])
+        self.assertEqual(CartItem.objects.filter(quantity=2).count(), len(users))
@@ -31,4 +31,5 @@ urlpatterns = [
     path('cart/add/', views.add_to_cart, name='add-to-cart'),
     path('cart/remove/', views.remove_from_cart, name='remove-from-cart'),
     path('cart/update/', views.update_cart_item, name='update-cart-item'),
+    path('cart/batch/', views.batch_cart, name='batch-cart'),
 ]
@@ -20,7 +20,13 @@ from .serializers import (
     CartSerializer,
     CartItemSerializer
 )
-from product.models import Product
+from .cart import parse_quantity
+from .cart_store import get_cart_store
+from product.models import Product, ProductSignal
+from product.popularity import record_signal, record_signals
+from product.streaming import wants_streaming, streaming_json_response
+from product.fieldsets import restrict_queryset
+from product.filters import parse_bool
 
 
 # register user
@@ -154,8 +160,9 @@ class UserAddressesListView(APIView):
 
     def get(self, request):
         user = request.user
-        user_address = BillingAddress.objects.filter(user=user)
-        serializer = BillingAddressSerializer(user_address, many=True)
+        context = {'request': request}
+        user_address = restrict_queryset(BillingAddress.objects.filter(user=user), BillingAddressSerializer, context)
+        serializer = BillingAddressSerializer(user_address, many=True, context=context)
         
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -164,8 +171,9 @@ class UserAddressesListView(APIView):
 class UserAddressDetailsView(APIView):
 
     def get(self, request, pk):
-        user_address = BillingAddress.objects.get(id=pk)
-        serializer = BillingAddressSerializer(user_address, many=False)
+        context = {'request': request}
+        user_address = restrict_queryset(BillingAddress.objects.all(), BillingAddressSerializer, context).get(id=pk)
+        serializer = BillingAddressSerializer(user_address, many=False, context=context)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -258,13 +266,25 @@ class OrdersListView(APIView):
 
         user_staff_status = request.user.is_staff
         
+        context = {'request': request}
+
         if user_staff_status:
-            all_users_orders = OrderModel.objects.all()
-            serializer = AllOrdersListSerializer(all_users_orders, many=True)
+            all_users_orders = OrderModel.objects.order_by('id')
+            is_delivered = request.query_params.get('is_delivered')
+            if is_delivered:
+                # e.g. ?is_delivered=false => orders still to deliver, oldest payment first
+                all_users_orders = all_users_orders.filter(
+                    is_delivered=parse_bool('is_delivered', is_delivered)
+                ).order_by('paid_at', 'id')
+            all_users_orders = restrict_queryset(all_users_orders, AllOrdersListSerializer, context)
+            if wants_streaming(request):
+                # every order of every user, sent row by row
+                return streaming_json_response(all_users_orders, AllOrdersListSerializer, context)
+            serializer = AllOrdersListSerializer(all_users_orders, many=True, context=context)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            all_orders = OrderModel.objects.filter(user=request.user)
-            serializer = AllOrdersListSerializer(all_orders, many=True)
+            all_orders = restrict_queryset(OrderModel.objects.filter(user=request.user), AllOrdersListSerializer, context)
+            serializer = AllOrdersListSerializer(all_orders, many=True, context=context)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
 # change order delivered status
@@ -287,52 +307,65 @@ class ChangeOrderStatus(APIView):
 
 
 # Cart APIs
+# kept in the database or, with CART_STORE = 'cache', in the cache (see account/cart_store.py)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
-    serializer = CartSerializer(cart)
-    return Response(serializer.data)
+    return Response(get_cart_store().get(request.user))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def add_to_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
     product_id = request.data.get('product_id')
-    quantity = request.data.get('quantity', 1)
+    quantity = parse_quantity(request.data.get('quantity', 1))
+    if quantity is None:
+        return Response({"detail": "Quantity must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
     product = get_object_or_404(Product, id=product_id)
-    cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-    if not created:
-        cart_item.quantity += int(quantity)
-    else:
-        cart_item.quantity = int(quantity)
-    cart_item.save()
-    serializer = CartSerializer(cart)
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    cart = get_cart_store().add(request.user, product.id, quantity)
+    record_signal(product.id, ProductSignal.Kind.CART, quantity)
+    return Response(cart, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def remove_from_cart(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
     product_id = request.data.get('product_id')
     product = get_object_or_404(Product, id=product_id)
-    cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-    if cart_item:
-        cart_item.delete()
-    serializer = CartSerializer(cart)
-    return Response(serializer.data)
+    return Response(get_cart_store().remove(request.user, product.id))
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def update_cart_item(request):
-    cart, created = Cart.objects.get_or_create(user=request.user)
     product_id = request.data.get('product_id')
+    # without a quantity the cart is returned as it is
     quantity = request.data.get('quantity')
+    if quantity is not None:
+        quantity = parse_quantity(quantity)
+        if quantity is None:
+            return Response({"detail": "Quantity must be a positive integer."}, status=status.HTTP_400_BAD_REQUEST)
     product = get_object_or_404(Product, id=product_id)
-    cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-    if cart_item and quantity:
-        cart_item.quantity = int(quantity)
-        cart_item.save()
-    serializer = CartSerializer(cart)
-    return Response(serializer.data)
+    store = get_cart_store()
+    if quantity is not None:
+        return Response(store.update(request.user, product.id, quantity))
+    return Response(store.get(request.user))
+
+# several add / update / remove operations applied in order, in one transaction,
+# e.g. {"operations": [{"op": "add", "product_id": 3, "quantity": 2}, {"op": "remove", "product_id": 5}]}
+MAX_CART_OPERATIONS = 200
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def batch_cart(request):
+    operations = request.data.get('operations') if isinstance(request.data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        return Response({"detail": "Expected a non-empty list of operations."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(operations) > MAX_CART_OPERATIONS:
+        return Response({"detail": f"At most {MAX_CART_OPERATIONS} operations per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+    cart, added, errors = get_cart_store().apply(request.user, operations)
+    if errors:
+        return Response({"detail": "The cart was not changed.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+    if added:
+        record_signals(added, ProductSignal.Kind.CART, added)
+    return Response(cart)
@@ -0,0 +1,249 @@
+import os
+import time
+import random
+import hashlib
+import logging
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Safe GETs of the catalog, order history and addresses (REPLICA_READ_PATHS)
+# read from one of the DATABASE_REPLICAS; every other request, and anything
+# outside a request (commands, shell, tests), reads from the primary. Writes
+# always go to the primary.
+#
+# A replica is only picked when it has caught up with the writes the request
+# must see:
+#
+#   - the client's own writes (read-your-writes): the time of the last write
+#     of every client, keyed by its Authorization header (else its address),
+#     is remembered for REPLICA_MAX_LAG_SECONDS, and the client sticks to the
+#     primary until a replica is past it;
+#   - writes to REPLICA_SHARED_MODELS by anyone: catalog responses are cached
+#     for everybody (product/cache.py), so a stale read would outlive the lag.
+#     Querysets with the COUNTER_ONLY hint (counters bumped by every shopper,
+#     e.g. wishlist_count) are left out, a count a few seconds old is fine.
+#
+# Replicas further behind than REPLICA_MAX_LAG_SECONDS, or unreachable, are
+# skipped. PostgreSQL replicas report their replay delay; the stand-in SQLite
+# copies made by `manage.py sync_replicas` are as fresh as their file's mtime.
+# Lag readings are kept per process for REPLICA_LAG_CHECK_INTERVAL seconds.
+#
+# The routing decision of every request is counted, see ReplicaStatsView.
+
+PRIMARY = 'default'
+WRITE_KEY = 'replicas:write:{}'
+SHARED_WRITE_KEY = 'replicas:write:shared'
+STATS_KEY = 'replicas:stats:{}'
+# Product.objects.db_manager(hints=COUNTER_ONLY).filter(...).update(count=F('count') + 1)
+COUNTER_ONLY = {'counter_only': True}
+# why a request was not sent to a replica
+PRIMARY_REASONS = ['unsafe', 'not_routed', 'sticky', 'shared_write', 'lagging', 'unavailable']
+
+_route = ContextVar('replica_route', default=None)
+# alias => (checked at, caught up to), both time.time()
+_readings = {}
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+
+
+def get_check_interval():
+    return getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 2)
+
+
+def is_shared_model(model):
+    return model._meta.label_lower in getattr(settings, 'REPLICA_SHARED_MODELS', [])
+
+
+def record(name):
+    key = STATS_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+
+def remember_write(key):
+    cache.set(key, time.time(), timeout=get_max_lag())
+
+
+def measure_caught_up_at(alias):
+    """Return the time up to which the replica has applied the primary's writes."""
+    connection = connections[alias]
+    if connection.vendor == 'sqlite':
+        if connection.is_in_memory_db():
+            # the test mirror is the primary database itself
+            return time.time()
+        return os.path.getmtime(connection.settings_dict['NAME'])
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # an idle replica that has replayed everything it received is not behind
+            cursor.execute(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )
+            lag = cursor.fetchone()[0]
+        return time.time() - float(lag or 0)
+    # no way to tell, trust the replica
+    return time.time()
+
+
+def get_caught_up_at(alias):
+    now = time.time()
+    checked_at, caught_up_at = _readings.get(alias, (None, None))
+    if checked_at is None or now - checked_at >= get_check_interval():
+        try:
+            caught_up_at = measure_caught_up_at(alias)
+        except Exception:
+            logger.warning("Replica %s is unavailable, reading from the primary", alias, exc_info=True)
+            caught_up_at = None
+        else:
+            if now - caught_up_at > get_max_lag():
+                logger.warning("Replica %s is %.1fs behind, reading from the primary", alias, now - caught_up_at)
+        _readings[alias] = (now, caught_up_at)
+    return caught_up_at
+
+
+def choose_replica(fresh_since, shared_write):
+    """Return (alias, None) of a replica that is past `fresh_since`, else (PRIMARY, reason)."""
+    now = time.time()
+    eligible, reasons = [], set()
+    for alias in get_replicas():
+        caught_up_at = get_caught_up_at(alias)
+        if caught_up_at is None:
+            reasons.add('unavailable')
+        elif now - caught_up_at > get_max_lag():
+            reasons.add('lagging')
+        elif caught_up_at < fresh_since:
+            reasons.add('shared_write' if shared_write else 'sticky')
+        else:
+            eligible.append(alias)
+    if eligible:
+        return random.choice(eligible), None
+    return PRIMARY, next(reason for reason in PRIMARY_REASONS if reason in reasons)
+
+
+def get_client_key(request):
+    client = request.META.get('HTTP_AUTHORIZATION') or request.META.get('REMOTE_ADDR', '')
+    return WRITE_KEY.format(hashlib.sha1(client.encode()).hexdigest())
+
+
+class Route:
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.wrote = False
+        self.wrote_shared = False
+
+
+class ReplicaRouter:
+    """Reads of routed requests go to the replica picked by ReplicaMiddleware."""
+
+    def db_for_read(self, model, **hints):
+        route = _route.get()
+        if route is None or route.wrote or connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return route.alias
+
+    def db_for_write(self, model, **hints):
+        route = _route.get()
+        shared = is_shared_model(model) and not hints.get('counter_only')
+        if route is not None:
+            # remembered when the response is sent, i.e. after the commit
+            route.wrote = True
+            route.wrote_shared = route.wrote_shared or shared
+        elif shared and get_replicas():
+            remember_write(SHARED_WRITE_KEY)
+            transaction.on_commit(lambda: remember_write(SHARED_WRITE_KEY), using=PRIMARY)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        client_key = get_client_key(request)
+        route = Route(self.pick(request, client_key))
+        token = _route.set(route)
+        try:
+            response = self.get_response(request)
+        finally:
+            _route.reset(token)
+        if route.wrote:
+            remember_write(client_key)
+        if route.wrote_shared:
+            remember_write(SHARED_WRITE_KEY)
+        return response
+
+    def pick(self, request, client_key):
+        if not get_replicas():
+            return PRIMARY
+        if request.method not in ('GET', 'HEAD'):
+            alias, reason = PRIMARY, 'unsafe'
+        elif not request.path.startswith(tuple(getattr(settings, 'REPLICA_READ_PATHS', []))):
+            alias, reason = PRIMARY, 'not_routed'
+        else:
+            writes = cache.get_many([client_key, SHARED_WRITE_KEY])
+            own, shared = writes.get(client_key, 0), writes.get(SHARED_WRITE_KEY, 0)
+            alias, reason = choose_replica(max(own, shared), shared > own)
+        record(f'replica:{alias}' if reason is None else f'primary:{reason}')
+        return alias
+
+
+def get_replica_stats():
+    names = [f'replica:{alias}' for alias in get_replicas()] + [f'primary:{reason}' for reason in PRIMARY_REASONS]
+    values = cache.get_many([STATS_KEY.format(name) for name in names])
+    counts = {name: values.get(STATS_KEY.format(name), 0) for name in names}
+    now = time.time()
+    replicas = {}
+    for alias in get_replicas():
+        caught_up_at = get_caught_up_at(alias)
+        replicas[alias] = {
+            "reads": counts[f'replica:{alias}'],
+            "lag_seconds": None if caught_up_at is None else round(max(now - caught_up_at, 0), 3),
+        }
+    primary = {reason: counts[f'primary:{reason}'] for reason in PRIMARY_REASONS}
+    total = sum(counts.values())
+    return {
+        "replicas": replicas,
+        "primary": primary,
+        "replica_ratio": round(sum(replica["reads"] for replica in replicas.values()) / total, 4) if total else 0.0,
+    }
+
+
+def reset_replica_stats():
+    names = [f'replica:{alias}' for alias in get_replicas()] + [f'primary:{reason}' for reason in PRIMARY_REASONS]
+    cache.delete_many([STATS_KEY.format(name) for name in names])
+    _readings.clear()
+
+
+# where requests were read from (per replica / reason for the primary) and the replicas' lag
+class ReplicaStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_replica_stats(), status=status.HTTP_200_OK)
@@ -57,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'my_project.replicas.ReplicaMiddleware',                   # read replica routing
 ]
 
 ROOT_URLCONF = 'my_project.urls'
@@ -87,9 +88,71 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # stand-in read replica for local testing: a copy of db.sqlite3 made by
+    # `manage.py sync_replicas`, only read from when listed in DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+# safe GETs of these paths read from a replica (see my_project/replicas.py),
+# e.g. DATABASE_REPLICAS=replica python manage.py runserver
+DATABASE_ROUTERS = ['my_project.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in os.environ.get('DATABASE_REPLICAS', '').split(',') if alias]
+REPLICA_READ_PATHS = [
+    '/api/products/', '/api/product/',
+    '/account/all-orders-list/', '/account/all-address-details/', '/account/address-details/',
+]
+# replicas further behind are skipped; also how long a client sticks to the primary after a write
+REPLICA_MAX_LAG_SECONDS = 10
+REPLICA_LAG_CHECK_INTERVAL = 2
+# writes to these make everyone read from the primary until the replicas catch up
+# (catalog responses are cached for all users, and every request loads its user)
+REPLICA_SHARED_MODELS = ['product.product', 'product.review', 'product.relatedproduct', 'auth.user']
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# local memory is per process, point this at a shared backend (file, memcached,
+# redis) when running more than one worker
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shopnest',
     }
 }
 
+# product list / detail responses are cached per catalog version (see product/cache.py)
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 60 * 60
+# catalog responses carry no per-user data, browsers / CDNs may keep them this long
+CATALOG_HTTP_MAX_AGE = 60
+# product ids that don't exist are remembered this long (seconds)
+PRODUCT_DETAIL_MISS_TIMEOUT = 60
+# build the product list straight from .values() rows (product/lean.py), same output
+CATALOG_LEAN_SERIALIZER = True
+
+# the typeahead index of a worker picks up other workers' catalog changes at most this often (seconds)
+SUGGEST_REBUILD_INTERVAL = 30
+# rebuild it in a background thread, serving the current one meanwhile
+SUGGEST_REBUILD_ASYNC = True
+
+# rows fetched per database round trip by the streaming (?stream=true) list responses
+STREAMING_CHUNK_SIZE = 500
+
+# where carts live: 'db' (Cart / CartItem rows) or 'cache' (write-behind, see account/cart_store.py
+# for the durability trade-offs; needs a shared, persistent cache when running several workers)
+CART_STORE = 'db'
+CART_CACHE_ALIAS = 'default'
+CART_CACHE_TIMEOUT = 60 * 60 * 24
+# seconds between the first unsaved change of a cart and its flush to the database
+CART_FLUSH_DELAY = 5
+CART_FLUSH_ASYNC = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -174,6 +237,21 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static'),] # new
 # user uploaded media or image gets uploaded at this media root (which is static/images folder)
 MEDIA_ROOT = 'static/images'
 
+# product image thumbnails / WebP copies are generated on this many background threads
+IMAGE_VARIANTS_ASYNC = True
+IMAGE_VARIANT_WORKERS = 2
+
+# "frequently bought together" products kept per product (manage.py update_related_products)
+RELATED_PRODUCTS_TOP_K = 10
+
+# is_hot / is_popular are set by manage.py update_popularity (see product/popularity.py)
+POPULARITY_SIGNAL_WEIGHTS = {'wishlist': 1, 'cart': 2, 'purchase': 5}
+POPULARITY_WINDOW_DAYS = 60
+HOT_HALF_LIFE_DAYS = 2
+HOT_PRODUCTS = 20
+POPULAR_HALF_LIFE_DAYS = 14
+POPULAR_PRODUCTS = 50
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -17,12 +17,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from my_project.replicas import ReplicaStatsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('product.urls')),
     path('payments/', include('payments.urls')),
     path('account/', include('account.urls')),
+    path('replica-stats/', ReplicaStatsView.as_view(), name="replica-stats"),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
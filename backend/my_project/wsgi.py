@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'my_project.settings')
 
 application = get_wsgi_application()
+
+# start loading the in-memory typeahead index on the first request (see product/suggest.py)
+from django.core.signals import request_started  # noqa: E402
+from product.suggest import WARM_UID, warm_index  # noqa: E402
+request_started.connect(warm_index, dispatch_uid=WARM_UID)
@@ -1,3 +1,71 @@
-from django.test import TestCase
+from types import SimpleNamespace
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from account.models import Cart, CartItem, OrderModel
+from product.models import Product, ProductSignal
 
-# Create your tests here.
+
+@mock.patch("stripe.PaymentIntent.create", new=mock.Mock(return_value=SimpleNamespace(id="pi_1")))
+@mock.patch("stripe.Customer.list", new=mock.Mock(return_value=SimpleNamespace(data=[SimpleNamespace(id="cus_1")])))
+class ChargeCustomerTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="shopper", password="shopper1234", email="shopper@example.com")
+        self.client.force_authenticate(user=self.user)
+        self.lamp = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+        self.mug = Product.objects.create(name='Coffee Mug', description='Mug', price=9.00)
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.lamp, quantity=2)
+
+    def charge(self, **extra):
+        return self.client.post("/payments/charge-customer/", {
+            "email": self.user.email, "amount": "60", "name": "Shopper", "card_number": "4242424242424242",
+            "address": "1 Main St", "ordered_item": "1 item(s) in cart", "total_price": "60",
+            "is_delivered": False, "delivered_at": "Not Delivered", **extra,
+        }, format='json')
+
+    def purchases(self):
+        return list(ProductSignal.objects.filter(kind=ProductSignal.Kind.PURCHASE).values_list("product_id", "quantity"))
+
+    def test_cart_checkout_records_and_empties_the_cart(self):
+        # product_ids in the body are ignored, the products bought are the ones in the cart
+        response = self.charge(checkout_type="cart", product_ids=[self.mug.id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.purchases(), [(self.lamp.id, 2)])
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertEqual(OrderModel.objects.count(), 1)
+
+        # checking out again doesn't record the same cart twice
+        self.assertEqual(self.charge(checkout_type="cart").status_code, 200)
+        self.assertEqual(self.purchases(), [(self.lamp.id, 2)])
+
+    def test_product_checkout_records_the_product_and_keeps_the_cart(self):
+        response = self.charge(checkout_type="product", product_id=self.mug.id, ordered_item="Coffee Mug")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.purchases(), [(self.mug.id, 1)])
+        self.assertEqual(list(CartItem.objects.filter(cart__user=self.user).values_list("product_id", "quantity")), [(self.lamp.id, 2)])
+
+    def test_product_checkout_needs_an_existing_product(self):
+        self.assertEqual(self.charge(checkout_type="product").status_code, 400)
+        self.assertEqual(self.charge(checkout_type="product", product_id=self.mug.id + 100).status_code, 404)
+        self.assertEqual(OrderModel.objects.count(), 0)
+        self.assertEqual(self.purchases(), [])
+
+    def test_order_failure_keeps_the_cart(self):
+        with mock.patch.object(OrderModel.objects, "create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.charge(checkout_type="cart")
+        self.assertEqual(CartItem.objects.filter(cart__user=self.user).count(), 1)
+        self.assertEqual(self.purchases(), [])
+
+    @override_settings(CART_STORE='cache', CART_FLUSH_ASYNC=False)
+    def test_cart_checkout_with_the_cache_store(self):
+        self.client.post(reverse("add-to-cart"), {"product_id": self.mug.id, "quantity": 3}, format='json')
+        self.assertEqual(self.charge(checkout_type="cart").status_code, 200)
+        self.assertEqual(sorted(self.purchases()), sorted([(self.lamp.id, 2), (self.mug.id, 3)]))
+        self.assertFalse(CartItem.objects.filter(cart__user=self.user).exists())
+        self.assertEqual(self.client.get(reverse("get-cart")).json()["items"], [])
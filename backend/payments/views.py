@@ -5,8 +5,14 @@ from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from account.models import StripeModel, OrderModel
+from account.cart import parse_int
+from account.cart_store import get_cart_store
+from product.models import Product, ProductSignal
+from product.popularity import record_signals
 from rest_framework.decorators import permission_classes
+from contextlib import contextmanager
 from datetime import datetime
+from django.db import transaction
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -158,6 +164,13 @@ class CreateCardTokenView(APIView):
                 )
 
 
+@contextmanager
+def product_checkout(product):
+    # "Buy now": one of the product, the cart is left as it is
+    with transaction.atomic():
+        yield {product.id: 1}
+
+
 # Charge the customer card
 class ChargeCustomerView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -165,6 +178,22 @@ class ChargeCustomerView(APIView):
     def post(self, request):
         try:
             data = request.data
+            # checkout_type "product" buys product_id alone, anything else the cart
+            product = None
+            if data.get("checkout_type") == "product":
+                product_id = parse_int(data.get("product_id"))
+                if product_id is None:
+                    return Response(
+                        {"detail": "A valid product_id is required."},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                product = Product.objects.filter(id=product_id).first()
+                if product is None:
+                    return Response(
+                        {"detail": "Product not found."},
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+
             email = data["email"]
             customer_data = stripe.Customer.list(email=email).data
             if not customer_data:
@@ -185,19 +214,23 @@ class ChargeCustomerView(APIView):
                 description="Software development services",
             )
 
-            # saving order in django database
-            new_order = OrderModel.objects.create(
-                name=data["name"],
-                card_number=data["card_number"][-4:],  # store only last 4 digits
-                address=data["address"],
-                ordered_item=data["ordered_item"],
-                paid_status=True,
-                paid_at=datetime.now(),
-                total_price=data["total_price"],
-                is_delivered=data["is_delivered"],
-                delivered_at=data["delivered_at"],
-                user=request.user,
-            )
+            # the order is saved in the transaction emptying the cart, the
+            # purchased products count towards is_hot / is_popular
+            checkout = product_checkout(product) if product is not None else get_cart_store().checkout(request.user)
+            with checkout as purchased:
+                OrderModel.objects.create(
+                    name=data["name"],
+                    card_number=data["card_number"][-4:],  # store only last 4 digits
+                    address=data["address"],
+                    ordered_item=data["ordered_item"],
+                    paid_status=True,
+                    paid_at=datetime.now(),
+                    total_price=data["total_price"],
+                    is_delivered=data["is_delivered"],
+                    delivered_at=data["delivered_at"],
+                    user=request.user,
+                )
+                record_signals(purchased, ProductSignal.Kind.PURCHASE, purchased)
 
             return Response(
                 data={
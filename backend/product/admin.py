@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product
+from .models import Product, Review
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -8,4 +8,10 @@ class ProductAdmin(admin.ModelAdmin):
     list_filter = ['is_new', 'is_hot', 'is_popular', 'category', 'stock']  # ADDED is_hot and stock
     search_fields = ['name', 'description']
     
-    # REMOVED the in_stock method since we're using stock field directly
\ No newline at end of file
+    # REMOVED the in_stock method since we're using stock field directly
+
+@admin.register(Review)
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ['product', 'user', 'rating', 'created_at']
+    list_filter = ['rating']
+    raw_id_fields = ['product', 'user']
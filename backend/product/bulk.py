@@ -0,0 +1,211 @@
+import csv
+import json
+import time
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .models import Product
+from .serializers import ProductSerializer
+from .cache import catalog_changed
+
+# columns read by the importer and written by the exporter
+EXPORT_FIELDS = [
+    'id', 'name', 'description', 'price', 'image', 'category', 'stock',
+    'is_new', 'is_hot', 'is_popular', 'average_rating', 'rating_count',
+]
+# exported, but ignored on import / batch update: the ratings follow the
+# review aggregate (rating_total), the flags are set by update_popularity
+DERIVED_FIELDS = ['average_rating', 'rating_count', 'is_hot', 'is_popular']
+FORMATS = ['csv', 'jsonl']
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+class ProductImportSerializer(ProductSerializer):
+    # rows reference images already in storage by name instead of uploading them
+    image = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    is_wishlisted = None
+    image_variants = None
+
+    class Meta(ProductSerializer.Meta):
+        fields = [field for field in EXPORT_FIELDS if field != 'id']
+        read_only_fields = DERIVED_FIELDS
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a text stream, one row at a time."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # empty cells mean "use the default", not "empty value"
+            yield reader.line_num, {key: value for key, value in row.items() if key and value != ''}
+    elif fmt == 'jsonl':
+        for line_num, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield line_num, json.loads(line)
+            except ValueError:
+                yield line_num, None
+    else:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}.")
+
+
+def import_products(stream, fmt='csv', batch_size=DEFAULT_BATCH_SIZE):
+    """Create or update products from a CSV / JSON lines stream.
+
+    Rows with an `id` of an existing product update it, other rows create a
+    new product. Rows are validated with ProductSerializer and written with
+    bulk_create / bulk_update, one transaction per batch, so memory use only
+    depends on the batch size. Bulk writes skip the model signals, so the
+    catalog cache is invalidated once at the end (the search index follows
+    through its own triggers).
+    """
+    report = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    started = time.monotonic()
+
+    validators = get_validators()
+    batch = []
+    try:
+        for line_num, row in read_rows(stream, fmt):
+            batch.append((line_num, row))
+            if len(batch) >= batch_size:
+                import_batch(batch, report, validators)
+                batch = []
+        if batch:
+            import_batch(batch, report, validators)
+    except (ValueError, csv.Error) as e:
+        report['errors'].append({'line': None, 'errors': str(e)})
+    finally:
+        if report['created'] or report['updated']:
+            catalog_changed()
+
+    report['seconds'] = round(time.monotonic() - started, 3)
+    rows = report['created'] + report['updated'] + report['failed']
+    report['rows_per_second'] = round(rows / report['seconds']) if report['seconds'] else rows
+    return report
+
+
+def parse_id(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return int(value)
+    return False
+
+
+def get_validators():
+    # the same serializer instances validate every row (building the fields is
+    # the expensive part); updates only need the columns they change
+    return ProductImportSerializer(), ProductImportSerializer(partial=True)
+
+
+def validate_row(row, pk, existing, validators):
+    """Return (validated attrs, None) or (None, errors) for one row."""
+    create_validator, update_validator = validators
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': ["Expected an object."]}
+    try:
+        attrs, errors = (update_validator if pk else create_validator).run_validation(row), None
+    except serializers.ValidationError as e:
+        attrs, errors = None, e.detail
+    if pk is False or (pk and pk not in existing):
+        errors = {**(errors or {}), 'id': [f"Product {row.get('id')} does not exist."]}
+    return (None, errors) if errors else (attrs, None)
+
+
+def apply_changes(product, attrs, now, update_fields):
+    for field, value in attrs.items():
+        setattr(product, field, value)
+    product.updated_at = now
+    update_fields.update(attrs)
+
+
+def import_batch(batch, report, validators=None):
+    # a row that fails doesn't stop the others
+    validators = validators or get_validators()
+    ids = [parse_id(row.get('id')) if isinstance(row, dict) else None for _, row in batch]
+    existing = Product.objects.in_bulk([pk for pk in ids if pk])
+
+    to_create, to_update, update_fields = [], {}, set()
+    now = timezone.now()
+    for (line_num, row), pk in zip(batch, ids):
+        attrs, errors = validate_row(row, pk, existing, validators)
+        if errors:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_num, 'errors': errors})
+        elif pk is None:
+            to_create.append(Product(**attrs))
+        else:
+            apply_changes(existing[pk], attrs, now, update_fields)
+            to_update[pk] = existing[pk]
+
+    with transaction.atomic():
+        if to_create:
+            Product.objects.bulk_create(to_create)
+        if to_update:
+            Product.objects.bulk_update(to_update.values(), sorted(update_fields | {'updated_at'}))
+    report['created'] += len(to_create)
+    report['updated'] += len(to_update)
+
+
+def update_products(updates):
+    """Apply a list of partial updates ({"id": .., <field>: <value>, ..}).
+
+    All rows are validated first; if any of them is invalid nothing is
+    written and the errors are returned per row. Otherwise every change is
+    written with one bulk_update inside a single transaction and the
+    catalog version is bumped once.
+    """
+    validators = get_validators()
+    ids = [parse_id(row.get('id')) if isinstance(row, dict) else False for row in updates]
+    existing = Product.objects.in_bulk([pk for pk in ids if pk])
+
+    to_update, update_fields, errors = {}, set(), []
+    now = timezone.now()
+    for index, (row, pk) in enumerate(zip(updates, ids)):
+        if pk is None:
+            attrs, row_errors = None, {'id': ["This field is required."]}
+        else:
+            attrs, row_errors = validate_row(row, pk, existing, validators)
+        if row_errors:
+            errors.append({'index': index, 'id': row.get('id') if isinstance(row, dict) else None, 'errors': row_errors})
+        else:
+            apply_changes(existing[pk], attrs, now, update_fields)
+            to_update[pk] = existing[pk]
+
+    if errors:
+        return 0, errors
+    if to_update:
+        with transaction.atomic():
+            Product.objects.bulk_update(to_update.values(), sorted(update_fields | {'updated_at'}), batch_size=500)
+        catalog_changed(to_update)
+    return len(to_update), []
+
+
+def export_rows(queryset=None, chunk_size=2000):
+    queryset = Product.objects.all() if queryset is None else queryset
+    for values in queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield dict(zip(EXPORT_FIELDS, values))
+
+
+class Echo:
+    # csv.writer target that hands back the line instead of buffering it
+    def write(self, value):
+        return value
+
+
+def export_products(fmt='csv', queryset=None):
+    """Yield the catalog as CSV / JSON lines text, one line at a time."""
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in export_rows(queryset):
+            yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+    elif fmt == 'jsonl':
+        for row in export_rows(queryset):
+            yield json.dumps(row, default=str) + '\n'
+    else:
+        raise ValueError(f"Unknown format '{fmt}', expected one of {FORMATS}.")
@@ -0,0 +1,260 @@
+import time
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.db import transaction
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+# Catalog responses are cached as rendered JSON bytes under a key that
+# contains the catalog version. Any write to a product bumps the version
+# (see product/signals.py), which makes every older entry unreachable; the
+# stale entries are simply left to expire.
+#
+# Works with any Django cache backend. With the local-memory backend each
+# worker process has its own cache *and* its own version counter, so use a
+# shared backend (file, memcached, redis) when running several workers.
+#
+# Each entry also stores a strong ETag (hash of the body) and a Last-Modified
+# time, so conditional GETs are answered with a 304 straight from the cache.
+#
+# Product details are cached per product instead (product:detail:<generation>:<host>:<pk>)
+# and only the changed products are dropped: callers of catalog_changed()
+# pass the ids they wrote, and writes of unknown scope bump the generation.
+# Ids that don't exist are cached too, for PRODUCT_DETAIL_MISS_TIMEOUT.
+# The body holds absolute image URLs, so entries are per host; the hosts
+# seen are listed under DETAIL_HOSTS_KEY to drop a product for all of them.
+
+VERSION_KEY = 'catalog:version'
+MODIFIED_KEY = 'catalog:modified'
+STATS_KEYS = {'hits': 'catalog:stats:hits', 'misses': 'catalog:stats:misses'}
+DETAIL_GENERATION_KEY = 'product:detail:generation'
+DETAIL_HOSTS_KEY = 'product:detail:hosts'
+DETAIL_STATS_KEYS = {
+    name: f'product:detail:stats:{name}'
+    for name in ['hits', 'negative_hits', 'misses', 'evictions', 'flushes']
+}
+# cached in place of the body of an id that doesn't exist
+MISSING = 'missing'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # start from the clock so a lost version key never reuses an old number
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = get_cache()
+    cache.set(MODIFIED_KEY, int(time.time()), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(VERSION_KEY, version, timeout=None)
+        return version
+
+
+def get_catalog_modified():
+    # time of the last catalog write (including deletes), used as Last-Modified
+    # of list responses; unknown after a cache flush, so assume "now"
+    modified = get_cache().get(MODIFIED_KEY)
+    if modified is None:
+        modified = int(time.time())
+        get_cache().add(MODIFIED_KEY, modified, timeout=None)
+    return modified
+
+
+def catalog_changed(product_ids=None):
+    """Invalidate the cached catalog after a write.
+
+    `product_ids` are the products whose details changed; None means "not
+    known", which drops every cached product detail.
+    """
+    product_ids = None if product_ids is None else list(product_ids)
+    # bump right away so readers stop using the old version, and again on
+    # commit so a read that raced the transaction can't keep stale data cached
+    bump_catalog_version()
+    details_changed(product_ids)
+    transaction.on_commit(lambda: (bump_catalog_version(), details_changed(product_ids, record_stats=False)))
+
+
+def record(stat, keys=STATS_KEYS, amount=1):
+    cache = get_cache()
+    try:
+        cache.incr(keys[stat], amount)
+    except ValueError:
+        cache.add(keys[stat], 0, timeout=None)
+        cache.incr(keys[stat], amount)
+
+
+def get_cache_stats():
+    cache = get_cache()
+    values = cache.get_many(STATS_KEYS.values())
+    stats = {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / total, 4) if total else 0.0
+    stats['version'] = get_catalog_version()
+    return stats
+
+
+def reset_cache_stats():
+    get_cache().delete_many(STATS_KEYS.values())
+
+
+def get_max_age():
+    return getattr(settings, 'CATALOG_HTTP_MAX_AGE', 60)
+
+
+def get_miss_timeout():
+    return getattr(settings, 'PRODUCT_DETAIL_MISS_TIMEOUT', 60)
+
+
+def get_detail_generation():
+    cache = get_cache()
+    generation = cache.get(DETAIL_GENERATION_KEY)
+    if generation is None:
+        cache.add(DETAIL_GENERATION_KEY, time.time_ns(), timeout=None)
+        generation = cache.get(DETAIL_GENERATION_KEY)
+    return generation
+
+
+def detail_cache_key(pk, host, generation=None):
+    host = hashlib.sha1(host.encode('utf-8')).hexdigest()[:12]
+    return f'product:detail:{generation or get_detail_generation()}:{host}:{pk}'
+
+
+def remember_detail_host(host):
+    cache = get_cache()
+    hosts = cache.get(DETAIL_HOSTS_KEY, set())
+    if host not in hosts:
+        cache.set(DETAIL_HOSTS_KEY, hosts | {host}, timeout=None)
+
+
+def details_changed(product_ids, record_stats=True):
+    cache = get_cache()
+    if product_ids is None:
+        try:
+            cache.incr(DETAIL_GENERATION_KEY)
+        except ValueError:
+            cache.set(DETAIL_GENERATION_KEY, time.time_ns(), timeout=None)
+        if record_stats:
+            record('flushes', DETAIL_STATS_KEYS)
+    elif product_ids:
+        generation = get_detail_generation()
+        hosts = cache.get(DETAIL_HOSTS_KEY, set())
+        cache.delete_many([detail_cache_key(pk, host, generation) for host in hosts for pk in product_ids])
+        if record_stats:
+            record('evictions', DETAIL_STATS_KEYS, len(product_ids))
+
+
+def get_detail_cache_stats():
+    values = get_cache().get_many(DETAIL_STATS_KEYS.values())
+    stats = {name: values.get(key, 0) for name, key in DETAIL_STATS_KEYS.items()}
+    lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['hits'] + stats['negative_hits']) / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def reset_detail_cache_stats():
+    get_cache().delete_many(DETAIL_STATS_KEYS.values())
+
+
+def cached_product_detail(request, pk, load):
+    """Serve the detail of product `pk` from the per-product cache.
+
+    `load(request, pk)` returns (data, last modified timestamp) or None when
+    the product doesn't exist; misses are cached for a short time so repeated
+    requests for missing ids don't reach the database. Returns None for a
+    missing product, otherwise the (possibly 304) response.
+    """
+    cache = get_cache()
+    key = detail_cache_key(pk, request.get_host())
+    entry = cache.get(key)
+    if entry == MISSING:
+        record('negative_hits', DETAIL_STATS_KEYS)
+        return None
+    if entry is not None:
+        record('hits', DETAIL_STATS_KEYS)
+        return catalog_response(request, entry)
+
+    record('misses', DETAIL_STATS_KEYS)
+    remember_detail_host(request.get_host())
+    loaded = load(request, pk)
+    if loaded is None:
+        cache.set(key, MISSING, get_miss_timeout())
+        return None
+    entry = build_entry(*loaded)
+    cache.set(key, entry, get_timeout())
+    return catalog_response(request, entry)
+
+
+def response_cache_key(request, name, kwargs):
+    # catalog responses are the same for every user, so the user is not part of the key
+    params = sorted(request.query_params.lists())
+    raw = f'{request.get_host()}|{name}|{sorted(kwargs.items())}|{params}'
+    digest = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    return f'catalog:{get_catalog_version()}:{digest}'
+
+
+def cache_catalog_response(view_method):
+    """Serve a catalog GET from the versioned cache.
+
+    Only 200 responses are cached. Hits and misses both return the same
+    rendered JSON bytes, marked as publicly cacheable since the catalog
+    payload holds no per-user data, and honour If-None-Match /
+    If-Modified-Since. A view can set its own Last-Modified header,
+    otherwise the time of the last catalog write is used.
+    """
+    @wraps(view_method)
+    def wrapper(view, request, *args, **kwargs):
+        cache = get_cache()
+        key = response_cache_key(request, view_method.__qualname__, kwargs)
+        entry = cache.get(key)
+        if entry is not None:
+            record('hits')
+            return catalog_response(request, entry)
+
+        record('misses')
+        response = view_method(view, request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+        last_modified = parse_http_date_safe(response.get('Last-Modified', '')) or get_catalog_modified()
+        entry = build_entry(response.data, last_modified)
+        cache.set(key, entry, get_timeout())
+        return catalog_response(request, entry)
+    return wrapper
+
+
+def build_entry(data, last_modified):
+    body = JSONRenderer().render(data)
+    return {
+        'body': body,
+        'etag': quote_etag(hashlib.md5(body).hexdigest()),
+        'last_modified': last_modified,
+    }
+
+
+def catalog_response(request, entry):
+    response = HttpResponse(entry['body'], content_type='application/json')
+    response['Cache-Control'] = f'public, max-age={get_max_age()}'
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    return get_conditional_response(
+        request, etag=entry['etag'], last_modified=entry['last_modified'], response=response
+    )
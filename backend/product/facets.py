@@ -0,0 +1,50 @@
+from django.db.models import Count, Min, Q
+from django.db.models.functions import Lower
+from .filters import FLAG_FIELDS
+
+# price ranges shown in the filter sidebar, [min, max) with max=None meaning "and above"
+PRICE_BUCKETS = [(0, 25), (25, 50), (50, 100), (100, 250), (250, None)]
+
+
+def price_bucket_condition(low, high):
+    condition = Q(price__gte=low)
+    if high is not None:
+        condition &= Q(price__lt=high)
+    return condition
+
+
+def compute_facets(queryset):
+    """Count the products of `queryset` per category, flag and price bucket.
+
+    Everything comes out of a single GROUP BY query (one row per category
+    holding all the conditional counts); the overall totals are summed up
+    here.
+    """
+    aggregates = {'total': Count('id'), 'label': Min('category')}
+    for flag in FLAG_FIELDS:
+        aggregates[flag] = Count('id', filter=Q(**{flag: True}))
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        aggregates[f'price_{index}'] = Count('id', filter=price_bucket_condition(low, high))
+
+    rows = (
+        queryset.order_by()
+        .values(category_key=Lower('category'))
+        .annotate(**aggregates)
+    )
+
+    facets = {
+        'total': 0,
+        'categories': [],
+        'flags': {flag: 0 for flag in FLAG_FIELDS},
+        'price': [{'min': low, 'max': high, 'count': 0} for low, high in PRICE_BUCKETS],
+    }
+    for row in rows:
+        facets['total'] += row['total']
+        facets['categories'].append({'value': row['label'], 'count': row['total']})
+        for flag in FLAG_FIELDS:
+            facets['flags'][flag] += row[flag]
+        for index, bucket in enumerate(facets['price']):
+            bucket['count'] += row[f'price_{index}']
+
+    facets['categories'].sort(key=lambda item: (-item['count'], item['value'].lower()))
+    return facets
@@ -0,0 +1,89 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+# Sparse fieldsets: ?fields=id,name,price returns only those fields and
+# ?exclude=description drops fields from the full representation. The same
+# selection narrows the SQL through .only(), see restrict_queryset().
+
+
+def parse_field_list(value):
+    if value is None:
+        return None
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def get_fieldset(request):
+    """Return {'fields': [...] or None, 'exclude': [...] or None} from the query."""
+    params = request.query_params if request is not None else {}
+    return {
+        'fields': parse_field_list(params.get('fields')),
+        'exclude': parse_field_list(params.get('exclude')),
+    }
+
+
+def get_catalog_context(request):
+    # the fieldset, plus the request for absolute image URLs
+    return {**get_fieldset(request), 'request': request}
+
+
+class SparseFieldsetMixin:
+    """Serializer mixin honouring `fields` / `exclude` selections.
+
+    The selection comes from the `fields` / `exclude` context keys (see
+    get_fieldset()) or else from the query of the request in the context.
+    `field_sources` lists the model fields read by fields that have no
+    model field of their own (e.g. SerializerMethodFields).
+    """
+    field_sources = {}
+
+    def get_fieldset(self):
+        if 'fields' in self.context or 'exclude' in self.context:
+            return {'fields': self.context.get('fields'), 'exclude': self.context.get('exclude')}
+        return get_fieldset(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_fieldset()
+        requested, excluded = selection['fields'], selection['exclude']
+
+        unknown = [name for name in (requested or []) + (excluded or []) if name not in fields]
+        if unknown:
+            raise ValidationError({"detail": f"Unknown field(s): {', '.join(unknown)}."})
+
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        for name in excluded or []:
+            fields.pop(name, None)
+        return fields
+
+    def get_model_fields(self):
+        """Names of the model columns needed to render the selected fields."""
+        model = self.Meta.model
+        names = {model._meta.pk.name}
+        for name, field in self.fields.items():
+            if name in self.field_sources:
+                names.update(self.field_sources[name])
+                continue
+            source = field.source.split('.')[0]
+            try:
+                model_field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                names.add(model_field.name)
+        return names
+
+
+def restrict_queryset(queryset, serializer_class, context, extra=()):
+    """Load only the columns the (sparse) serializer output needs.
+
+    `extra` names columns read outside the serializer, e.g. the ordering
+    fields a cursor paginator reads from the last row. Also validates the
+    selection, so an unknown field is rejected before any row is fetched.
+    """
+    serializer = serializer_class(context=context)
+    selection = serializer.get_fieldset()
+    if selection['fields'] is None and selection['exclude'] is None:
+        return queryset
+    names = serializer.get_model_fields() | {name.lstrip('-') for name in extra}
+    return queryset.only(*sorted(names))
@@ -0,0 +1,84 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import Value
+from django.db.models.functions import Lower
+from django.db.models.lookups import Exact
+from rest_framework.exceptions import ValidationError
+
+
+# boolean columns that can be used as ?is_new=true style filters
+FLAG_FIELDS = ['is_new', 'is_hot', 'is_popular', 'stock']
+
+# public sort names => model ordering (id is always the tie breaker so the
+# ordering is unique, which keyset pagination needs)
+SORT_OPTIONS = {
+    'newest': ('-id',),
+    'oldest': ('id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'rating': ('-average_rating', '-id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', '-id'),
+}
+DEFAULT_SORT = 'newest'
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+
+def parse_bool(name, value):
+    value = value.strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({"detail": f"Invalid value for '{name}', expected true or false."})
+
+
+def parse_price(name, value):
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise ValidationError({"detail": f"Invalid value for '{name}', expected a number."})
+    if not price.is_finite() or price < 0:
+        raise ValidationError({"detail": f"Invalid value for '{name}', expected a positive number."})
+    return price
+
+
+def get_sort(params):
+    sort = params.get('sort') or DEFAULT_SORT
+    if sort not in SORT_OPTIONS:
+        choices = ", ".join(SORT_OPTIONS)
+        raise ValidationError({"detail": f"Invalid sort '{sort}', choose one of: {choices}."})
+    return sort
+
+
+def filter_products(queryset, params):
+    """Narrow a Product queryset with the catalog query parameters.
+
+    Supported parameters: category, is_new, is_hot, is_popular, stock,
+    min_price and max_price. Filtering happens in SQL so the view only
+    serializes the matching rows.
+    """
+    category = params.get('category')
+    if category:
+        # case-insensitive like iexact, but in a form the LOWER(category) indexes can serve
+        queryset = queryset.filter(Exact(Lower('category'), Lower(Value(category))))
+
+    for flag in FLAG_FIELDS:
+        value = params.get(flag)
+        if value is not None and value != '':
+            queryset = queryset.filter(**{flag: parse_bool(flag, value)})
+
+    min_price = params.get('min_price')
+    if min_price:
+        queryset = queryset.filter(price__gte=parse_price('min_price', min_price))
+
+    max_price = params.get('max_price')
+    if max_price:
+        queryset = queryset.filter(price__lte=parse_price('max_price', max_price))
+
+    return queryset
+
+
+def sort_products(queryset, params):
+    return queryset.order_by(*SORT_OPTIONS[get_sort(params)])
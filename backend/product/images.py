@@ -0,0 +1,143 @@
+import io
+import os
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# resized copies of Product.image, each stored in the original format and as WebP
+# name => bounding box (the aspect ratio is kept)
+VARIANT_SIZES = {
+    'thumbnail': (150, 150),
+    'card': (400, 400),
+    'detail': (1000, 1000),
+}
+VARIANT_DIR = 'images/variants'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants')
+    return _executor
+
+
+def needs_variants(product):
+    source = product.image.name if product.image else ''
+    return (product.image_variants or {}).get('source', '') != source
+
+
+def schedule_variants(product):
+    """Generate the image variants of `product` once the transaction commits.
+
+    Runs on a small thread pool so the request that saved the product never
+    waits for the resizing (IMAGE_VARIANTS_ASYNC = False runs it inline).
+    """
+    product_id, source = product.pk, product.image.name if product.image else ''
+
+    def submit():
+        if getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+            get_executor().submit(run_in_thread, product_id, source)
+        else:
+            generate_variants(product_id, source)
+
+    transaction.on_commit(submit)
+
+
+def run_in_thread(product_id, source):
+    try:
+        generate_variants(product_id, source)
+    except Exception:
+        logger.exception("Generating image variants for product %s failed", product_id)
+    finally:
+        connections.close_all()
+
+
+def render(image, size, fmt):
+    from PIL import Image
+
+    resized = image.copy()
+    resized.thumbnail(size, Image.LANCZOS)
+    if fmt == 'JPEG' and resized.mode not in ('RGB', 'L'):
+        resized = resized.convert('RGB')
+    buffer = io.BytesIO()
+    if fmt == 'WEBP':
+        resized.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    elif fmt == 'JPEG':
+        resized.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        resized.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def store(content, stem, name, ext):
+    # content hashed names never change once written, so they can be cached forever
+    digest = hashlib.sha1(content).hexdigest()[:12]
+    path = f'{VARIANT_DIR}/{stem}-{name}-{digest}.{ext}'
+    if not default_storage.exists(path):
+        path = default_storage.save(path, ContentFile(content))
+    return path
+
+
+def generate_variants(product_id, source):
+    from PIL import Image
+    from .models import Product
+    from .cache import catalog_changed
+
+    variants = {'source': source}
+    if source:
+        with default_storage.open(source, 'rb') as file:
+            image = Image.open(file)
+            image.load()
+
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        has_alpha = image.mode in ('RGBA', 'LA')
+        fmt, ext = ('PNG', 'png') if has_alpha else ('JPEG', 'jpg')
+        stem = os.path.splitext(os.path.basename(source))[0]
+
+        for name, size in VARIANT_SIZES.items():
+            variants[name] = store(render(image, size, fmt), stem, name, ext)
+            variants[f'{name}_webp'] = store(render(image, size, 'WEBP'), stem, name, 'webp')
+
+    # only write the result if the product still points at the same image
+    same_image = Q(image=source) | Q(image__isnull=True) if not source else Q(image=source)
+    updated = Product.objects.filter(same_image, pk=product_id).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        catalog_changed([product_id])
+    return variants
+
+
+def variant_urls(product, request=None):
+    return variant_urls_for(product.image.name if product.image else '', product.image_variants, request)
+
+
+def variant_urls_for(image, variants, request=None):
+    # same as variant_urls(), from the raw column values; absolute like the
+    # image URL itself when there is a request
+    variants = variants or {}
+    if not image or variants.get('source') != image:
+        # not generated yet, clients fall back to the original image
+        return {}
+    urls = {
+        name: default_storage.url(path)
+        for name, path in variants.items()
+        if name != 'source'
+    }
+    if request is not None:
+        urls = {name: request.build_absolute_uri(url) for name, url in urls.items()}
+    return urls
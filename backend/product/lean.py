@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+from .images import variant_urls_for
+from .serializers import PublicProductSerializer
+
+# Read-only fast path for the catalog: rows come from .values() and are turned
+# into dicts by a precomputed list of (name, converter) pairs, skipping the
+# model instances and the per-field get_attribute() of ModelSerializer. The
+# output is the same, byte for byte, as PublicProductSerializer's (which
+# keeps doing the writes and stays the reference, see tests.py).
+
+# fields whose database value already is the JSON value
+PLAIN_FIELDS = (serializers.IntegerField, serializers.CharField, serializers.BooleanField)
+
+
+def lean_serializer_enabled():
+    return getattr(settings, 'CATALOG_LEAN_SERIALIZER', False)
+
+
+class LeanProductSerializer:
+    """Drop-in for PublicProductSerializer on reads, working on .values() rows.
+
+    Honours the same sparse fieldsets (context 'fields' / 'exclude').
+    """
+    serializer_class = PublicProductSerializer
+
+    def __init__(self, context=None):
+        context = context or {}
+        reference = self.serializer_class(context=context)
+        self.request = context.get('request')
+        self.columns = sorted(reference.get_model_fields())
+        self.converters = [(name, self.get_converter(name, field)) for name, field in reference.fields.items()]
+
+    def get_converter(self, name, field):
+        if name == 'image_variants':
+            return lambda row: variant_urls_for(row['image'] or '', row['image_variants'], self.request)
+
+        source = field.source
+        if isinstance(field, serializers.ImageField):
+            convert = self.image_url
+        elif isinstance(field, PLAIN_FIELDS):
+            convert = None
+        else:
+            # decimals, datetimes: DRF's own formatting keeps the output identical
+            convert = field.to_representation
+
+        if convert is None:
+            return lambda row: row[source]
+        return lambda row: None if row[source] is None else convert(row[source])
+
+    def image_url(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        return self.request.build_absolute_uri(url) if self.request is not None else url
+
+    def values(self, queryset, extra=()):
+        # extra columns (e.g. the ordering fields read by a cursor paginator)
+        # are fetched but not serialized
+        return queryset.values(*self.columns, *[name.lstrip('-') for name in extra if name.lstrip('-') not in self.columns])
+
+    def to_representation(self, row):
+        return {name: convert(row) for name, convert in self.converters}
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
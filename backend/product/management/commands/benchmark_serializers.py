@@ -0,0 +1,78 @@
+import time
+from decimal import Decimal
+from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from product.models import Product
+from product.lean import LeanProductSerializer
+from product.serializers import PublicProductSerializer
+
+CATEGORIES = ['clothing', 'electronics', 'furniture', 'books', 'toys']
+
+
+def build_fixture(count):
+    products = []
+    for i in range(count):
+        image = f'images/product-{i}.jpg' if i % 3 else ''
+        products.append(Product(
+            name=f'Benchmark product {i}',
+            price=Decimal(i % 500) + Decimal('0.99'),
+            description='Lorem ipsum dolor sit amet. ' * 8,
+            image=image,
+            image_variants={'source': image, 'card': f'images/variants/product-{i}-card.jpg'} if i % 2 else {},
+            category=CATEGORIES[i % len(CATEGORIES)],
+            is_new=i % 2 == 0,
+            is_hot=i % 5 == 0,
+            average_rating=Decimal(i % 5) + Decimal('0.5'),
+            rating_count=i % 100,
+        ))
+    Product.objects.bulk_create(products, batch_size=2000)
+
+
+def timed(render):
+    started = time.perf_counter()
+    body = render()
+    return time.perf_counter() - started, body
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rows/s of PublicProductSerializer and the lean .values() serializer on the product list "
+        "(the fixture is created inside a transaction that is rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help="fixture size")
+        parser.add_argument('--repeat', type=int, default=3, help="runs per serializer, the best one counts")
+
+    def handle(self, *args, **options):
+        count, repeat = options['products'], max(options['repeat'], 1)
+        renderer = JSONRenderer()
+
+        with transaction.atomic():
+            self.stdout.write(f"creating {count} products...")
+            build_fixture(count)
+            products = Product.objects.order_by('-id')
+            rows = products.count()
+
+            def reference():
+                return renderer.render(PublicProductSerializer(products.all(), many=True).data)
+
+            def lean():
+                serializer = LeanProductSerializer()
+                return renderer.render(serializer.serialize(serializer.values(products.all())))
+
+            results = {}
+            for name, render in [('PublicProductSerializer', reference), ('LeanProductSerializer', lean)]:
+                runs = [timed(render) for _ in range(repeat)]
+                results[name] = (min(seconds for seconds, _ in runs), runs[0][1])
+
+            transaction.set_rollback(True)
+
+        if results['PublicProductSerializer'][1] != results['LeanProductSerializer'][1]:
+            raise CommandError("The lean serializer output differs from PublicProductSerializer.")
+
+        for name, (seconds, body) in results.items():
+            self.stdout.write(f"{name:<24} {seconds:8.3f}s {round(rows / seconds):>10} rows/s ({len(body)} bytes)")
+        speedup = results['PublicProductSerializer'][0] / results['LeanProductSerializer'][0]
+        self.stdout.write(self.style.SUCCESS(f"identical output, {speedup:.1f}x faster"))
@@ -0,0 +1,33 @@
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from product.bulk import FORMATS, export_products
+
+
+class Command(BaseCommand):
+    help = "Stream the whole catalog to a CSV or JSON lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="output file, '-' (default) writes stdout")
+        parser.add_argument('--format', choices=FORMATS, help="defaults to the file extension, csv for stdout")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (os.path.splitext(path)[1].lstrip('.').lower() if path != '-' else 'csv')
+        if fmt not in FORMATS:
+            raise CommandError(f"Can't tell the format of '{path}', use --format ({', '.join(FORMATS)}).")
+
+        started = time.monotonic()
+        rows = -1 if fmt == 'csv' else 0  # don't count the csv header
+        if path == '-':
+            for line in export_products(fmt):
+                self.stdout.write(line, ending='')
+                rows += 1
+        else:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                for line in export_products(fmt):
+                    stream.write(line)
+                    rows += 1
+
+        seconds = time.monotonic() - started
+        self.stderr.write(f"{rows} products exported in {seconds:.3f}s ({round(rows / seconds) if seconds else rows} rows/s)")
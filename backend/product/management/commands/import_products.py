@@ -0,0 +1,33 @@
+import io
+import os
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from product.bulk import FORMATS, DEFAULT_BATCH_SIZE, import_products
+
+
+class Command(BaseCommand):
+    help = "Create / update products from a CSV or JSON lines file (rows with an existing id are updated)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="file to import, '-' reads stdin")
+        parser.add_argument('--format', choices=FORMATS, help="defaults to the file extension")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Can't tell the format of '{path}', use --format ({', '.join(FORMATS)}).")
+
+        if path == '-':
+            report = import_products(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'), fmt, options['batch_size'])
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                report = import_products(stream, fmt, options['batch_size'])
+
+        for error in report['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} created, {report['updated']} updated, {report['failed']} failed "
+            f"in {report['seconds']}s ({report['rows_per_second']} rows/s)"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from product.reviews import reconcile_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute product rating aggregates from the reviews and repair any drift (run periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--include-unreviewed', action='store_true',
+            help="also reset products without reviews to 0 (drops hand entered ratings)",
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_ratings(include_unreviewed=options['include_unreviewed'])
+        self.stdout.write(self.style.SUCCESS(f"{fixed} products corrected"))
@@ -0,0 +1,44 @@
+import os
+import time
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from my_project.replicas import PRIMARY
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the stand-in SQLite read replicas with a copy of the primary database "
+        "(local testing only, run it every few seconds to simulate replication)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="replicas to refresh (default: DATABASE_REPLICAS)")
+
+    def handle(self, *args, **options):
+        primary = connections[PRIMARY].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("only SQLite primaries can be copied, real replicas replicate themselves")
+
+        for alias in options['aliases'] or settings.DATABASE_REPLICAS:
+            if alias not in settings.DATABASES:
+                raise CommandError(f"unknown database {alias}")
+            replica = settings.DATABASES[alias]
+            if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                self.stdout.write(f"{alias}: not a SQLite stand-in, skipped")
+                continue
+
+            # the copy holds the writes committed before `started`, which the
+            # router reads back from the file's mtime as the replica's position
+            started = time.time()
+            copy = f"{replica['NAME']}.tmp"
+            source, target = sqlite3.connect(primary['NAME']), sqlite3.connect(copy)
+            try:
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            os.utime(copy, (started, started))
+            os.replace(copy, replica['NAME'])
+            self.stdout.write(self.style.SUCCESS(f"{alias}: copied in {time.time() - started:.2f}s"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from product.popularity import update_popularity
+
+
+class Command(BaseCommand):
+    help = "Recompute the is_hot / is_popular flags from wishlist, cart and purchase activity (run periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-signals', action='store_true', help="don't delete signals older than the window")
+
+    def handle(self, *args, **options):
+        changed = update_popularity(prune=not options['keep_signals'])
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{flag}: {count} changed" for flag, count in changed.items())))
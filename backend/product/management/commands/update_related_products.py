@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from product.related import DEFAULT_CHUNK_SIZE, update_related_products
+
+
+class Command(BaseCommand):
+    help = "Add the cart items created since the last run to the \"frequently bought together\" lists (run periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="cart items read per query")
+        parser.add_argument('--top-k', type=int, help="neighbours kept per product (default RELATED_PRODUCTS_TOP_K)")
+
+    def handle(self, *args, **options):
+        run = update_related_products(chunk_size=options['chunk_size'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.cart_items} cart items processed, {run.pairs} product pairs updated "
+            f"(up to cart item {run.last_cart_item_id})"
+        ))
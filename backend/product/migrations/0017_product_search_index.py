@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from product.search import ensure_search_index, drop_search_index
+
+
+def create_index(apps, schema_editor):
+    ensure_search_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0016_product_wishlisted_by'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 16:51
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, ExpressionWrapper, IntegerField
+from django.db.models.functions import Round
+
+
+def backfill_rating_total(apps, schema_editor):
+    # keep the hand entered averages: total = average * count
+    Product = apps.get_model('product', 'Product')
+    Product.objects.filter(rating_count__gt=0).update(
+        rating_total=ExpressionWrapper(Round(F('average_rating') * F('rating_count')), output_field=IntegerField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0019_product_image_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_total, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='Review',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('comment', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='product.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-id'], name='review_product_id_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'user'), name='one_review_per_user_and_product')],
+            },
+        ),
+    ]
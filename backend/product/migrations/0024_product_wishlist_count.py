@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_wishlist_count(apps, schema_editor):
+    Product = apps.get_model('product', 'Product')
+    counts = (
+        Product.wishlisted_by.through.objects.filter(product_id=OuterRef('pk'))
+        .order_by().values('product_id').annotate(count=Count('*')).values('count')
+    )
+    Product.objects.update(wishlist_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product', '0023_productsignal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_wishlist_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('wishlist_count__gt', 0)), fields=['-wishlist_count', '-id'], name='product_wishlist_count_idx'),
+        ),
+    ]
@@ -1,19 +1,134 @@
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
+from django.core.validators import MinValueValidator, MaxValueValidator
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def with_wishlisted(self, user):
+        # annotate is_wishlisted with one EXISTS subquery instead of a query per product
+        if user is None or not user.is_authenticated:
+            return self
+        wishlisted = Product.wishlisted_by.through.objects.filter(
+            product_id=models.OuterRef('pk'), user_id=user.id
+        )
+        return self.annotate(is_wishlisted=models.Exists(wishlisted))
+
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     description = models.TextField()
     image = models.ImageField(upload_to='images/', blank=True, null=True)
+    # resized / WebP copies of image, filled in the background (see product/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     stock = models.BooleanField(default=True)
     is_new = models.BooleanField(default=False)
     is_hot = models.BooleanField(default=False)
     is_popular = models.BooleanField(default=False)
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
     rating_count = models.PositiveIntegerField(default=0)
+    # sum of all review ratings, average_rating = rating_total / rating_count
+    rating_total = models.PositiveIntegerField(default=0, editable=False)
     category = models.CharField(max_length=100, default='General')
     wishlisted_by = models.ManyToManyField(User, related_name='wishlist_products', blank=True)
+    # number of wishlisted_by rows, kept in step by product/wishlist.py
+    wishlist_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ?category= (case-insensitive) with the default / price ordering
+            models.Index(Lower('category'), F('id').desc(), name='product_category_id_idx'),
+            models.Index(Lower('category'), 'price', 'id', name='product_category_price_idx'),
+            # ?sort=price / -price / rating over the whole catalog
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['average_rating', 'id'], name='product_rating_idx'),
+            # the flags hold for a small part of the catalog, index just those rows
+            models.Index(fields=['-id'], condition=Q(is_new=True), name='product_new_idx'),
+            models.Index(fields=['-id'], condition=Q(is_hot=True), name='product_hot_idx'),
+            models.Index(fields=['-id'], condition=Q(is_popular=True), name='product_popular_idx'),
+            # "most wishlisted" listing
+            models.Index(fields=['-wishlist_count', '-id'], condition=Q(wishlist_count__gt=0), name='product_wishlist_count_idx'),
+        ]
     
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class Review(models.Model):
+    product = models.ForeignKey(Product, related_name='reviews', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='reviews', on_delete=models.CASCADE)
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'user'], name='one_review_per_user_and_product'),
+        ]
+        indexes = [
+            # newest-first keyset pagination of a product's reviews
+            models.Index(fields=['product', '-id'], name='review_product_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.rating} for {self.product_id} by {self.user_id}"
+
+
+class CoPurchase(models.Model):
+    # how many carts held both products, one row per pair (product_a_id < product_b_id)
+    product_a = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    product_b = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product_a', 'product_b'], name='one_row_per_product_pair'),
+        ]
+        indexes = [
+            # strongest neighbours of a product, from either side of the pair
+            models.Index(fields=['product_a', '-count'], name='copurchase_a_count_idx'),
+            models.Index(fields=['product_b', '-count'], name='copurchase_b_count_idx'),
+        ]
+
+
+class RelatedProduct(models.Model):
+    # precomputed top-K "frequently bought together" list of a product (see product/related.py)
+    product = models.ForeignKey(Product, related_name='related_products', on_delete=models.CASCADE)
+    related = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    score = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            # also the index the /related/ endpoint reads
+            models.UniqueConstraint(fields=['product', 'rank'], name='one_related_product_per_rank'),
+        ]
+
+
+class CoPurchaseRun(models.Model):
+    # one row per run of update_related_products, last_cart_item_id is the high-water mark
+    last_cart_item_id = models.PositiveBigIntegerField(default=0)
+    cart_items = models.PositiveIntegerField(default=0)
+    pairs = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+class ProductSignal(models.Model):
+    # append-only log of shopper activity, folded into is_hot / is_popular
+    # by manage.py update_popularity (see product/popularity.py)
+    class Kind(models.TextChoices):
+        WISHLIST = 'wishlist'
+        CART = 'cart'
+        PURCHASE = 'purchase'
+
+    product = models.ForeignKey(Product, related_name='+', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    quantity = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -0,0 +1,40 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from .filters import SORT_OPTIONS, get_sort
+
+
+class ProductCursorPagination(CursorPagination):
+    """Keyset pagination for the catalog.
+
+    Pages are addressed by an opaque cursor holding the last seen sort value,
+    so fetching page N costs the same as fetching page 1 (no OFFSET scan).
+    The ordering follows the ?sort= parameter accepted by the product list.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        return SORT_OPTIONS[get_sort(request.query_params)]
+
+
+def wants_pagination(request, paginator):
+    # the plain list response is kept for clients that don't ask for pages
+    return (
+        paginator.cursor_query_param in request.query_params
+        or paginator.page_size_query_param in request.query_params
+    )
+
+
+class ProductSearchPagination(PageNumberPagination):
+    # search results are ordered by relevance, which has no stable keyset
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class ReviewCursorPagination(CursorPagination):
+    # newest first, served by the (product, -id) index
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
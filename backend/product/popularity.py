@@ -0,0 +1,103 @@
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Product, ProductSignal
+from .cache import catalog_changed
+
+# is_hot / is_popular are derived from shopper activity instead of being set
+# by hand. Requests only append a ProductSignal row (one INSERT); the
+# update_popularity job sums the signals per product and day, decays every
+# day's total by its age and flags the best scoring products:
+#
+#   score = sum(weight[kind] * quantity * 0.5 ** (age in days / half life))
+#
+# is_hot uses a short half life (what sells now), is_popular a long one.
+
+DEFAULT_WEIGHTS = {
+    ProductSignal.Kind.WISHLIST: 1,
+    ProductSignal.Kind.CART: 2,
+    ProductSignal.Kind.PURCHASE: 5,
+}
+# flag => (half life setting, default, number of products setting, default)
+FLAGS = {
+    'is_hot': ('HOT_HALF_LIFE_DAYS', 2, 'HOT_PRODUCTS', 20),
+    'is_popular': ('POPULAR_HALF_LIFE_DAYS', 14, 'POPULAR_PRODUCTS', 50),
+}
+
+
+def record_signal(product_id, kind, quantity=1):
+    ProductSignal.objects.create(product_id=product_id, kind=kind, quantity=max(int(quantity), 1))
+
+
+def record_signals(product_ids, kind, quantities=None):
+    quantities = quantities or {}
+    ProductSignal.objects.bulk_create([
+        ProductSignal(product_id=pk, kind=kind, quantity=max(int(quantities.get(pk, 1)), 1)) for pk in product_ids
+    ])
+
+
+def get_weights():
+    return getattr(settings, 'POPULARITY_SIGNAL_WEIGHTS', DEFAULT_WEIGHTS)
+
+
+def get_window_days():
+    return getattr(settings, 'POPULARITY_WINDOW_DAYS', 60)
+
+
+def compute_scores(now=None):
+    """Return {flag: {product id: decayed score}} over the signal window."""
+    now = now or timezone.now()
+    today = timezone.localdate(now)
+    weights = get_weights()
+    half_lives = {flag: getattr(settings, name, default) for flag, (name, default, _, _) in FLAGS.items()}
+
+    daily = (
+        ProductSignal.objects.filter(created_at__gte=now - timedelta(days=get_window_days()))
+        .annotate(day=TruncDate('created_at'))
+        .values_list('product_id', 'kind', 'day')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    scores = {flag: defaultdict(float) for flag in FLAGS}
+    for product_id, kind, day, total in daily.iterator():
+        age = (today - day).days
+        for flag, half_life in half_lives.items():
+            scores[flag][product_id] += weights.get(kind, 0) * total * 0.5 ** (age / half_life)
+    return scores
+
+
+def top_products(scores, count):
+    ranked = sorted(((score, -product_id) for product_id, score in scores.items() if score > 0), reverse=True)
+    return {-negated_id for _, negated_id in ranked[:count]}
+
+
+def update_popularity(now=None, prune=True):
+    """Recompute is_hot / is_popular from the signals, writing only the flags that change.
+
+    Signals older than POPULARITY_WINDOW_DAYS no longer count and are deleted
+    when `prune` is set. Returns {flag: number of products changed}.
+    """
+    now = now or timezone.now()
+    scores = compute_scores(now)
+
+    changed, changed_ids = {}, set()
+    with transaction.atomic():
+        for flag, (_, _, count_name, default_count) in FLAGS.items():
+            flagged = top_products(scores[flag], getattr(settings, count_name, default_count))
+            removed = set(Product.objects.filter(**{flag: True}).exclude(id__in=flagged).values_list('id', flat=True))
+            added = set(Product.objects.filter(id__in=flagged, **{flag: False}).values_list('id', flat=True))
+            # bulk updates skip save(), so updated_at is set here
+            Product.objects.filter(id__in=removed).update(**{flag: False, 'updated_at': now})
+            Product.objects.filter(id__in=added).update(**{flag: True, 'updated_at': now})
+            changed[flag] = len(removed) + len(added)
+            changed_ids |= removed | added
+        if prune:
+            ProductSignal.objects.filter(created_at__lt=now - timedelta(days=get_window_days())).delete()
+
+    if changed_ids:
+        catalog_changed(changed_ids)
+    return changed
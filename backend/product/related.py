@@ -0,0 +1,151 @@
+from collections import Counter, defaultdict
+from itertools import chain
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from account.models import CartItem
+from .models import CoPurchase, CoPurchaseRun, RelatedProduct
+from .cache import catalog_changed
+
+# "Frequently bought together" is computed offline from the carts:
+#
+# 1. every cart item added since the last run is paired with the items
+#    that were already in its cart, and the pair counts are added to
+#    CoPurchase (one row per product pair, never rebuilt from scratch);
+# 2. the top-K neighbours of every product whose counts changed are
+#    rewritten into RelatedProduct, which the /related/ endpoint reads
+#    with a single indexed query.
+#
+# Progress is tracked with the highest processed CartItem id, so a run only
+# reads the rows added since the previous one. Orders have no line items
+# (OrderModel.ordered_item is free text), so carts are the only source.
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def get_top_k():
+    return getattr(settings, 'RELATED_PRODUCTS_TOP_K', 10)
+
+
+def get_high_water_mark(finished=False):
+    runs = CoPurchaseRun.objects.filter(finished_at__isnull=False) if finished else CoPurchaseRun.objects.all()
+    return runs.aggregate(last=Max('last_cart_item_id'))['last'] or 0
+
+
+def iter_cart_items(after, until=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield chunks of (id, cart id, product id) of the cart items after `after`."""
+    items = CartItem.objects.order_by('id')
+    if until is not None:
+        items = items.filter(id__lte=until)
+    while True:
+        chunk = list(items.filter(id__gt=after).values_list('id', 'cart_id', 'product_id')[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        after = chunk[-1][0]
+
+
+def count_pairs(items):
+    """Count the new product pairs that the cart items of one chunk create.
+
+    Each item is paired with the items added to its cart before it, so every
+    pair of a cart is counted exactly once, by whichever item came last.
+    """
+    carts = {cart_id for _, cart_id, _ in items}
+    in_cart = defaultdict(set)
+    earlier = CartItem.objects.filter(cart_id__in=carts, id__lt=items[0][0]).values_list('cart_id', 'product_id')
+    for cart_id, product_id in earlier:
+        in_cart[cart_id].add(product_id)
+
+    pairs = Counter()
+    for _, cart_id, product_id in items:
+        for other in in_cart[cart_id]:
+            if other != product_id:
+                pairs[min(product_id, other), max(product_id, other)] += 1
+        in_cart[cart_id].add(product_id)
+    return pairs
+
+
+def add_pair_counts(pairs):
+    existing = CoPurchase.objects.filter(
+        product_a_id__in={a for a, _ in pairs}, product_b_id__in={b for _, b in pairs}
+    )
+    to_update = []
+    for row in existing:
+        count = pairs.get((row.product_a_id, row.product_b_id))
+        if count:
+            row.count += count
+            to_update.append(row)
+    updated = {(row.product_a_id, row.product_b_id) for row in to_update}
+    to_create = [
+        CoPurchase(product_a_id=a, product_b_id=b, count=count)
+        for (a, b), count in pairs.items() if (a, b) not in updated
+    ]
+    CoPurchase.objects.bulk_update(to_update, ['count'], batch_size=1000)
+    CoPurchase.objects.bulk_create(to_create, batch_size=1000)
+
+
+def top_neighbours(product_id, top_k):
+    # the pair may be stored from either side, take the best K of both
+    neighbours = list(
+        CoPurchase.objects.filter(product_a_id=product_id)
+        .order_by('-count', 'product_b_id').values_list('product_b_id', 'count')[:top_k]
+    )
+    neighbours += list(
+        CoPurchase.objects.filter(product_b_id=product_id)
+        .order_by('-count', 'product_a_id').values_list('product_a_id', 'count')[:top_k]
+    )
+    neighbours.sort(key=lambda neighbour: (-neighbour[1], neighbour[0]))
+    return neighbours[:top_k]
+
+
+def refresh_related(product_ids, top_k=None, batch_size=500):
+    """Rewrite the top-K RelatedProduct rows of the given products."""
+    top_k = top_k or get_top_k()
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        rows = [
+            RelatedProduct(product_id=product_id, related_id=related_id, score=count, rank=rank)
+            for product_id in batch
+            for rank, (related_id, count) in enumerate(top_neighbours(product_id, top_k), start=1)
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=batch).delete()
+            RelatedProduct.objects.bulk_create(rows)
+
+
+def update_related_products(chunk_size=DEFAULT_CHUNK_SIZE, top_k=None):
+    """Fold the cart items added since the last run into the recommendations.
+
+    Pair counts are committed chunk by chunk together with the high-water
+    mark, so an interrupted run loses no work; the neighbour lists of the
+    products touched by an unfinished run are refreshed by the next one.
+    Returns the CoPurchaseRun row of this run.
+    """
+    finished_mark, mark = get_high_water_mark(finished=True), get_high_water_mark()
+    run = CoPurchaseRun.objects.create(last_cart_item_id=mark)
+
+    touched = set()
+    # products of a run that stopped before refreshing its neighbour lists
+    for items in iter_cart_items(finished_mark, until=mark, chunk_size=chunk_size):
+        touched.update(chain.from_iterable(count_pairs(items)))
+
+    for items in iter_cart_items(mark, chunk_size=chunk_size):
+        pairs = count_pairs(items)
+        with transaction.atomic():
+            add_pair_counts(pairs)
+            run.last_cart_item_id = items[-1][0]
+            run.cart_items += len(items)
+            run.pairs += len(pairs)
+            run.save(update_fields=['last_cart_item_id', 'cart_items', 'pairs'])
+        touched.update(chain.from_iterable(pairs))
+
+    refresh_related(touched, top_k)
+    run.finished_at = timezone.now()
+    run.save(update_fields=['finished_at'])
+    if touched:
+        # the /related/ responses change, the product details don't
+        catalog_changed(product_ids=[])
+    return run
@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import F, Count, Sum, FloatField, DecimalField, ExpressionWrapper
+from django.db.models.functions import Cast, Now
+from .models import Product, Review
+from .cache import catalog_changed
+
+
+def add_review(product_id, user, rating, comment=''):
+    """Store a review and fold it into the product's rating aggregate.
+
+    The aggregate is updated with a single UPDATE using F() expressions, so
+    the cost does not depend on how many reviews the product already has and
+    concurrent submissions can't overwrite each other's counts.
+    """
+    with transaction.atomic():
+        review = Review.objects.create(product_id=product_id, user=user, rating=rating, comment=comment)
+        Product.objects.filter(pk=product_id).update(
+            rating_count=F('rating_count') + 1,
+            rating_total=F('rating_total') + rating,
+            average_rating=ExpressionWrapper(
+                Cast(F('rating_total') + rating, FloatField()) / (F('rating_count') + 1),
+                output_field=DecimalField(max_digits=3, decimal_places=2),
+            ),
+            updated_at=Now(),
+        )
+    catalog_changed([product_id])
+    return review
+
+
+def reconcile_ratings(include_unreviewed=False, chunk_size=1000):
+    """Recompute the rating aggregates from the reviews and fix any drift.
+
+    Only products that have reviews are checked unless include_unreviewed is
+    set (their counts may still be hand entered). Returns the number of
+    products that were corrected.
+    """
+    products = Product.objects.order_by('id').annotate(
+        review_count=Count('reviews'), review_total=Sum('reviews__rating')
+    )
+    if not include_unreviewed:
+        products = products.filter(review_count__gt=0)
+
+    fixed, last_id = [], 0
+    while True:
+        chunk = list(products.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].id
+
+        to_fix = []
+        for product in chunk:
+            count, total = product.review_count, product.review_total or 0
+            average = round(total / count, 2) if count else 0
+            if (product.rating_count, product.rating_total, float(product.average_rating)) != (count, total, average):
+                product.rating_count, product.rating_total, product.average_rating = count, total, average
+                to_fix.append(product)
+        if to_fix:
+            Product.objects.bulk_update(to_fix, ['rating_count', 'rating_total', 'average_rating'])
+            fixed += [product.id for product in to_fix]
+
+    if fixed:
+        catalog_changed(fixed)
+    return len(fixed)
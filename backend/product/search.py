@@ -0,0 +1,159 @@
+import re
+from django.db import connections
+from django.db.models import Q, Value, FloatField
+
+# full text index over the product catalog
+#   sqlite     => FTS5 external content table kept in sync by triggers
+#   postgresql => GIN index on the tsvector expression below
+# both are created by migration 0017_product_search_index, so rows written by
+# the views, the admin or bulk operations are always searchable.
+FTS_TABLE = 'product_product_fts'
+FTS_TRIGGERS = ['ai', 'ad', 'au']
+POSTGRES_INDEX = 'product_search_vector_idx'
+SEARCH_FIELDS = ['name', 'description', 'category']
+
+# relative weight of a match in each column (name > category > description)
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0)
+POSTGRES_WEIGHTS = {'name': 'A', 'category': 'B', 'description': 'C'}
+POSTGRES_CONFIG = 'english'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# database alias => whether its FTS table exists, looked up once per process
+# (reset when ensure_search_index / drop_search_index change it)
+_fts_available = {}
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query or '')[:10]
+
+
+def sqlite_fts_available(connection):
+    if connection.alias not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[connection.alias] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_available[connection.alias]
+
+
+def fts5_match_expression(tokens):
+    # every term must match, the last one as a prefix so "blu shi" finds "blue shirt"
+    terms = ['"%s"' % token.replace('"', '') for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_products(queryset, query):
+    """Restrict a Product queryset to the rows matching `query`.
+
+    The result is annotated with `search_rank` (higher is better) and ordered
+    by it, so it can be filtered, paginated and serialized like any other
+    catalog queryset.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+
+    # the database the queryset will run on (a replica, see my_project/replicas.py)
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite' and sqlite_fts_available(connection):
+        table = queryset.model._meta.db_table
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        queryset = queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+            params=[fts5_match_expression(tokens)],
+            select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+        )
+        return queryset.order_by('-search_rank', 'id')
+
+    if connection.vendor == 'postgresql':
+        vector = postgres_vector_sql(queryset.model._meta.db_table)
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        queryset = queryset.extra(
+            where=[f'{vector} @@ to_tsquery(%s, %s)'],
+            params=[POSTGRES_CONFIG, tsquery],
+            select={'search_rank': f'ts_rank({vector}, to_tsquery(%s, %s))'},
+            select_params=[POSTGRES_CONFIG, tsquery],
+        )
+        return queryset.order_by('-search_rank', 'id')
+
+    # no full text index on this backend, fall back to a LIKE scan
+    condition = Q()
+    for token in tokens:
+        condition &= Q(name__icontains=token) | Q(description__icontains=token) | Q(category__icontains=token)
+    return queryset.filter(condition).annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    ).order_by('name', 'id')
+
+
+def postgres_vector_sql(table=None):
+    # must stay identical to the expression of the GIN index in the migration
+    # (the index is created with table=None, queries qualify the columns)
+    prefix = f'"{table}".' if table else ''
+    parts = [
+        f"setweight(to_tsvector('{POSTGRES_CONFIG}', coalesce({prefix}\"{field}\", '')), '{weight}')"
+        for field, weight in POSTGRES_WEIGHTS.items()
+    ]
+    return '(' + ' || '.join(parts) + ')'
+
+
+def ensure_search_index(connection):
+    """Create the full text index if it is missing (safe to call repeatedly).
+
+    SQLite drops the sync triggers whenever a migration rebuilds the
+    product_product table, so this also runs after every migrate and
+    re-indexes the catalog when the triggers had to be recreated.
+    """
+    _fts_available.pop(connection.alias, None)
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            if 'product_product' not in connection.introspection.table_names(cursor):
+                return
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # search falls back to LIKE queries
+                return
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'product_product'"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [suffix for suffix in FTS_TRIGGERS if f'{FTS_TABLE}_{suffix}' not in existing]
+            if not missing:
+                return
+
+            columns = ', '.join(SEARCH_FIELDS)
+            new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+            old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+            delete_old = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+            insert_new = f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});"
+            triggers = {
+                'ai': f"AFTER INSERT ON product_product BEGIN {insert_new} END",
+                'ad': f"AFTER DELETE ON product_product BEGIN {delete_old} END",
+                'au': f"AFTER UPDATE ON product_product BEGIN {delete_old} {insert_new} END",
+            }
+
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"{columns}, content='product_product', content_rowid='id', tokenize='porter unicode61')"
+            )
+            for suffix in missing:
+                cursor.execute(f"CREATE TRIGGER {FTS_TABLE}_{suffix} {triggers[suffix]}")
+            # (re)index the rows written while the triggers were missing
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON product_product USING gin ({postgres_vector_sql()})"
+            )
+
+
+def drop_search_index(connection):
+    _fts_available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for suffix in FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
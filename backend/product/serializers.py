@@ -1,8 +1,34 @@
 from rest_framework import serializers
-from .models import Product
+from .models import Product, Review
+from .images import variant_urls
+from .fieldsets import SparseFieldsetMixin
 
-class ProductSerializer(serializers.ModelSerializer):
+# catalog representation shared by every visitor (no per-user fields), so the
+# list / detail / search responses can be cached once for all users
+class PublicProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+    field_sources = {'image_variants': ['image', 'image_variants']}
+
+    class Meta:
+        model = Product
+        # wishlist_count changes with every wishlist toggle, leaving it out
+        # keeps the cached catalog responses valid
+        exclude = ['wishlisted_by', 'wishlist_count']
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
+
+class MostWishlistedProductSerializer(PublicProductSerializer):
+
+    class Meta(PublicProductSerializer.Meta):
+        exclude = ['wishlisted_by']
+
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     is_wishlisted = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    field_sources = {'is_wishlisted': [], 'image_variants': ['image', 'image_variants']}
     
     class Meta:
         model = Product
@@ -11,5 +37,20 @@ class ProductSerializer(serializers.ModelSerializer):
     def get_is_wishlisted(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            # set by Product.objects.with_wishlisted(), saves a query per product
+            if hasattr(obj, 'is_wishlisted'):
+                return obj.is_wishlisted
             return obj.wishlisted_by.filter(id=request.user.id).exists()
-        return False
\ No newline at end of file
+        return False
+
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    user = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = Review
+        fields = ['id', 'product', 'user', 'rating', 'comment', 'created_at']
+        read_only_fields = ['product']
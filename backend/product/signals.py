@@ -0,0 +1,58 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.contrib.auth.models import User
+from .models import Product
+from .cache import catalog_changed
+from .images import needs_variants, schedule_variants
+from .suggest import product_saved, product_deleted
+from .wishlist import refresh_wishlist_counts
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    catalog_changed([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def product_image_changed(sender, instance, **kwargs):
+    if needs_variants(instance):
+        schedule_variants(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_suggestions_saved(sender, instance, **kwargs):
+    product_saved(instance)
+
+
+@receiver(post_delete, sender=Product)
+def product_suggestions_deleted(sender, instance, **kwargs):
+    product_deleted(instance.pk)
+
+
+# wishlist changes made through the related managers (admin forms, .add() /
+# .remove() / .clear()) instead of toggle_wishlist_item()
+@receiver(m2m_changed, sender=Product.wishlisted_by.through)
+def wishlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._wishlist_product_ids = list(instance.wishlist_products.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        refresh_wishlist_counts([instance.pk])
+    elif action == 'post_clear':
+        refresh_wishlist_counts(getattr(instance, '_wishlist_product_ids', []))
+    else:
+        refresh_wishlist_counts(pk_set)
+
+
+# deleting a user removes their wishlist rows without any m2m signal
+@receiver(pre_delete, sender=User)
+def user_wishlist_deleted(sender, instance, **kwargs):
+    instance._wishlist_product_ids = list(instance.wishlist_products.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    if getattr(instance, '_wishlist_product_ids', None):
+        refresh_wishlist_counts(instance._wishlist_product_ids)
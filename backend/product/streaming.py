@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from .filters import parse_bool
+
+
+def get_chunk_size():
+    return getattr(settings, 'STREAMING_CHUNK_SIZE', 500)
+
+
+def wants_streaming(request):
+    value = request.query_params.get('stream')
+    return parse_bool('stream', value) if value is not None else False
+
+
+def stream_json_array(queryset, serializer_class, context=None, chunk_size=None):
+    """Yield `queryset` serialized as a JSON array, one chunk of rows at a time.
+
+    The rows are fetched with .iterator() (prefetch_related still works per
+    chunk), and every row goes through the same serializer instance, so only
+    one chunk is held in memory at a time. The bytes are the same as those
+    of the regular, fully rendered response.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    serializer = serializer_class(context=context or {})
+    render = JSONRenderer().render
+
+    yield b'['
+    separator, buffer = b'', []
+    for index, instance in enumerate(queryset.iterator(chunk_size=chunk_size), start=1):
+        buffer.append(separator + render(serializer.to_representation(instance)))
+        separator = b','
+        if index % chunk_size == 0:
+            yield b''.join(buffer)
+            buffer = []
+    yield b''.join(buffer) + b']'
+
+
+def streaming_json_response(queryset, serializer_class, context=None, chunk_size=None):
+    # the status code is sent before the first row is serialized, so an error
+    # half way through ends in a truncated body rather than a 500
+    return StreamingHttpResponse(
+        stream_json_array(queryset, serializer_class, context, chunk_size),
+        content_type='application/json',
+    )
@@ -0,0 +1,283 @@
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left, insort
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, transaction
+from .cache import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Typeahead suggestions are answered from memory. Every worker process keeps
+# two sorted arrays:
+#
+#   products:   (key, product id) for the name and for every word start in
+#               it, so "shi" finds "Blue Shirt"
+#   categories: (key, category)
+#
+# A prefix matching at most SCAN_LIMIT keys is answered by a bisect and a
+# scan of those keys. Prefixes matching more ("b", "blu", "product 1" ...)
+# would be slow to rank on every keystroke, so their best TOP_K products
+# are computed when the index is built and kept in `top`.
+#
+# Product save / delete signals patch the index of the process that made
+# the change; changes made by other processes or by bulk writes are noticed
+# through the catalog version (see product/cache.py) and trigger a rebuild,
+# at most once every SUGGEST_REBUILD_INTERVAL seconds. The rebuild runs in a
+# background thread (one at a time) while requests keep using the current
+# index, which is swapped for the new one when it is ready.
+
+MAX_WORDS = 8
+# prefixes matching more keys than this are answered from `top`
+SCAN_LIMIT = 200
+# products kept per prefix in `top`, at least ProductSuggestView.max_limit
+TOP_K = 20
+WORD_START = re.compile(r'\w+')
+# sorts after any character of a key, (prefix + LAST_CHAR,) bounds the keys starting with prefix
+LAST_CHAR = '\U0010ffff'
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+def name_keys(name):
+    name = normalize(name)
+    return [name[match.start():] for match in WORD_START.finditer(name)][:MAX_WORDS]
+
+
+def name_prefixes(keys):
+    return {key[:length] for key in keys for length in range(1, len(key) + 1)}
+
+
+def get_rebuild_interval():
+    return getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 30)
+
+
+class SuggestionIndex:
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.products = []
+        self.categories = []
+        self.product_info = {}
+        self.category_counts = {}
+        # prefix => ids of its best TOP_K products, for the prefixes matching more than SCAN_LIMIT keys
+        self.top = {}
+        self.version = None
+        self.built_at = None
+
+    # building
+
+    def load(self, rows, version):
+        """Replace the index with (id, name, category, score) rows."""
+        index = SuggestionIndex()
+        for row in rows:
+            index.add(*row, sort=False)
+        index.products.sort()
+        index.categories.sort()
+        index.index_prefix('', 0, len(index.products))
+        with self.lock:
+            self.products, self.categories, self.top = index.products, index.categories, index.top
+            self.product_info, self.category_counts = index.product_info, index.category_counts
+            self.version, self.built_at = version, time.monotonic()
+
+    def add(self, product_id, name, category, score, sort=True):
+        keys = name_keys(name)
+        self.product_info[product_id] = (name, category, score, keys)
+        for key in keys:
+            (insort if sort else list.append)(self.products, (key, product_id))
+        if sort:
+            for prefix in name_prefixes(keys) & self.top.keys():
+                self.top[prefix] = self.ranked(self.top[prefix] + [product_id], prefix)
+
+        category_key = normalize(category)
+        if not category_key:
+            return
+        label, count = self.category_counts.get(category_key, (category, 0))
+        self.category_counts[category_key] = (label, count + 1)
+        if not count:
+            (insort if sort else list.append)(self.categories, (category_key, label))
+
+    def remove(self, product_id):
+        """Remove a product, returns the prefixes whose `top` it was in (dropped, see refill())."""
+        info = self.product_info.pop(product_id, None)
+        if info is None:
+            return []
+        name, category, score, keys = info
+        for key in keys:
+            position = bisect_left(self.products, (key, product_id))
+            if position < len(self.products) and self.products[position] == (key, product_id):
+                del self.products[position]
+        dropped = [prefix for prefix in name_prefixes(keys) if product_id in self.top.get(prefix, ())]
+        for prefix in dropped:
+            del self.top[prefix]
+
+        category_key = normalize(category)
+        if category_key not in self.category_counts:
+            return dropped
+        label, count = self.category_counts[category_key]
+        if count > 1:
+            self.category_counts[category_key] = (label, count - 1)
+        else:
+            del self.category_counts[category_key]
+            position = bisect_left(self.categories, (category_key, label))
+            if position < len(self.categories) and self.categories[position] == (category_key, label):
+                del self.categories[position]
+        return dropped
+
+    def apply(self, product_id, row, version):
+        # patch one product (row None = deleted) and record the version it leads to
+        with self.lock:
+            if self.version is None:
+                return
+            dropped = self.remove(product_id)
+            if row is not None:
+                self.add(product_id, *row)
+            self.refill(dropped)
+            self.version = version
+
+    # the best products of a prefix
+
+    def rank(self, product_id, prefix):
+        # matches at the start of the name go first, then the best rated
+        name, category, score, keys = self.product_info[product_id]
+        return (not keys[0].startswith(prefix), -score, len(name), name, product_id)
+
+    def ranked(self, product_ids, prefix):
+        return sorted(set(product_ids), key=lambda product_id: self.rank(product_id, prefix))[:TOP_K]
+
+    def prefix_range(self, prefix):
+        return bisect_left(self.products, (prefix,)), bisect_left(self.products, (prefix + LAST_CHAR,))
+
+    def index_prefix(self, prefix, start, end):
+        """Return the best TOP_K ids for `prefix` (matching products[start:end]).
+
+        Prefixes matching more than SCAN_LIMIT keys are stored in `top`,
+        computed from the best products of the one character longer
+        prefixes (stored ones are reused, missing ones computed first).
+        """
+        if prefix in self.top:
+            return self.top[prefix]
+        if end - start <= SCAN_LIMIT:
+            return self.ranked((product_id for _, product_id in self.products[start:end]), prefix)
+        candidates, position = [], start
+        while position < end:
+            key, product_id = self.products[position]
+            if key == prefix:
+                candidates.append(product_id)
+                position += 1
+                continue
+            longer = key[:len(prefix) + 1]
+            longer_end = bisect_left(self.products, (longer + LAST_CHAR,), position, end)
+            candidates += self.index_prefix(longer, position, longer_end)
+            position = longer_end
+        if prefix:
+            self.top[prefix] = self.ranked(candidates, prefix)
+            return self.top[prefix]
+        return []
+
+    def refill(self, prefixes):
+        # longest first, so the shorter ones are computed from the refilled longer ones
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            self.index_prefix(prefix, *self.prefix_range(prefix))
+
+    # lookups
+
+    def scan(self, array, prefix):
+        position = bisect_left(array, (prefix,))
+        while position < len(array) and array[position][0].startswith(prefix):
+            yield array[position]
+            position += 1
+
+    def suggest(self, query, limit):
+        prefix = normalize(query)
+        with self.lock:
+            best = self.index_prefix(prefix, *self.prefix_range(prefix))[:limit]
+            products = [
+                {"id": product_id, "name": self.product_info[product_id][0], "category": self.product_info[product_id][1]}
+                for product_id in best
+            ]
+
+            categories = sorted(
+                (self.category_counts[key] for key, _ in self.scan(self.categories, prefix)),
+                key=lambda category: (-category[1], category[0]),
+            )[:limit]
+        return {
+            "products": products,
+            "categories": [{"name": label, "count": count} for label, count in categories],
+        }
+
+
+_index = SuggestionIndex()
+# held while the index is being built, so a process runs one build at a time
+_building = threading.Lock()
+WARM_UID = 'product.suggest.warm_index'
+
+
+def build_index():
+    from .models import Product
+
+    version = get_catalog_version()
+    rows = Product.objects.values_list('id', 'name', 'category', 'rating_count').iterator(chunk_size=2000)
+    _index.load(((pk, name, category, score) for pk, name, category, score in rows), version)
+    return _index
+
+
+def get_index():
+    """Return the index of this process, building it if there is none yet.
+
+    A stale index is returned as it is and rebuilt in the background.
+    """
+    if _index.version is None:
+        # the first lookup waits for the build (or for the warm_index() one)
+        with _building:
+            if _index.version is None:
+                build_index()
+    elif _index.version != get_catalog_version() and time.monotonic() - _index.built_at >= get_rebuild_interval():
+        rebuild_in_background()
+    return _index
+
+
+def rebuild_in_background():
+    if not _building.acquire(blocking=False):
+        # already being built
+        return
+    if not getattr(settings, 'SUGGEST_REBUILD_ASYNC', True):
+        try:
+            build_index()
+        finally:
+            _building.release()
+        return
+    threading.Thread(target=rebuild_in_thread, name='suggest-rebuild', daemon=True).start()
+
+
+def rebuild_in_thread():
+    try:
+        build_index()
+    except Exception:
+        logger.exception("Rebuilding the suggestion index failed, it will be retried on a later lookup")
+    finally:
+        _building.release()
+        connections.close_all()
+
+
+def warm_index(**kwargs):
+    # connected to request_started by wsgi.py: the first request of a worker
+    # starts the build in the background, so the first keystroke usually
+    # doesn't wait for it and loading the application doesn't query the database
+    request_started.disconnect(dispatch_uid=WARM_UID)
+    if _index.version is None:
+        rebuild_in_background()
+
+
+def product_saved(product):
+    row = (product.name, product.category, product.rating_count)
+    # after the commit (and after the catalog version bump of product/signals.py)
+    transaction.on_commit(lambda: _index.apply(product.pk, row, get_catalog_version()))
+
+
+def product_deleted(product_id):
+    transaction.on_commit(lambda: _index.apply(product_id, None, get_catalog_version()))
@@ -1,7 +1,7 @@
 from account import views
 from django.http import response
-from .models import Product
-from django.test import TestCase, Client
+from .models import Product, ProductSignal, Review, RelatedProduct
+from django.test import TestCase, TransactionTestCase, Client
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework.test import force_authenticate
@@ -9,6 +9,17 @@ from rest_framework.test import APIRequestFactory
 from .views import ProductCreateView, ProductDeleteView, ProductEditView
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from unittest import skipUnless
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
+import io
+import re
+import json
+import tempfile
+import shutil
+import os
 
 
 class ProductApiTest(TestCase):
@@ -202,3 +213,1270 @@ class ProductApisAuthTest(ProductApisSetUp):
         response = view(request, 1)
         self.assertEqual(response.status_code, 403) # Forbidden
 
+
+
+class ProductListFilterTest(TestCase):
+
+    def setUp(self):
+        self.shirt = Product.objects.create(
+            name='Blue Shirt', description='Cotton shirt', price=25.00,
+            category='Clothing', is_new=True
+        )
+        self.skirt = Product.objects.create(
+            name='White Skirt', description='Summer skirt', price=40.00,
+            category='Clothing', is_hot=True
+        )
+        self.mirror = Product.objects.create(
+            name='Wall Mirror', description='Round mirror', price=90.00,
+            category='Decor', stock=False
+        )
+
+    def get_names(self, params):
+        response = self.client.get(reverse("products-list"), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        results = data["results"] if isinstance(data, dict) else data
+        return [item["name"] for item in results]
+
+    def test_filter_by_category_is_case_insensitive(self):
+        self.assertEqual(self.get_names({"category": "clothing", "sort": "name"}), ["Blue Shirt", "White Skirt"])
+
+    def test_filter_by_flags(self):
+        self.assertEqual(self.get_names({"is_new": "true"}), ["Blue Shirt"])
+        self.assertEqual(self.get_names({"stock": "false"}), ["Wall Mirror"])
+
+    def test_filter_by_price_range(self):
+        self.assertEqual(self.get_names({"min_price": "30", "max_price": "100", "sort": "price"}), ["White Skirt", "Wall Mirror"])
+
+    def test_sorting(self):
+        self.assertEqual(self.get_names({"sort": "-price"}), ["Wall Mirror", "White Skirt", "Blue Shirt"])
+        self.assertEqual(self.get_names({}), ["Wall Mirror", "White Skirt", "Blue Shirt"])  # newest first
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse("products-list"), {"sort": "colour"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("products-list"), {"is_new": "maybe"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("products-list"), {"min_price": "cheap"}).status_code, 400)
+
+    def test_cursor_pagination(self):
+        response = self.client.get(reverse("products-list"), {"sort": "price", "page_size": 2})
+        data = response.json()
+        self.assertEqual([item["name"] for item in data["results"]], ["Blue Shirt", "White Skirt"])
+        self.assertIsNone(data["previous"])
+
+        response = self.client.get(data["next"])
+        data = response.json()
+        self.assertEqual([item["name"] for item in data["results"]], ["Wall Mirror"])
+        self.assertIsNone(data["next"])
+
+
+class ProductWishlistQueriesTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="shopper", password="shopper1234")
+        self.products = [
+            Product.objects.create(name=f'Product {i}', description='desc', price=10 + i)
+            for i in range(5)
+        ]
+        self.products[1].wishlisted_by.add(self.user)
+        self.products[3].wishlisted_by.add(self.user)
+        self.client.force_authenticate(user=self.user)
+
+    def test_product_list_is_user_independent(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("products-list"))
+        self.assertEqual(len(response.json()), 5)
+        for item in response.json():
+            self.assertNotIn("is_wishlisted", item)
+            self.assertNotIn("wishlisted_by", item)
+        self.assertTrue(response["Cache-Control"].startswith("public"))
+
+        self.client.force_authenticate(user=None)
+        with self.assertNumQueries(0):
+            anonymous = self.client.get(reverse("products-list"))
+        self.assertEqual(anonymous.content, response.content)
+
+    def test_wishlist_query_count_does_not_grow_with_rows(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("get-wishlist"))
+        self.assertEqual(len(response.json()), 2)
+        self.assertTrue(all(item["is_wishlisted"] for item in response.json()))
+
+    def test_wishlist_ids(self):
+        response = self.client.get(reverse("get-wishlist-ids"))
+        self.assertEqual(response.json(), {"product_ids": [self.products[1].id, self.products[3].id]})
+
+        self.client.post(reverse("toggle-wishlist", args=[self.products[1].id]))
+        response = self.client.get(reverse("get-wishlist-ids"))
+        self.assertEqual(response.json(), {"product_ids": [self.products[3].id]})
+
+
+class ProductSearchTest(TestCase):
+
+    def setUp(self):
+        self.shirt = Product.objects.create(
+            name='Blue Shirt', description='Cotton shirt for summer', price=25.00, category='Clothing'
+        )
+        self.mug = Product.objects.create(
+            name='Coffee Mug', description='Blue ceramic mug', price=9.00, category='Decor'
+        )
+        self.lamp = Product.objects.create(
+            name='Desk Lamp', description='LED lamp', price=30.00, category='Electronics'
+        )
+
+    def search(self, params):
+        response = self.client.get(reverse("products-search"), params)
+        self.assertEqual(response.status_code, 200)
+        return [item["name"] for item in response.json()["results"]]
+
+    def test_search_ranks_name_matches_first(self):
+        self.assertEqual(self.search({"q": "blue"}), ["Blue Shirt", "Coffee Mug"])
+
+    def test_search_matches_prefix_and_category(self):
+        self.assertEqual(self.search({"q": "elec"}), ["Desk Lamp"])
+        self.assertEqual(self.search({"q": "blue", "category": "decor"}), ["Coffee Mug"])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        self.lamp.name = 'Reading Light'
+        self.lamp.save()
+        self.assertEqual(self.search({"q": "reading"}), ["Reading Light"])
+        self.assertEqual(self.search({"q": "desk"}), [])
+
+        self.shirt.delete()
+        self.assertEqual(self.search({"q": "shirt"}), [])
+
+    def test_search_is_paginated(self):
+        response = self.client.get(reverse("products-search"), {"q": "blue", "page_size": 1})
+        data = response.json()
+        self.assertEqual(data["count"], 2)
+        self.assertEqual(len(data["results"]), 1)
+        self.assertIsNotNone(data["next"])
+
+    def test_search_without_query(self):
+        response = self.client.get(reverse("products-search"))
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_looks_up_the_index_once(self):
+        self.search({"q": "blue"})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.search({"q": "lamp"}), ["Desk Lamp"])
+        self.assertFalse([query for query in queries if 'sqlite_master' in query['sql']])
+
+
+class ProductResponseCacheTest(APITestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+        self.admin_user = User.objects.create_superuser(username="admin", password="admin1234")
+
+    def test_repeated_reads_are_served_from_cache(self):
+        first = self.client.get(reverse("products-list"))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse("products-list"))
+        self.assertEqual(first.content, second.content)
+
+        self.client.get(reverse("product-details", args=[self.product.id]))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("product-details", args=[self.product.id]))
+        self.assertContains(response, "Desk Lamp")
+
+    def test_product_write_invalidates_cache(self):
+        self.client.get(reverse("products-list"))
+        self.client.get(reverse("product-details", args=[self.product.id]))
+
+        self.product.name = 'Reading Light'
+        self.product.save()
+
+        self.assertContains(self.client.get(reverse("products-list")), "Reading Light")
+        self.assertContains(self.client.get(reverse("product-details", args=[self.product.id])), "Reading Light")
+
+        self.product.delete()
+        self.assertEqual(self.client.get(reverse("products-list")).json(), [])
+
+    def test_cache_stats(self):
+        self.client.force_authenticate(user=self.admin_user)
+        before = self.client.get(reverse("products-cache-stats")).json()
+        self.client.get(reverse("products-list"))
+        self.client.get(reverse("products-list"))
+        after = self.client.get(reverse("products-cache-stats")).json()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+
+class ProductConditionalGetTest(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+
+    def test_product_tracks_updated_at(self):
+        first = self.product.updated_at
+        self.product.price = 35.00
+        self.product.save()
+        self.assertGreater(self.product.updated_at, first)
+
+    def test_list_etag_and_last_modified(self):
+        response = self.client.get(reverse("products-list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"].startswith('"'))
+
+        response = self.client.get(reverse("products-list"), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = self.client.get(reverse("products-list"), HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_after_edit(self):
+        url = reverse("product-details", args=[self.product.id])
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.product.name = 'Reading Light'
+        self.product.save()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertContains(response, "Reading Light")
+
+
+class ProductFacetsTest(TestCase):
+
+    def setUp(self):
+        Product.objects.create(name='Blue Shirt', description='shirt', price=20.00, category='Clothing', is_new=True)
+        Product.objects.create(name='White Skirt', description='skirt', price=45.00, category='clothing', is_hot=True)
+        Product.objects.create(name='Wall Mirror', description='mirror', price=300.00, category='Decor', stock=False)
+
+    def test_facet_counts(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("products-facets"))
+        data = response.json()
+        self.assertEqual(data["total"], 3)
+        self.assertEqual(data["categories"], [{"value": "Clothing", "count": 2}, {"value": "Decor", "count": 1}])
+        self.assertEqual(data["flags"], {"is_new": 1, "is_hot": 1, "is_popular": 0, "stock": 2})
+        self.assertEqual([bucket["count"] for bucket in data["price"]], [1, 1, 0, 0, 1])
+
+    def test_facets_follow_filters(self):
+        data = self.client.get(reverse("products-facets"), {"category": "clothing", "max_price": "30"}).json()
+        self.assertEqual(data["total"], 1)
+        self.assertEqual(data["flags"]["is_new"], 1)
+        self.assertEqual(data["flags"]["is_hot"], 0)
+
+
+class ProductImageVariantsTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_image(self, size=(1600, 1200)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG')
+        return SimpleUploadedFile("lamp.jpg", buffer.getvalue(), content_type='image/jpeg')
+
+    def test_variants_are_generated_after_commit(self):
+        from PIL import Image
+        from django.core.files.storage import default_storage
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00, image=self.make_image())
+
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        for name, box in [('thumbnail', 150), ('card', 400), ('detail', 1000)]:
+            self.assertTrue(variants[name].endswith('.jpg'))
+            self.assertTrue(variants[f'{name}_webp'].endswith('.webp'))
+            with default_storage.open(variants[f'{name}_webp']) as file:
+                self.assertLessEqual(max(Image.open(file).size), box)
+
+        response = self.client.get(reverse("product-details", args=[product.id]))
+        self.assertEqual(set(response.json()["image_variants"]), {
+            'thumbnail', 'thumbnail_webp', 'card', 'card_webp', 'detail', 'detail_webp'
+        })
+
+    def test_variants_are_not_exposed_for_a_replaced_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00, image=self.make_image())
+
+        product.refresh_from_db()
+        product.image = self.make_image((800, 800))
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            product.save()
+        self.assertEqual(self.client.get(reverse("product-details", args=[product.id])).json()["image_variants"], {})
+
+        for callback in callbacks:
+            callback()
+        response = self.client.get(reverse("product-details", args=[product.id]))
+        self.assertEqual(len(response.json()["image_variants"]), 6)
+
+
+class ProductBulkImportExportTest(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username="admin", password="admin1234")
+        self.lamp = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00, category='Electronics')
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with open(handle, 'w', newline='') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_command_creates_updates_and_reports_errors(self):
+        from django.core.management import call_command
+
+        path = self.write_file('.csv', (
+            "id,name,description,price,category,is_new\n"
+            ",Blue Shirt,Cotton shirt,25.00,Clothing,true\n"
+            f"{self.lamp.id},,,35.50,,\n"
+            ",Broken,No price,,Decor,\n"
+            "9999,Ghost,Missing id,10,Decor,\n"
+        ))
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', path, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertIn("1 created, 1 updated, 2 failed", out.getvalue())
+        self.assertIn("line 4", err.getvalue())
+        self.assertIn("line 5", err.getvalue())
+        self.assertTrue(Product.objects.get(name='Blue Shirt').is_new)
+        self.lamp.refresh_from_db()
+        self.assertEqual(str(self.lamp.price), '35.50')
+        self.assertEqual(self.lamp.name, 'Desk Lamp')
+
+    def test_import_invalidates_catalog_cache(self):
+        from .bulk import import_products
+
+        self.client.get(reverse("products-list"))
+        import_products(io.StringIO('{"name": "Wall Mirror", "description": "Round", "price": "90"}\nnot json\n'), 'jsonl')
+        self.assertContains(self.client.get(reverse("products-list")), "Wall Mirror")
+
+    def test_export_and_import_endpoints(self):
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(reverse("products-export"), {"export_format": "jsonl"})
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertIn('"name": "Desk Lamp"', lines[0])
+
+        upload = SimpleUploadedFile("products.csv", b"name,description,price\nBlue Shirt,Cotton,25\n", content_type='text/csv')
+        response = self.client.post(reverse("products-import"), {"file": upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+
+    def test_import_ignores_derived_columns(self):
+        from .bulk import export_products, import_products
+
+        Product.objects.filter(id=self.lamp.id).update(rating_total=9, rating_count=2, average_rating='4.50')
+        exported = ''.join(export_products('csv'))
+        self.assertIn('4.50,2', exported)
+
+        report = import_products(io.StringIO(
+            f'id,name,description,price,average_rating,rating_count\n'
+            f'{self.lamp.id},Desk Lamp,LED lamp,31,1.00,50\n'
+            f',Blue Shirt,Cotton,25,5.00,10\n'
+        ), 'csv')
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 0))
+        self.lamp.refresh_from_db()
+        self.assertEqual((str(self.lamp.price), str(self.lamp.average_rating), self.lamp.rating_count), ('31.00', '4.50', 2))
+        shirt = Product.objects.get(name='Blue Shirt')
+        self.assertEqual((str(shirt.average_rating), shirt.rating_count), ('0.00', 0))
+
+    def test_import_ignores_popularity_flags(self):
+        from .bulk import export_products, import_products
+
+        Product.objects.filter(id=self.lamp.id).update(is_hot=True)
+        self.assertIn('"is_hot": true', ''.join(export_products('jsonl')))
+
+        import_products(io.StringIO(
+            f'{{"id": {self.lamp.id}, "is_hot": false, "is_popular": true}}\n'
+            '{"name": "Blue Shirt", "description": "Cotton", "price": "25", "is_hot": true}\n'
+        ), 'jsonl')
+        self.lamp.refresh_from_db()
+        self.assertEqual((self.lamp.is_hot, self.lamp.is_popular), (True, False))
+        self.assertFalse(Product.objects.get(name='Blue Shirt').is_hot)
+
+    def test_import_endpoint_requires_admin(self):
+        self.client.force_authenticate(user=User.objects.create_user(username="shopper", password="shopper1234"))
+        self.assertEqual(self.client.get(reverse("products-export")).status_code, 403)
+
+
+class ProductBatchUpdateTest(APITestCase):
+
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(username="admin", password="admin1234")
+        self.shirt = Product.objects.create(name='Blue Shirt', description='Cotton', price=25.00)
+        self.lamp = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+        self.client.force_authenticate(user=self.admin_user)
+
+    def test_batch_update(self):
+        from .cache import get_catalog_version
+
+        version = get_catalog_version()
+        with self.assertNumQueries(4):  # select, savepoint, update, release
+            response = self.client.patch(reverse("products-batch-update"), [
+                {"id": self.shirt.id, "price": "19.99"},
+                {"id": self.lamp.id, "is_new": True, "category": "Electronics"},
+            ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"updated": 2})
+        self.assertEqual(get_catalog_version(), version + 1)
+
+        self.shirt.refresh_from_db()
+        self.lamp.refresh_from_db()
+        self.assertEqual(str(self.shirt.price), '19.99')
+        self.assertTrue(self.lamp.is_new)
+        self.assertEqual(self.lamp.category, 'Electronics')
+        self.assertEqual(self.lamp.name, 'Desk Lamp')
+
+    def test_batch_update_reports_errors_per_row_and_writes_nothing(self):
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": self.shirt.id, "price": "19.99"},
+            {"id": self.lamp.id, "price": "cheap"},
+            {"id": 9999, "price": "1"},
+            {"price": "1"},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [1, 2, 3])
+        self.shirt.refresh_from_db()
+        self.assertEqual(str(self.shirt.price), '25.00')
+
+    def test_batch_update_ignores_ratings(self):
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": self.lamp.id, "price": "29.00", "average_rating": "5.00", "rating_count": 100},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.lamp.refresh_from_db()
+        self.assertEqual((str(self.lamp.price), str(self.lamp.average_rating), self.lamp.rating_count), ('29.00', '0.00', 0))
+
+    def test_batch_update_ignores_popularity_flags(self):
+        Product.objects.filter(id=self.shirt.id).update(is_popular=True)
+        response = self.client.patch(reverse("products-batch-update"), [
+            {"id": self.lamp.id, "is_hot": True, "is_popular": True},
+            {"id": self.shirt.id, "is_popular": False, "price": "20.00"},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.lamp.refresh_from_db()
+        self.shirt.refresh_from_db()
+        self.assertEqual((self.lamp.is_hot, self.lamp.is_popular), (False, False))
+        self.assertEqual((self.shirt.is_popular, str(self.shirt.price)), (True, '20.00'))
+
+    def test_batch_update_requires_admin(self):
+        self.client.force_authenticate(user=User.objects.create_user(username="shopper", password="shopper1234"))
+        response = self.client.patch(reverse("products-batch-update"), [{"id": self.shirt.id, "price": "1"}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ProductReviewsTest(APITestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+        self.users = [User.objects.create_user(username=f"user{i}", password="user12345") for i in range(3)]
+
+    def review(self, user, rating):
+        self.client.force_authenticate(user=user)
+        return self.client.post(reverse("product-reviews", args=[self.product.id]), {"rating": rating, "comment": "ok"}, format='json')
+
+    def test_submitting_reviews_updates_the_aggregate(self):
+        self.assertEqual(self.review(self.users[0], 5).status_code, 201)
+        self.assertEqual(self.review(self.users[1], 4).status_code, 201)
+        self.assertEqual(self.review(self.users[2], 4).status_code, 201)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 3)
+        self.assertEqual(self.product.rating_total, 13)
+        self.assertEqual(str(self.product.average_rating), '4.33')
+
+    def test_invalid_and_duplicate_reviews(self):
+        self.assertEqual(self.review(self.users[0], 6).status_code, 400)
+        self.assertEqual(self.review(self.users[0], 3).status_code, 201)
+        self.assertEqual(self.review(self.users[0], 3).status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+
+    def test_reviews_are_cursor_paginated_newest_first(self):
+        for user, rating in zip(self.users, [1, 2, 3]):
+            self.review(user, rating)
+        self.client.force_authenticate(user=None)
+
+        response = self.client.get(reverse("product-reviews", args=[self.product.id]), {"page_size": 2})
+        data = response.json()
+        self.assertEqual([review["rating"] for review in data["results"]], [3, 2])
+        self.assertEqual(data["results"][0]["user"], "user2")
+        data = self.client.get(data["next"]).json()
+        self.assertEqual([review["rating"] for review in data["results"]], [1])
+
+    def test_anonymous_users_cannot_review(self):
+        response = self.client.post(reverse("product-reviews", args=[self.product.id]), {"rating": 5}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_reconcile_repairs_drift(self):
+        from django.core.management import call_command
+
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=10, rating_total=12, average_rating=1.2)
+
+        out = io.StringIO()
+        call_command('reconcile_ratings', stdout=out)
+        self.assertIn("1 products corrected", out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_total, str(self.product.average_rating)), (2, 7, '3.50'))
+
+
+class ProductAdminEditTest(APITestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Desk Lamp', description='LED lamp', price=30.00)
+        self.client.force_authenticate(user=User.objects.create_superuser(username="admin", password="admin1234"))
+
+    def test_ratings_are_not_editable(self):
+        response = self.client.post(reverse("product-create"), {
+            "name": "Chair", "description": "Oak", "price": "80.00", "stock": True, "image": None,
+            "category": "Decor", "average_rating": "5.00", "rating_count": 100,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["average_rating"], response.json()["rating_count"]), ("0.00", 0))
+
+        response = self.client.put(reverse("product-update", args=[self.product.id]), {
+            "price": "25.00", "image": None, "average_rating": "5.00", "rating_count": 100,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((str(self.product.price), self.product.rating_count), ('25.00', 0))
+
+    def test_popularity_flags_are_not_editable(self):
+        # is_hot / is_popular come from manage.py update_popularity
+        response = self.client.post(reverse("product-create"), {
+            "name": "Chair", "description": "Oak", "price": "80.00", "stock": True, "image": None,
+            "category": "Decor", "is_hot": True, "is_popular": True,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["is_hot"], response.json()["is_popular"]), (False, False))
+
+        response = self.client.put(reverse("product-update", args=[self.product.id]), {
+            "image": None, "is_hot": True, "is_popular": True,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.is_hot, self.product.is_popular), (False, False))
+
+    def test_edit_keeps_concurrent_counter_updates(self):
+        # a review and a wishlist toggle land while the admin's edit is in flight
+        bumped = []
+
+        def bump_counters(execute, sql, params, many, context):
+            if sql.startswith('UPDATE "product_product"') and not bumped:
+                bumped.append(sql)
+                Product.objects.filter(pk=self.product.pk).update(
+                    rating_count=F('rating_count') + 1, rating_total=F('rating_total') + 5,
+                    wishlist_count=F('wishlist_count') + 1,
+                )
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(bump_counters):
+            response = self.client.put(reverse("product-update", args=[self.product.id]), {"price": "25.00", "image": None}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(str(self.product.price), '25.00')
+        self.assertEqual((self.product.rating_count, self.product.rating_total, self.product.wishlist_count), (1, 5, 1))
+
+
+@override_settings(STREAMING_CHUNK_SIZE=2)
+class ProductStreamingTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="streamer", password="user12345")
+        for i in range(5):
+            product = Product.objects.create(name=f'Item {i}', description='streamed', price=10 + i, category='misc')
+            if i % 2:
+                product.wishlisted_by.add(self.user)
+
+    def test_streamed_product_list_matches_regular_response(self):
+        params = {"category": "misc", "sort": "price"}
+        response = self.client.get(reverse("products-list"), params)
+        streamed = self.client.get(reverse("products-list"), {**params, "stream": "true"})
+
+        self.assertEqual(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(streamed['Content-Type'], 'application/json')
+        self.assertEqual(b''.join(streamed.streaming_content), response.content)
+
+    def test_streaming_reads_the_queryset_in_chunks(self):
+        streamed = self.client.get(reverse("products-list"), {"stream": "true"})
+        # nothing is fetched before the body is consumed, then a single cursor
+        # is read 2 rows at a time
+        with self.assertNumQueries(1):
+            body = b''.join(streamed.streaming_content)
+        self.assertEqual(len(json.loads(body)), 5)
+
+    def test_empty_and_invalid_stream_parameter(self):
+        streamed = self.client.get(reverse("products-list"), {"stream": "true", "category": "nothing"})
+        self.assertEqual(b''.join(streamed.streaming_content), b'[]')
+        response = self.client.get(reverse("products-list"), {"stream": "maybe"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streamed_wishlist_matches_regular_response(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("get-wishlist"))
+        streamed = self.client.get(reverse("get-wishlist"), {"stream": "true"})
+
+        body = b''.join(streamed.streaming_content)
+        self.assertEqual(body, response.content)
+        self.assertEqual([product["is_wishlisted"] for product in json.loads(body)], [True, True])
+
+
+class ProductSparseFieldsetTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="sparse", password="user12345")
+        for i in range(3):
+            product = Product.objects.create(name=f'Chair {i}', description='long text ' * 50, price=10 + i, category='furniture')
+            product.wishlisted_by.add(self.user)
+
+    def test_fields_selects_fields_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("products-list"), {"fields": "id,name,price,image"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()[0]), {"id", "name", "price", "image"})
+        select = [query['sql'] for query in queries if 'product_product' in query['sql']][0]
+        self.assertNotIn('"description"', select)
+        self.assertEqual(len(queries), 1)
+
+    def test_exclude_drops_fields(self):
+        response = self.client.get(reverse("products-list"), {"exclude": "description,image_variants"})
+        data = response.json()[0]
+        self.assertNotIn("description", data)
+        self.assertNotIn("image_variants", data)
+        self.assertIn("rating_count", data)
+
+    def test_sparse_cursor_pages_need_no_extra_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("products-list"), {"fields": "id,name", "sort": "price", "page_size": 2})
+        self.assertEqual([product["name"] for product in response.json()["results"]], ["Chair 0", "Chair 1"])
+        response = self.client.get(response.json()["next"])
+        self.assertEqual(response.json()["results"], [{"id": Product.objects.get(name="Chair 2").id, "name": "Chair 2"}])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse("products-list"), {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("secret", response.json()["detail"])
+
+    def test_wishlist_and_detail_honour_fields(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse("get-wishlist"), {"fields": "id,is_wishlisted"})
+        self.assertEqual(response.json()[0], {"id": response.json()[0]["id"], "is_wishlisted": True})
+
+        product = Product.objects.first()
+        response = self.client.get(reverse("product-details", args=[product.id]), {"fields": "name"})
+        self.assertEqual(response.json(), {"name": product.name})
+        self.assertIn("Last-Modified", response)
+
+
+class LeanProductSerializerTest(APITestCase):
+
+    def setUp(self):
+        Product.objects.create(name='Plain', description='no image', price=5)
+        Product.objects.create(
+            name='Pictured', description='with image', price='1234.50', average_rating='4.25', rating_count=4,
+            image='images/pictured.jpg', image_variants={'source': 'images/pictured.jpg', 'card': 'images/variants/pictured-card.jpg'},
+        )
+        Product.objects.create(
+            name='Stale variants', description='image changed', price=99, is_hot=True,
+            image='images/new.png', image_variants={'source': 'images/old.png', 'card': 'images/variants/old-card.png'},
+        )
+
+    def render_both(self, context=None):
+        from rest_framework.renderers import JSONRenderer
+        from .lean import LeanProductSerializer
+        from .serializers import PublicProductSerializer
+
+        products = Product.objects.order_by('id')
+        reference = JSONRenderer().render(PublicProductSerializer(products, many=True, context=context or {}).data)
+        lean = LeanProductSerializer(context)
+        return reference, JSONRenderer().render(lean.serialize(lean.values(products)))
+
+    def test_output_is_byte_identical(self):
+        reference, lean = self.render_both()
+        self.assertEqual(lean, reference)
+        self.assertIn(b'"card":"/images/images/variants/pictured-card.jpg"', lean)
+
+    def test_sparse_output_is_byte_identical(self):
+        reference, lean = self.render_both({'fields': ['id', 'price', 'image_variants'], 'exclude': None})
+        self.assertEqual(lean, reference)
+
+    def test_product_list_is_the_same_with_and_without_lean_serializer(self):
+        params = {"sort": "price", "page_size": 2}
+        with self.settings(CATALOG_LEAN_SERIALIZER=False):
+            reference = self.client.get(reverse("products-list"), params)
+        response = self.client.get(reverse("products-list"), params)
+        self.assertEqual(response.content, reference.content)
+
+    def test_benchmark_command(self):
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command('benchmark_serializers', products=20, repeat=1, stdout=out)
+        self.assertIn("identical output", out.getvalue())
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class QueryPlanMixin:
+    """Checks the plan of the main query an endpoint runs (EXPLAIN of the captured SQL)."""
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # tiny test tables would always be read sequentially otherwise
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def main_query_plan(self, url, params, table):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        sql = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']]
+        self.assertTrue(sql, f"no query on {table}")
+        return self.explain(sql[0])
+
+    def assertIndexed(self, url, params, table, full_read=False):
+        plan = self.main_query_plan(url, params, table)
+        message = f"{url} {params}: {plan}"
+        self.assertNotIn('Seq Scan', plan, message)
+        # a sort of the whole result means the ordering isn't served by an index
+        self.assertNotIn('TEMP B-TREE', plan, message)
+        if not full_read:
+            self.assertIsNone(re.search(rf'^SCAN {table}$', plan, re.M), message)
+        return plan
+
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), "query plans are checked on SQLite / PostgreSQL")
+class ProductQueryPlanTest(QueryPlanMixin, APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="planner", password="user12345")
+        for i in range(30):
+            Product.objects.create(
+                name=f'Product {i}', description='plan', price=i, category=['Books', 'Toys', 'Games'][i % 3],
+                is_new=i % 4 == 0, is_hot=i % 7 == 0, is_popular=i % 9 == 0, average_rating=i % 5,
+            )
+
+    def test_product_list_queries_use_indexes(self):
+        url = reverse("products-list")
+        for params in [
+            {"category": "books"},
+            {"category": "books", "sort": "price"},
+            {"category": "BOOKS", "sort": "-price", "page_size": 5},
+            {"is_new": "true"},
+            {"is_hot": "true", "page_size": 5},
+            {"is_popular": "true"},
+            {"sort": "price", "page_size": 5},
+            {"sort": "-price", "page_size": 5},
+            {"sort": "rating", "page_size": 5},
+            {"min_price": "10", "sort": "price"},
+        ]:
+            self.assertIndexed(url, params, 'product_product')
+        # the newest first pages read the table in primary key order
+        self.assertIndexed(url, {"page_size": 5}, 'product_product', full_read=True)
+
+    def test_review_list_uses_index(self):
+        product = Product.objects.first()
+        Review.objects.create(product=product, user=self.user, rating=4)
+        self.assertIndexed(reverse("product-reviews", args=[product.id]), {}, 'product_review')
+
+    def test_category_filter_is_still_case_insensitive(self):
+        response = self.client.get(reverse("products-list"), {"category": "bOoKs"})
+        self.assertEqual(len(response.json()), 10)
+
+
+class RelatedProductsTest(APITestCase):
+
+    def setUp(self):
+        from account.models import Cart
+
+        self.a, self.b, self.c, self.d = [
+            Product.objects.create(name=name, description='related', price=10) for name in 'ABCD'
+        ]
+        self.carts = [Cart.objects.create(user=User.objects.create_user(username=f"buyer{i}", password="user12345")) for i in range(3)]
+        self.fill(self.carts[0], [self.a, self.b, self.c])
+        self.fill(self.carts[1], [self.a, self.b])
+        self.fill(self.carts[2], [self.b, self.d])
+
+    def fill(self, cart, products):
+        from account.models import CartItem
+
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product)
+
+    def related(self, product):
+        return list(RelatedProduct.objects.filter(product=product).order_by('rank').values_list('related__name', 'score'))
+
+    def test_neighbours_are_counted_and_ranked(self):
+        from .related import update_related_products
+
+        run = update_related_products()
+        self.assertEqual((run.cart_items, run.pairs), (7, 4))
+        self.assertEqual(self.related(self.a), [('B', 2), ('C', 1)])
+        self.assertEqual(self.related(self.b), [('A', 2), ('C', 1), ('D', 1)])
+
+    def test_runs_only_read_new_cart_items(self):
+        from .related import update_related_products
+
+        update_related_products(chunk_size=2)
+        self.fill(self.carts[1], [self.d])
+        run = update_related_products(chunk_size=2)
+
+        self.assertEqual(run.cart_items, 1)
+        self.assertEqual(self.related(self.b), [('A', 2), ('D', 2), ('C', 1)])
+        self.assertEqual(self.related(self.d), [('B', 2), ('A', 1)])
+        self.assertEqual(update_related_products().cart_items, 0)
+
+    def test_interrupted_run_is_completed_by_the_next_one(self):
+        from unittest import mock
+        from .related import update_related_products
+
+        with mock.patch('product.related.refresh_related', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                update_related_products()
+        self.assertEqual(self.related(self.a), [])
+
+        run = update_related_products()
+        self.assertEqual(run.cart_items, 0)
+        self.assertEqual(self.related(self.a), [('B', 2), ('C', 1)])
+
+    def test_related_endpoint(self):
+        from django.core.management import call_command
+
+        call_command('update_related_products', top_k=2, stdout=io.StringIO())
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("product-related", args=[self.b.id]), {"fields": "id,name"})
+        self.assertEqual(response.json(), [{"id": self.a.id, "name": "A"}, {"id": self.c.id, "name": "C"}])
+
+        response = self.client.get(reverse("product-related", args=[self.d.id + 100]))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(HOT_PRODUCTS=1, POPULAR_PRODUCTS=1)
+class ProductPopularityTest(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="shopper", password="user12345")
+        self.steady = Product.objects.create(name='Steady seller', description='old favourite', price=10)
+        self.trending = Product.objects.create(name='Trending', description='new hit', price=10)
+        self.manual = Product.objects.create(name='Hand picked', description='flagged by hand', price=10, is_hot=True, is_popular=True)
+
+    def signal(self, product, kind, days_ago=0, quantity=1):
+        from django.utils import timezone
+
+        signal = ProductSignal.objects.create(product=product, kind=kind, quantity=quantity)
+        ProductSignal.objects.filter(pk=signal.pk).update(created_at=timezone.now() - timezone.timedelta(days=days_ago))
+
+    def test_hot_paths_only_append_signals(self):
+        self.client.force_authenticate(user=self.user)
+        self.client.post(reverse("toggle-wishlist", args=[self.trending.id]))
+        self.client.post(reverse("add-to-cart"), {"product_id": self.trending.id, "quantity": 3}, format='json')
+
+        signals = ProductSignal.objects.values_list('product_id', 'kind', 'quantity')
+        self.assertEqual(sorted(signals), [(self.trending.id, 'cart', 3), (self.trending.id, 'wishlist', 1)])
+        self.trending.refresh_from_db()
+        self.assertFalse(self.trending.is_hot)
+
+    def test_flags_follow_decayed_scores(self):
+        from .popularity import update_popularity
+
+        self.signal(self.steady, ProductSignal.Kind.CART, days_ago=10, quantity=10)
+        self.signal(self.trending, ProductSignal.Kind.WISHLIST)
+        self.signal(self.trending, ProductSignal.Kind.WISHLIST)
+        self.signal(self.steady, ProductSignal.Kind.PURCHASE, days_ago=100)
+
+        changed = update_popularity()
+
+        flags = {product.name: (product.is_hot, product.is_popular) for product in Product.objects.all()}
+        self.assertEqual(flags, {
+            'Steady seller': (False, True),
+            'Trending': (True, False),
+            'Hand picked': (False, False),
+        })
+        self.assertEqual(changed, {'is_hot': 2, 'is_popular': 2})
+        # signals past the window are dropped, a second run has nothing to change
+        self.assertEqual(ProductSignal.objects.count(), 3)
+        self.assertEqual(update_popularity(), {'is_hot': 0, 'is_popular': 0})
+
+    def test_purchases_are_recorded_at_checkout(self):
+        from .popularity import record_signals
+
+        record_signals([self.steady.id, self.trending.id], ProductSignal.Kind.PURCHASE)
+        self.assertEqual(ProductSignal.objects.filter(kind='purchase').count(), 2)
+
+
+@override_settings(SUGGEST_REBUILD_INTERVAL=0, SUGGEST_REBUILD_ASYNC=False)
+class ProductSuggestTest(APITestCase):
+
+    def setUp(self):
+        from .suggest import build_index
+
+        Product.objects.create(name='Blue Shirt', description='cotton', price=20, category='Clothing', rating_count=5)
+        Product.objects.create(name='Blue Jeans', description='denim', price=40, category='Clothing', rating_count=50)
+        Product.objects.create(name='Bluetooth Speaker', description='loud', price=60, category='Electronics')
+        Product.objects.create(name='Table Lamp', description='warm light', price=25, category='Decor')
+        build_index()
+
+    def suggest(self, q, **params):
+        response = self.client.get(reverse("products-suggest"), {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_prefix_matches_names_words_and_categories(self):
+        with self.assertNumQueries(0):
+            data = self.suggest("blu")
+        self.assertEqual([product["name"] for product in data["products"]], ['Blue Jeans', 'Blue Shirt', 'Bluetooth Speaker'])
+        self.assertEqual([product["name"] for product in self.suggest("SHI")["products"]], ['Blue Shirt'])
+        self.assertEqual(self.suggest("cl")["categories"], [{"name": "Clothing", "count": 2}])
+        self.assertEqual(len(self.suggest("blue", limit=1)["products"]), 1)
+        self.assertEqual(self.client.get(reverse("products-suggest")).status_code, 400)
+
+    def test_index_follows_product_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            lamp = Product.objects.create(name='Desk Lamp', description='led', price=15, category='Office')
+        with self.assertNumQueries(0):
+            self.assertEqual([product["id"] for product in self.suggest("desk")["products"]], [lamp.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lamp.name = 'Reading Lamp'
+            lamp.save()
+        self.assertEqual(self.suggest("desk")["products"], [])
+        self.assertEqual(self.suggest("read")["products"][0]["name"], 'Reading Lamp')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            lamp.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("lamp")["products"][0]["name"], 'Table Lamp')
+        self.assertEqual(self.suggest("off")["categories"], [])
+
+    def test_products_without_a_category_can_be_edited(self):
+        from .suggest import build_index
+
+        uncategorized = Product.objects.create(name='Gift Card', description='any amount', price=10, category='')
+        build_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            uncategorized.name = 'Gift Voucher'
+            uncategorized.save()
+        self.assertEqual([product["name"] for product in self.suggest("gift")["products"]], ['Gift Voucher'])
+
+    def test_bulk_writes_trigger_a_rebuild(self):
+        from .cache import catalog_changed
+
+        Product.objects.filter(name='Table Lamp').update(name='Floor Lamp')
+        catalog_changed()
+        self.assertEqual(self.suggest("floor")["products"][0]["name"], 'Floor Lamp')
+
+    def test_lookups_stay_fast_on_a_large_catalog(self):
+        import time
+        from .suggest import SuggestionIndex
+
+        index = SuggestionIndex()
+        index.load(((i, f'Product {i} model {i % 97}', f'Category {i % 40}', i % 13) for i in range(50000)), version=1)
+        started = time.perf_counter()
+        for prefix in ['p', 'product 1', 'mod', 'model 4', 'cat', 'x'] * 20:
+            index.suggest(prefix, 8)
+        self.assertLess((time.perf_counter() - started) / 120, 0.005)
+
+    def test_popular_products_of_long_prefix_ranges_are_found(self):
+        from .suggest import SCAN_LIMIT, SuggestionIndex
+
+        # far more "lamp ..." keys than a lookup scans, the best rated sorts last
+        index = SuggestionIndex()
+        index.load([(i, f'Lamp {i:04}', 'Decor', 0) for i in range(SCAN_LIMIT * 3)] + [(9999, 'Lamp zz', 'Decor', 90)], version=1)
+        self.assertEqual([product["id"] for product in index.suggest("la", 2)["products"]], [9999, 0])
+
+        index.apply(5000, ('Lamp zzz', 'Decor', 95), version=2)
+        self.assertEqual([product["id"] for product in index.suggest("lam", 3)["products"]], [5000, 9999, 0])
+        index.apply(9999, None, version=3)
+        index.apply(5000, ('Lamp zzz', 'Decor', 1), version=4)
+        self.assertEqual([product["id"] for product in index.suggest("l", 3)["products"]], [5000, 0, 1])
+        self.assertEqual([product["id"] for product in index.suggest("lamp 05", 2)["products"]], [500, 501])
+
+
+@override_settings(SUGGEST_REBUILD_INTERVAL=0)
+class ProductSuggestRebuildTest(TransactionTestCase):
+
+    def test_stale_index_is_served_while_rebuilt_in_the_background(self):
+        import time
+        from .cache import catalog_changed
+        from .suggest import build_index
+
+        Product.objects.create(name='Table Lamp', description='warm light', price=25, category='Decor')
+        build_index()
+        Product.objects.filter(name='Table Lamp').update(name='Floor Lamp')
+        catalog_changed()
+
+        def names(q):
+            return [product["name"] for product in self.client.get(reverse("products-suggest"), {"q": q}).json()["products"]]
+
+        self.assertEqual(names("table"), ['Table Lamp'])
+        deadline = time.monotonic() + 5
+        while not names("floor") and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(names("floor"), ['Floor Lamp'])
+        self.assertEqual(names("table"), [])
+
+
+class ProductWishlistCountTest(QueryPlanMixin, APITestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f"fan{i}", password="user12345") for i in range(3)]
+        self.mug = Product.objects.create(name='Mug', description='ceramic', price=8)
+        self.pen = Product.objects.create(name='Pen', description='ink', price=2)
+        self.cap = Product.objects.create(name='Cap', description='cotton', price=12)
+
+    def toggle(self, user, product):
+        self.client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("toggle-wishlist", args=[product.id]))
+        wishlist_queries = [query['sql'].split()[0] for query in queries if 'product_product_wishlisted_by' in query['sql']]
+        return response.json()["is_wishlisted"], wishlist_queries
+
+    def counts(self):
+        return dict(Product.objects.values_list('name', 'wishlist_count'))
+
+    def test_toggle_is_a_conditional_insert_or_delete(self):
+        self.assertEqual(self.toggle(self.users[0], self.mug), (True, ['DELETE', 'INSERT']))
+        self.assertEqual(self.toggle(self.users[1], self.mug), (True, ['DELETE', 'INSERT']))
+        self.assertEqual(self.counts()['Mug'], 2)
+
+        self.assertEqual(self.toggle(self.users[0], self.mug), (False, ['DELETE']))
+        self.assertEqual(self.counts()['Mug'], 1)
+        self.assertEqual(list(self.users[1].wishlist_products.all()), [self.mug])
+
+    def test_counts_follow_other_wishlist_changes(self):
+        self.pen.wishlisted_by.add(*self.users)
+        self.users[0].wishlist_products.add(self.mug)
+        self.assertEqual(self.counts(), {'Mug': 1, 'Pen': 3, 'Cap': 0})
+
+        self.users[0].wishlist_products.clear()
+        self.assertEqual(self.counts(), {'Mug': 0, 'Pen': 2, 'Cap': 0})
+        self.users[1].delete()
+        self.assertEqual(self.counts(), {'Mug': 0, 'Pen': 1, 'Cap': 0})
+
+    def test_most_wishlisted(self):
+        self.pen.wishlisted_by.add(*self.users)
+        self.cap.wishlisted_by.add(self.users[0])
+        self.mug.wishlisted_by.add(self.users[1])
+
+        response = self.client.get(reverse("products-most-wishlisted"), {"fields": "name,wishlist_count"})
+        self.assertEqual(response.json(), [
+            {"name": "Pen", "wishlist_count": 3},
+            {"name": "Cap", "wishlist_count": 1},
+            {"name": "Mug", "wishlist_count": 1},
+        ])
+        self.assertEqual(len(self.client.get(reverse("products-most-wishlisted"), {"limit": 1}).json()), 1)
+        self.assertIndexed(reverse("products-most-wishlisted"), {}, 'product_product')
+
+    def test_catalog_responses_leave_the_count_out(self):
+        response = self.client.get(reverse("products-list"))
+        self.assertNotIn("wishlist_count", response.json()[0])
+
+
+class ProductDetailCacheTest(APITestCase):
+
+    def setUp(self):
+        from .cache import reset_detail_cache_stats
+
+        self.admin_user = User.objects.create_superuser(username="detailadmin", email="d@example.com", password="admin1234")
+        self.kettle = Product.objects.create(name='Kettle', description='steel', price=30)
+        self.toaster = Product.objects.create(name='Toaster', description='2 slots', price=25)
+        reset_detail_cache_stats()
+
+    def get(self, pk, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get(reverse("product-details", args=[pk]))
+
+    def test_only_the_changed_product_is_invalidated(self):
+        self.get(self.kettle.id, 1)
+        self.get(self.toaster.id, 1)
+
+        self.kettle.price = 35
+        self.kettle.save()
+        self.assertEqual(self.get(self.kettle.id, 1).json()["price"], "35.00")
+        self.assertEqual(self.get(self.toaster.id, 0).status_code, 200)
+
+    def test_missing_ids_are_cached_until_created(self):
+        missing = self.toaster.id + 1
+        self.assertEqual(self.get(missing, 1).status_code, 404)
+        self.assertEqual(self.get(missing, 0).status_code, 404)
+
+        created = Product.objects.create(name='Blender', description='glass jar', price=50)
+        self.assertEqual(created.id, missing)
+        self.assertEqual(self.get(missing, 1).json()["name"], 'Blender')
+
+    def test_deleting_a_product_invalidates_its_entry(self):
+        self.get(self.kettle.id, 1)
+        self.client.force_authenticate(user=self.admin_user)
+        self.client.delete(reverse("product-delete", args=[self.kettle.id]))
+        self.assertEqual(self.client.get(reverse("product-details", args=[self.kettle.id])).status_code, 404)
+
+    def test_bulk_writes_invalidate_the_written_products(self):
+        from .bulk import import_products, update_products
+
+        self.get(self.kettle.id, 1)
+        self.get(self.toaster.id, 1)
+        update_products([{"id": self.kettle.id, "price": "31.00"}])
+        self.assertEqual(self.get(self.kettle.id, 1).json()["price"], "31.00")
+        self.get(self.toaster.id, 0)
+
+        import_products(io.StringIO('name,description,price\nKnife,sharp,9\n'), 'csv')
+        self.get(self.toaster.id, 1)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'shop.example.com'])
+    def test_image_urls_are_absolute_for_each_host(self):
+        self.kettle.image = 'images/kettle.jpg'
+        self.kettle.image_variants = {'source': 'images/kettle.jpg', 'card': 'images/variants/kettle-card.jpg'}
+        self.kettle.save()
+
+        data = self.get(self.kettle.id, 1).json()
+        self.assertEqual(data["image"], "http://testserver/images/images/kettle.jpg")
+        self.assertEqual(data["image_variants"], {"card": "http://testserver/images/images/variants/kettle-card.jpg"})
+        with self.assertNumQueries(1):
+            other = self.client.get(reverse("product-details", args=[self.kettle.id]), HTTP_HOST="shop.example.com")
+        self.assertEqual(other.json()["image"], "http://shop.example.com/images/images/kettle.jpg")
+
+        # an edit drops the entries of every host
+        self.kettle.image = 'images/kettle-2.jpg'
+        self.kettle.save()
+        with self.assertNumQueries(1):
+            other = self.client.get(reverse("product-details", args=[self.kettle.id]), HTTP_HOST="shop.example.com")
+        self.assertEqual(other.json()["image"], "http://shop.example.com/images/images/kettle-2.jpg")
+        self.assertEqual(self.get(self.kettle.id, 1).json()["image"], "http://testserver/images/images/kettle-2.jpg")
+
+    def test_list_image_urls_are_absolute(self):
+        Product.objects.filter(id=self.kettle.id).update(image='images/kettle.jpg')
+        images = {row["id"]: row["image"] for row in self.client.get(reverse("products-list")).json()}
+        self.assertEqual(images[self.kettle.id], "http://testserver/images/images/kettle.jpg")
+
+    def test_stats(self):
+        self.get(self.kettle.id, 1)
+        self.get(self.kettle.id, 0)
+        self.get(self.toaster.id + 100, 1)
+        self.get(self.toaster.id + 100, 0)
+        self.kettle.save()
+
+        self.client.force_authenticate(user=self.admin_user)
+        stats = self.client.get(reverse("products-cache-stats")).json()["detail"]
+        self.assertEqual(
+            (stats["hits"], stats["negative_hits"], stats["misses"], stats["evictions"]), (1, 1, 2, 1)
+        )
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_MAX_LAG_SECONDS=10, REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        from django.core.cache import cache
+        from rest_framework.test import APIClient
+
+        cache.clear()
+        self.user = User.objects.create_user(username="replicauser", password="user1234")
+        self.admin_user = User.objects.create_superuser(username="replicaadmin", email="r@example.com", password="admin1234")
+        self.product = Product.objects.create(name='Lamp', description='desk lamp', price=20)
+        self.shopper = APIClient(REMOTE_ADDR='10.0.0.1')
+        self.shopper.force_authenticate(user=self.user)
+        self.browser = APIClient(REMOTE_ADDR='10.0.0.2')
+
+    def replica_behind(self, seconds):
+        import time
+        from unittest import mock
+
+        return mock.patch('my_project.replicas.measure_caught_up_at', side_effect=lambda alias: time.time() - seconds)
+
+    def get_products(self, client, replica_reads):
+        from django.db import connections
+
+        with CaptureQueriesContext(connections['replica']) as replica, CaptureQueriesContext(connection) as primary:
+            response = client.get(reverse("product-details", args=[self.product.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(replica) > 0, len(primary) > 0), (replica_reads, not replica_reads))
+        # the detail is cached, read it from the database again next time
+        self.product.save()
+        self.clear_shared_write()
+
+    def clear_shared_write(self):
+        from django.core.cache import cache
+        from my_project.replicas import SHARED_WRITE_KEY
+
+        cache.delete(SHARED_WRITE_KEY)
+
+    def stats(self):
+        self.browser.force_authenticate(user=self.admin_user)
+        stats = self.browser.get(reverse("replica-stats")).json()
+        self.browser.force_authenticate(user=None)
+        return stats
+
+    def test_catalog_gets_read_from_the_replica(self):
+        self.clear_shared_write()
+        self.get_products(self.browser, True)
+        self.assertEqual(self.stats()["replicas"]["replica"]["reads"], 1)
+
+    def test_writes_and_other_paths_use_the_primary(self):
+        self.shopper.post(reverse("add-to-cart"), {"product_id": self.product.id})
+        self.shopper.get(reverse("get-cart"))
+        stats = self.stats()
+        # the cart and the stats request itself
+        self.assertEqual((stats["primary"]["unsafe"], stats["primary"]["not_routed"]), (1, 2))
+
+    def test_clients_stick_to_the_primary_after_a_write(self):
+        self.clear_shared_write()
+        with self.replica_behind(1):
+            self.shopper.post(reverse("add-to-cart"), {"product_id": self.product.id})
+            self.get_products(self.shopper, False)
+            # other clients don't need the shopper's cart
+            self.get_products(self.browser, True)
+        self.assertEqual(self.stats()["primary"]["sticky"], 1)
+
+        # once the replica has caught up with the write
+        with self.replica_behind(0):
+            self.get_products(self.shopper, True)
+
+    def test_catalog_writes_send_everyone_to_the_primary(self):
+        self.clear_shared_write()
+        with self.replica_behind(1):
+            Product.objects.create(name='Rug', description='wool', price=80)
+            self.assertEqual(self.browser.get(reverse("products-list")).status_code, 200)
+        self.assertEqual(self.stats()["primary"]["shared_write"], 1)
+
+    def test_wishlist_counters_dont_send_everyone_to_the_primary(self):
+        self.clear_shared_write()
+        with self.replica_behind(1):
+            response = self.shopper.post(reverse("toggle-wishlist", args=[self.product.id]))
+            self.assertEqual(response.status_code, 200)
+            self.product.refresh_from_db()
+            self.assertEqual(self.product.wishlist_count, 1)
+            # the shopper reads their own write back, the others keep using the replica
+            self.get_products(self.shopper, False)
+            self.get_products(self.browser, True)
+        stats = self.stats()
+        self.assertEqual((stats["primary"]["sticky"], stats["primary"]["shared_write"]), (1, 0))
+
+    def test_lagging_and_unavailable_replicas_are_skipped(self):
+        from unittest import mock
+
+        self.clear_shared_write()
+        with self.replica_behind(60), self.assertLogs('my_project.replicas', 'WARNING'):
+            self.get_products(self.browser, False)
+            self.assertEqual(self.stats()["replicas"]["replica"]["lag_seconds"], 60)
+        with mock.patch('my_project.replicas.measure_caught_up_at', side_effect=OSError), \
+                self.assertLogs('my_project.replicas', 'WARNING'):
+            self.get_products(self.browser, False)
+            self.assertIsNone(self.stats()["replicas"]["replica"]["lag_seconds"])
+        stats = self.stats()
+        self.assertEqual((stats["primary"]["lagging"], stats["primary"]["unavailable"]), (1, 1))
@@ -3,12 +3,23 @@ from product import views
 
 urlpatterns = [
     path('products/', views.ProductView.as_view(), name="products-list"),
+    path('products/search/', views.ProductSearchView.as_view(), name="products-search"),
+    path('products/most-wishlisted/', views.ProductMostWishlistedView.as_view(), name="products-most-wishlisted"),
+    path('products/suggest/', views.ProductSuggestView.as_view(), name="products-suggest"),
+    path('products/facets/', views.ProductFacetsView.as_view(), name="products-facets"),
+    path('products/cache-stats/', views.ProductCacheStatsView.as_view(), name="products-cache-stats"),
+    path('products/batch-update/', views.ProductBatchUpdateView.as_view(), name="products-batch-update"),
+    path('products/import/', views.ProductImportView.as_view(), name="products-import"),
+    path('products/export/', views.ProductExportView.as_view(), name="products-export"),
     path('product-create/', views.ProductCreateView.as_view(), name="product-create"),
     path('product/<str:pk>/', views.ProductDetailView.as_view(), name="product-details"),
+    path('product/<int:pk>/related/', views.ProductRelatedView.as_view(), name="product-related"),
+    path('product/<int:pk>/reviews/', views.ProductReviewsView.as_view(), name="product-reviews"),
     path('product-update/<str:pk>/', views.ProductEditView.as_view(), name="product-update"),
     path('product-delete/<str:pk>/', views.ProductDeleteView.as_view(), name="product-delete"),
     
     # Use user/ prefix to avoid conflicts
     path('user/wishlist/toggle/<int:product_id>/', views.toggle_wishlist, name="toggle-wishlist"),
     path('user/wishlist/', views.get_wishlist, name="get-wishlist"),
+    path('user/wishlist/ids/', views.get_wishlist_ids, name="get-wishlist-ids"),
 ]
\ No newline at end of file
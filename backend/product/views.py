@@ -1,35 +1,228 @@
-from .models import Product
+from .models import Product, ProductSignal, Review, RelatedProduct
+from django.db import IntegrityError
 from rest_framework import status
 from django.shortcuts import render
 from rest_framework.views import APIView
-from .serializers import ProductSerializer
+from .serializers import ProductSerializer, PublicProductSerializer, MostWishlistedProductSerializer, ReviewSerializer
 from rest_framework.response import Response
 from rest_framework import authentication, permissions
 from rest_framework.decorators import permission_classes, api_view
 from django.shortcuts import get_object_or_404
+from django.utils.http import http_date
+from django.http import StreamingHttpResponse
+import io
+from .filters import SORT_OPTIONS, filter_products, get_sort, sort_products
+from .pagination import ProductCursorPagination, ProductSearchPagination, ReviewCursorPagination, wants_pagination
+from .search import search_products
+from .facets import compute_facets
+from .reviews import add_review
+from .popularity import record_signal
+from .wishlist import toggle_wishlist_item
+from .bulk import FORMATS, import_products, export_products, update_products
+from .cache import cache_catalog_response, cached_product_detail, get_cache_stats, get_detail_cache_stats, get_max_age
+from .suggest import get_index as get_suggestion_index
+from .streaming import wants_streaming, streaming_json_response
+from .fieldsets import get_catalog_context, restrict_queryset
+from .lean import LeanProductSerializer, lean_serializer_enabled
 
 
+# products list, filtered / sorted in the database
+# e.g. /api/products/?category=clothing&is_new=true&min_price=10&sort=price&page_size=24
+# ?stream=true sends the whole (unpaginated) list without building it in memory
+# ?fields=id,name,price,image (or ?exclude=description) returns only those fields
 class ProductView(APIView):
+    pagination_class = ProductCursorPagination
+
     def get(self, request):
-        products = Product.objects.all()
-        serializer = ProductSerializer(products, many=True, context={'request': request})
+        paginator = self.pagination_class()
+        if wants_streaming(request) and not wants_pagination(request, paginator):
+            context = get_catalog_context(request)
+            products = sort_products(filter_products(Product.objects.all(), request.query_params), request.query_params)
+            if lean_serializer_enabled():
+                products = LeanProductSerializer(context).values(products)
+                return streaming_json_response(products, LeanProductSerializer, context)
+            products = restrict_queryset(products, PublicProductSerializer, context)
+            return streaming_json_response(products, PublicProductSerializer, context)
+        return self.list(request)
+
+    @cache_catalog_response
+    def list(self, request):
+        context = get_catalog_context(request)
+        products = filter_products(Product.objects.all(), request.query_params)
+        # the cursor paginator reads the sort fields of the last row
+        ordering = SORT_OPTIONS[get_sort(request.query_params)]
+        if lean_serializer_enabled():
+            serializer = LeanProductSerializer(context)
+            products = serializer.values(products, extra=ordering)
+        else:
+            serializer = None
+            products = restrict_queryset(products, PublicProductSerializer, context, extra=ordering)
+        paginator = self.pagination_class()
+
+        if wants_pagination(request, paginator):
+            page = paginator.paginate_queryset(products, request, view=self)
+            if serializer:
+                return paginator.get_paginated_response(serializer.serialize(page))
+            serializer = PublicProductSerializer(page, many=True, context=context)
+            return paginator.get_paginated_response(serializer.data)
+
+        products = sort_products(products, request.query_params)
+        if serializer:
+            return Response(serializer.serialize(products), status=status.HTTP_200_OK)
+        serializer = PublicProductSerializer(products, many=True, context=context)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+# full text search over name, description and category, best matches first
+# e.g. /api/products/search/?q=blue shirt&category=clothing&page=2
+class ProductSearchView(APIView):
+    pagination_class = ProductSearchPagination
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Search query 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        context = get_catalog_context(request)
+        products = filter_products(Product.objects.all(), request.query_params)
+        products = search_products(restrict_queryset(products, PublicProductSerializer, context), query)
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = PublicProductSerializer(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+
+# products with the most wishlist entries, e.g. /api/products/most-wishlisted/?limit=10
+class ProductMostWishlistedView(APIView):
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), self.max_limit) if limit.isdigit() and int(limit) > 0 else self.default_limit
+
+        products = Product.objects.filter(wishlist_count__gt=0).order_by('-wishlist_count', '-id')[:limit]
+        serializer = MostWishlistedProductSerializer(products, many=True, context=get_catalog_context(request))
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        response['Cache-Control'] = f'public, max-age={get_max_age()}'
+        return response
+
+
+# typeahead: product names and categories starting with the prefix, answered
+# from the in-memory index of product/suggest.py (no query per keystroke)
+# e.g. /api/products/suggest/?q=blu&limit=5
+class ProductSuggestView(APIView):
+    default_limit = 8
+    max_limit = 20
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"detail": "Search query 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), self.max_limit) if limit.isdigit() and int(limit) > 0 else self.default_limit
+
+        response = Response(get_suggestion_index().suggest(query, limit), status=status.HTTP_200_OK)
+        response['Cache-Control'] = f'public, max-age={get_max_age()}'
+        return response
+
+
+# counts per category / flag / price bucket for the current filters
+# e.g. /api/products/facets/?is_new=true&min_price=10
+class ProductFacetsView(APIView):
+
+    @cache_catalog_response
+    def get(self, request):
+        products = filter_products(Product.objects.all(), request.query_params)
+        return Response(compute_facets(products), status=status.HTTP_200_OK)
+
+
+# product details, cached per product (see cached_product_detail); requests
+# with ?fields= / ?exclude= go through the catalog response cache instead
 class ProductDetailView(APIView):
     def get(self, request, pk):
+        if not pk.isdigit():
+            return Response({"detail": "Invalid product ID"}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params:
+            return self.get_sparse(request, pk)
+        response = cached_product_detail(request, int(pk), self.load)
+        if response is None:
+            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        return response
+
+    def load(self, request, pk):
+        product = Product.objects.filter(id=pk).first()
+        if product is None:
+            return None
+        serializer = PublicProductSerializer(product, many=False, context={'request': request})
+        return serializer.data, int(product.updated_at.timestamp())
+
+    @cache_catalog_response
+    def get_sparse(self, request, pk):
+        context = get_catalog_context(request)
+        products = restrict_queryset(Product.objects.all(), PublicProductSerializer, context, extra=['updated_at'])
         try:
-            if not pk.isdigit():
-                return Response({"detail": "Invalid product ID"}, status=status.HTTP_400_BAD_REQUEST)
-            product = Product.objects.get(id=int(pk))
-            serializer = ProductSerializer(product, many=False, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            product = products.get(id=int(pk))
+            serializer = PublicProductSerializer(product, many=False, context=context)
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+            response['Last-Modified'] = http_date(product.updated_at.timestamp())
+            return response
         except Product.DoesNotExist:
             return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# "frequently bought together", best first (precomputed by manage.py update_related_products)
+class ProductRelatedView(APIView):
+
+    @cache_catalog_response
+    def get(self, request, pk):
+        related = RelatedProduct.objects.filter(product_id=pk).select_related('related').order_by('rank')
+        products = [row.related for row in related]
+        if not products and not Product.objects.filter(id=pk).exists():
+            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        serializer = PublicProductSerializer(products, many=True, context=get_catalog_context(request))
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+# reviews of a product (newest first, cursor paginated) / submit a review
+class ProductReviewsView(APIView):
+    pagination_class = ReviewCursorPagination
+
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [permissions.IsAuthenticated()]
+        return []
+
+    def get(self, request, pk):
+        reviews = Review.objects.filter(product_id=pk).select_related('user')
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(reviews, request, view=self)
+        serializer = ReviewSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    def post(self, request, pk):
+        product = get_object_or_404(Product, id=pk)
+        serializer = ReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            review = add_review(product.id, request.user, **serializer.validated_data)
+        except IntegrityError:
+            return Response({"detail": "You have already reviewed this product."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReviewSerializer(review).data, status=status.HTTP_201_CREATED)
+
+
+# hit / miss counters of the catalog response cache and of the product detail cache
+class ProductCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({**get_cache_stats(), "detail": get_detail_cache_stats()}, status=status.HTTP_200_OK)
+
+
 class ProductCreateView(APIView):
     permission_classes = [permissions.IsAdminUser]
     def post(self, request):
@@ -43,9 +236,6 @@ class ProductCreateView(APIView):
             "image": data["image"],
             "category": data["category"],
             "is_new": data.get("is_new", False),
-            "is_popular": data.get("is_popular", False),
-            "average_rating": data.get("average_rating", 0.0),
-            "rating_count": data.get("rating_count", 0),
         }
         serializer = ProductSerializer(data=product, many=False)
         if serializer.is_valid():
@@ -79,70 +269,103 @@ class ProductEditView(APIView):
             "image": data.get("image", product.image),
             "category": data.get("category", product.category),
             "is_new": data.get("is_new", product.is_new),
-            "is_popular": data.get("is_popular", product.is_popular),
-            "average_rating": data.get("average_rating", product.average_rating),
-            "rating_count": data.get("rating_count", product.rating_count),
         }
         serializer = ProductSerializer(product, data=updated_product)
         if serializer.is_valid():
-            serializer.save()
+            # write only the edited columns: the rating and wishlist counters
+            # are bumped with F() by other requests meanwhile
+            for field, value in serializer.validated_data.items():
+                setattr(product, field, value)
+            product.save(update_fields=[*serializer.validated_data, 'updated_at'])
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
             return Response({"detail": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 
+# update many products in one request (all or nothing)
+# body: [{"id": 1, "price": "19.99"}, {"id": 2, "is_hot": true}, ...]
+MAX_BATCH_UPDATES = 5000
+
+
+class ProductBatchUpdateView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def patch(self, request):
+        updates = request.data
+        if not isinstance(updates, list) or not updates:
+            return Response({"detail": "Expected a non-empty list of updates."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(updates) > MAX_BATCH_UPDATES:
+            return Response({"detail": f"At most {MAX_BATCH_UPDATES} updates per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated, errors = update_products(updates)
+        if errors:
+            return Response({"detail": "No products were updated.", "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"updated": updated}, status=status.HTTP_200_OK)
+
+
+# bulk import (multipart "file" field, csv or jsonl) and streaming export of the catalog
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+class ProductImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"detail": "Upload a csv or jsonl file in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if fmt not in FORMATS:
+            return Response({"detail": f"Unknown format '{fmt}', expected csv or jsonl."}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = import_products(io.TextIOWrapper(upload.file, encoding='utf-8', newline=''), fmt)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ProductExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        fmt = request.query_params.get('export_format', 'csv')
+        if fmt not in FORMATS:
+            return Response({"detail": f"Unknown format '{fmt}', expected csv or jsonl."}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(export_products(fmt), content_type=EXPORT_CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def toggle_wishlist(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    if product.wishlisted_by.filter(id=request.user.id).exists():
-        product.wishlisted_by.remove(request.user)
-        return Response({"detail": "Removed from wishlist"}, status=status.HTTP_200_OK)
+    if not toggle_wishlist_item(product.id, request.user.id):
+        return Response({"detail": "Removed from wishlist", "product_id": product.id, "is_wishlisted": False}, status=status.HTTP_200_OK)
     else:
-        product.wishlisted_by.add(request.user)
-        return Response({"detail": "Added to wishlist"}, status=status.HTTP_200_OK)
+        record_signal(product.id, ProductSignal.Kind.WISHLIST)
+        return Response({"detail": "Added to wishlist", "product_id": product.id, "is_wishlisted": True}, status=status.HTTP_200_OK)
 
 
-# ADD THIS MISSING FUNCTION:
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_wishlist(request):
     try:
-        print(f"DEBUG: Getting wishlist for user: {request.user.username} (ID: {request.user.id})")
-        wishlist_products = Product.objects.filter(wishlisted_by=request.user)
-        print(f"DEBUG: Found {wishlist_products.count()} wishlist items")
+        wishlist_products = request.user.wishlist_products.with_wishlisted(request.user).prefetch_related('wishlisted_by')
+        wishlist_products = restrict_queryset(wishlist_products, ProductSerializer, {'request': request})
+        if wants_streaming(request):
+            return streaming_json_response(wishlist_products.order_by('id'), ProductSerializer, {'request': request})
         serializer = ProductSerializer(wishlist_products, many=True, context={'request': request})
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Exception as e:
-        print(f"DEBUG: Error in get_wishlist: {str(e)}")
         return Response({"detail": f"Error fetching wishlist: {str(e)}"}, status=status.HTTP_400_BAD_REQUEST)
 
 
+# ids of the products in the user's wishlist, merged by the client into the
+# (user independent) catalog responses
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def get_wishlist(request):
-    try:
-        print(f"DEBUG: Getting wishlist for user: {request.user.username} (ID: {request.user.id})")
-        
-        # Method 1: Try reverse relationship
-        try:
-            wishlist_products = request.user.wishlist_products.all()
-            print(f"DEBUG: Reverse relation count: {wishlist_products.count()}")
-        except Exception as e:
-            print(f"DEBUG: Reverse relation failed: {e}")
-            # Method 2: Fallback to direct filter
-            wishlist_products = Product.objects.filter(wishlisted_by=request.user)
-            print(f"DEBUG: Direct filter count: {wishlist_products.count()}")
-        
-        serializer = ProductSerializer(wishlist_products, many=True, context={'request': request})
-        print(f"DEBUG: Serialization successful")
-        return Response(serializer.data, status=status.HTTP_200_OK)
-        
-    except Exception as e:
-        print(f"DEBUG: Error in get_wishlist: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return Response(
-            {"detail": f"Error fetching wishlist: {str(e)}"}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
\ No newline at end of file
+def get_wishlist_ids(request):
+    product_ids = request.user.wishlist_products.order_by('id').values_list('id', flat=True)
+    response = Response({"product_ids": list(product_ids)}, status=status.HTTP_200_OK)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,50 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from my_project.replicas import COUNTER_ONLY
+from .models import Product
+
+WishlistItem = Product.wishlisted_by.through
+
+
+def toggle_wishlist_item(product_id, user_id):
+    """Add the product to the user's wishlist, or take it out if it's there.
+
+    Returns True when the product ends up in the wishlist. The toggle is a
+    DELETE, followed by an INSERT only when nothing was deleted (no separate
+    exists() query), and Product.wishlist_count moves with it in the same
+    transaction (as a counter, it doesn't send other clients' catalog reads
+    to the primary, see my_project/replicas.py).
+    """
+    with transaction.atomic():
+        removed, _ = WishlistItem.objects.filter(product_id=product_id, user_id=user_id).delete()
+        if removed:
+            change = -1
+        else:
+            try:
+                with transaction.atomic():
+                    WishlistItem.objects.create(product_id=product_id, user_id=user_id)
+            except IntegrityError:
+                # a concurrent request of the same user added it first
+                return True
+            change = 1
+        Product.objects.db_manager(hints=COUNTER_ONLY).filter(pk=product_id).update(
+            wishlist_count=F('wishlist_count') + change
+        )
+    return change > 0
+
+
+def refresh_wishlist_counts(product_ids=None):
+    """Recount wishlist_count from the wishlist rows (all products by default).
+
+    Used when the wishlist changes some other way than toggle_wishlist_item(),
+    e.g. the admin or a deleted user.
+    """
+    counts = (
+        WishlistItem.objects.filter(product_id=OuterRef('pk'))
+        .order_by().values('product_id').annotate(count=Count('*')).values('count')
+    )
+    products = Product.objects.db_manager(hints=COUNTER_ONLY).all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    return products.update(wishlist_count=Coalesce(Subquery(counts), 0))
@@ -11,6 +11,9 @@ import {
     CART_UPDATE_REQUEST,
     CART_UPDATE_SUCCESS,
     CART_UPDATE_FAIL,
+    CART_BATCH_REQUEST,
+    CART_BATCH_SUCCESS,
+    CART_BATCH_FAIL,
 } from '../constants/index'
 
 import axios from 'axios'
@@ -164,3 +167,37 @@ export const updateCartItem = (product_id, quantity) => async (dispatch, getStat
         })
     }
 }
+
+
+// apply several cart operations in one request, in order and all or nothing
+// e.g. [{ op: "update", product_id: 3, quantity: 2 }, { op: "remove", product_id: 5 }]
+export const applyCartOperations = (operations) => async (dispatch, getState) => {
+    try {
+        dispatch({
+            type: CART_BATCH_REQUEST
+        })
+
+        const {
+            userLoginReducer: { userInfo },
+        } = getState()
+
+        const config = {
+            headers: {
+                "Content-Type": "application/json",
+                Authorization: `Bearer ${userInfo.token}`
+            }
+        }
+
+        const { data } = await axios.post("/account/cart/batch/", { operations }, config)
+
+        dispatch({
+            type: CART_BATCH_SUCCESS,
+            payload: data
+        })
+    } catch (error) {
+        dispatch({
+            type: CART_BATCH_FAIL,
+            payload: error.response && error.response.data.detail ? error.response.data.detail : error.message
+        })
+    }
+}
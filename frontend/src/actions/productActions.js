@@ -28,15 +28,15 @@ import {
 import axios from 'axios'
 
 
-// products list
-export const getProductsList = () => async (dispatch) => {
+// products list (params are passed to the api as filters, e.g. { category: "clothing" })
+export const getProductsList = (params = {}) => async (dispatch) => {
     try {
         dispatch({
             type: PRODUCTS_LIST_REQUEST
         })
 
         // call api
-        const { data } = await axios.get("/api/products/")
+        const { data } = await axios.get("/api/products/", { params })
 
         dispatch({
             type: PRODUCTS_LIST_SUCCESS,
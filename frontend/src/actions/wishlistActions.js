@@ -9,6 +9,9 @@ import {
     WISHLIST_GET_REQUEST,
     WISHLIST_GET_SUCCESS,
     WISHLIST_GET_FAIL,
+    WISHLIST_IDS_REQUEST,
+    WISHLIST_IDS_SUCCESS,
+    WISHLIST_IDS_FAIL,
 } from '../constants'
 
 export const toggleWishlist = (productId) => async (dispatch, getState) => {
@@ -86,4 +89,42 @@ export const getWishlist = () => async (dispatch, getState) => {
                 : error.message,
         })
     }
-}
\ No newline at end of file
+}
+
+// ids of the wishlisted products (the products list itself is the same for every user)
+export const getWishlistIds = () => async (dispatch, getState) => {
+    try {
+        dispatch({
+            type: WISHLIST_IDS_REQUEST,
+        })
+
+        const {
+            userLoginReducer: { userInfo },
+        } = getState()
+
+        const config = {
+            headers: {
+                'Content-type': 'application/json',
+                Authorization: `Bearer ${userInfo.token}`
+            }
+        }
+
+        const { data } = await axios.get(
+            `/api/user/wishlist/ids/`,
+            config
+        )
+
+        dispatch({
+            type: WISHLIST_IDS_SUCCESS,
+            payload: data.product_ids,
+        })
+
+    } catch (error) {
+        dispatch({
+            type: WISHLIST_IDS_FAIL,
+            payload: error.response && error.response.data.detail
+                ? error.response.data.detail
+                : error.message,
+        })
+    }
+}
@@ -54,6 +54,9 @@ const ChargeCardComponent = ({ selectedAddressId, addressSelected, checkoutData
             total_price: totalAmount,
             is_delivered: false,
             delivered_at: "Not Delivered",
+            // "Buy now" buys one product, a cart checkout what the server has in the cart
+            checkout_type: isCartCheckout ? 'cart' : 'product',
+            product_id: isCartCheckout ? undefined : items[0]?.product?.id,
             // Add metadata for cart checkout
             metadata: isCartCheckout ? {
                 items_count: items.length,
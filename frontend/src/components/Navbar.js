@@ -1,8 +1,9 @@
-import React from "react";
+import React, { useEffect } from "react";
 import { useDispatch, useSelector } from "react-redux";
 import { Navbar, Nav, Container, NavDropdown } from "react-bootstrap";
 import { LinkContainer } from "react-router-bootstrap";
 import { logout } from "../actions/userActions";
+import { getWishlistIds } from "../actions/wishlistActions";
 import { useHistory } from "react-router-dom";
 import SearchBarForProducts from "./SearchBarForProducts";
 import "../styles/navbar.css";
@@ -14,6 +15,13 @@ function NavBar() {
     const userLoginReducer = useSelector((state) => state.userLoginReducer);
     const { userInfo } = userLoginReducer;
 
+    // the products list is shared by all users, wishlist state is loaded separately
+    useEffect(() => {
+        if (userInfo) {
+            dispatch(getWishlistIds());
+        }
+    }, [dispatch, userInfo]);
+
     const logoutHandler = () => {
         dispatch(logout());
         history.push("/login");
@@ -9,11 +9,15 @@ import "../styles/product.css";
 function Product({ product }) {
     const dispatch = useDispatch();
     const { userInfo } = useSelector(state => state.userLoginReducer);
+    const { productIds: wishlistedIds } = useSelector(state => state.wishlistIdsReducer);
 
     const isInStock = product.stock !== undefined ? product.stock : true;
     const isNew = product.is_new || false;
     const isPopular = product.is_popular || false;
-    const isWishlisted = product.is_wishlisted || false;
+    const isWishlisted = product.is_wishlisted || wishlistedIds.includes(product.id);
+    // card sized WebP copy once the server has generated it, the original image until then
+    const variants = product.image_variants || {};
+    const imageSrc = variants.card_webp || product.image || "/images/placeholder.png";
     
     const rating = 4.0 + ((product.id % 10) / 10);
 
@@ -55,7 +59,7 @@ function Product({ product }) {
             <div className="product-image-section">
                 <Link to={`/product/${product.id}`}>
                     <img
-                        src={product.image || "/images/placeholder.png"}
+                        src={imageSrc}
                         alt={product.name}
                         className="product-image"
                         onError={(e) => {
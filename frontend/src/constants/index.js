@@ -146,6 +146,10 @@ export const CART_UPDATE_REQUEST = "CART_UPDATE_REQUEST"
 export const CART_UPDATE_SUCCESS = "CART_UPDATE_SUCCESS"
 export const CART_UPDATE_FAIL = "CART_UPDATE_FAIL"
 
+export const CART_BATCH_REQUEST = "CART_BATCH_REQUEST"
+export const CART_BATCH_SUCCESS = "CART_BATCH_SUCCESS"
+export const CART_BATCH_FAIL = "CART_BATCH_FAIL"
+
 
 
 // wishlist actions
@@ -159,4 +163,8 @@ export const WISHLIST_REMOVE_FAIL = "WISHLIST_REMOVE_FAIL"
 
 export const WISHLIST_GET_REQUEST = "WISHLIST_GET_REQUEST"
 export const WISHLIST_GET_SUCCESS = "WISHLIST_GET_SUCCESS"
-export const WISHLIST_GET_FAIL = "WISHLIST_GET_FAIL"
\ No newline at end of file
+export const WISHLIST_GET_FAIL = "WISHLIST_GET_FAIL"
+
+export const WISHLIST_IDS_REQUEST = "WISHLIST_IDS_REQUEST"
+export const WISHLIST_IDS_SUCCESS = "WISHLIST_IDS_SUCCESS"
+export const WISHLIST_IDS_FAIL = "WISHLIST_IDS_FAIL"
\ No newline at end of file
@@ -1,11 +1,17 @@
-import React, { useEffect, useState } from 'react';
+import React, { useCallback, useEffect, useRef, useState } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
 import { Link, useHistory } from 'react-router-dom';
 import { Container, Row, Col, Spinner } from 'react-bootstrap';
 import Message from '../components/Message';
-import { getCart, removeFromCart, updateCartItem } from '../actions/cartActions';
+import { getCart, applyCartOperations } from '../actions/cartActions';
 import '../styles/cart.css';
 
+// quantity changes are saved together, this long after the last click (ms)
+const CART_BATCH_DELAY = 600;
+
+const toUpdates = (quantities) =>
+    Object.entries(quantities).map(([productId, quantity]) => ({ op: 'update', product_id: Number(productId), quantity }));
+
 // Custom Tooltip Component
 const CustomTooltip = ({ text, children, placement = 'top' }) => {
     const [show, setShow] = useState(false);
@@ -41,10 +47,18 @@ function CartPage() {
     const [showRemoveModal, setShowRemoveModal] = useState(false);
     const [removeProductId, setRemoveProductId] = useState(null);
 
+    // quantities changed on this page but not saved yet, by product id (shown instead of the cart's)
+    const [pendingQuantities, setPendingQuantities] = useState({});
+    // the ones not sent yet; sent by the timer, when leaving the page or before checkout
+    const unsentQuantities = useRef({});
+    const batchTimer = useRef(null);
+
     // cart items with fallback
     const items = cart?.items || [];
-    const totalItems = items.reduce((acc, item) => acc + item.quantity, 0);
-    const totalPrice = items.reduce((acc, item) => acc + parseFloat(item.product.price || 0) * item.quantity, 0);
+    const quantityOf = (item) =>
+        pendingQuantities[item.product.id] !== undefined ? pendingQuantities[item.product.id] : item.quantity;
+    const totalItems = items.reduce((acc, item) => acc + quantityOf(item), 0);
+    const totalPrice = items.reduce((acc, item) => acc + parseFloat(item.product.price || 0) * quantityOf(item), 0);
 
     useEffect(() => {
         if (!userInfo) {
@@ -54,6 +68,42 @@ function CartPage() {
         }
     }, [dispatch, userInfo, history]);
 
+    // send the unsent quantities in one request, resolves with them once it is done
+    const sendQuantities = useCallback(() => {
+        clearTimeout(batchTimer.current);
+        const sent = unsentQuantities.current;
+        unsentQuantities.current = {};
+        if (Object.keys(sent).length === 0) {
+            return Promise.resolve(sent);
+        }
+        return dispatch(applyCartOperations(toUpdates(sent))).then(() => sent);
+    }, [dispatch]);
+
+    // leaving the page must not drop the changes waiting for the timer
+    useEffect(() => () => {
+        sendQuantities();
+    }, [sendQuantities]);
+
+    const saveQuantities = () => {
+        sendQuantities().then((sent) => {
+            // keep what was changed again while the request was running
+            setPendingQuantities((current) => {
+                const rest = { ...current };
+                Object.keys(sent).forEach((productId) => {
+                    if (rest[productId] === sent[productId]) {
+                        delete rest[productId];
+                    }
+                });
+                return rest;
+            });
+        });
+    };
+
+    // the checkout page reads the cart from the server, save the changes first
+    const proceedToCheckout = () => {
+        sendQuantities().then(() => history.push('/cartcheckout'));
+    };
+
     const handleRemoveFromCart = (productId) => {
         setRemoveProductId(productId);
         setShowRemoveModal(true);
@@ -61,7 +111,12 @@ function CartPage() {
 
     const confirmRemove = () => {
         if (removeProductId) {
-            dispatch(removeFromCart(removeProductId));
+            // the unsent quantity changes go in the same request
+            clearTimeout(batchTimer.current);
+            const updates = toUpdates(unsentQuantities.current).filter((update) => update.product_id !== removeProductId);
+            unsentQuantities.current = {};
+            dispatch(applyCartOperations([...updates, { op: 'remove', product_id: removeProductId }]));
+            setPendingQuantities({});
         }
         setShowRemoveModal(false);
         setRemoveProductId(null);
@@ -74,7 +129,11 @@ function CartPage() {
 
     const handleQuantityChange = (productId, newQuantity) => {
         if (newQuantity > 0) {
-            dispatch(updateCartItem(productId, newQuantity));
+            unsentQuantities.current = { ...unsentQuantities.current, [productId]: newQuantity };
+            setPendingQuantities((current) => ({ ...current, [productId]: newQuantity }));
+            // saved once the clicking stops
+            clearTimeout(batchTimer.current);
+            batchTimer.current = setTimeout(saveQuantities, CART_BATCH_DELAY);
         } else if (newQuantity === 0) {
             handleRemoveFromCart(productId);
         }
@@ -136,21 +195,21 @@ function CartPage() {
                                                     </div>
                                                     <div className="quantity-controls">
                                                         <CustomTooltip
-                                                            text={item.quantity <= 1 ? "Minimum quantity is 1" : "Decrease quantity"}
+                                                            text={quantityOf(item) <= 1 ? "Minimum quantity is 1" : "Decrease quantity"}
                                                         >
                                                             <button
                                                                 className="quantity-btn"
-                                                                disabled={item.quantity <= 1}
-                                                                onClick={() => handleQuantityChange(item.product.id, item.quantity - 1)}
+                                                                disabled={quantityOf(item) <= 1}
+                                                                onClick={() => handleQuantityChange(item.product.id, quantityOf(item) - 1)}
                                                             >
                                                                 −
                                                             </button>
                                                         </CustomTooltip>
-                                                        <span className="quantity-display">{item.quantity}</span>
+                                                        <span className="quantity-display">{quantityOf(item)}</span>
                                                         <CustomTooltip text="Increase quantity">
                                                             <button
                                                                 className="quantity-btn"
-                                                                onClick={() => handleQuantityChange(item.product.id, item.quantity + 1)}
+                                                                onClick={() => handleQuantityChange(item.product.id, quantityOf(item) + 1)}
                                                             >
                                                                 +
                                                             </button>
@@ -183,11 +242,9 @@ function CartPage() {
                                             <span>Total Price:</span>
                                             <span className="summary-price">₹ {totalPrice.toFixed(2)}</span>
                                         </div>
-                                        <Link to="/cartcheckout">
-                                            <button className="checkout-btn gradient-btn">
-                                                Proceed to Checkout
-                                            </button>
-                                        </Link>
+                                        <button className="checkout-btn gradient-btn" onClick={proceedToCheckout}>
+                                            Proceed to Checkout
+                                        </button>
                                     </div>
                                 </Col>
                             </Row>
@@ -0,0 +1,78 @@
+import React from 'react';
+import { render, screen, fireEvent, act } from '@testing-library/react';
+import { Provider } from 'react-redux';
+import { createStore, applyMiddleware } from 'redux';
+import thunk from 'redux-thunk';
+import { MemoryRouter, Route } from 'react-router-dom';
+import axios from 'axios';
+import allReducers from '../reducers/index';
+import CartPage from './CartPage';
+
+jest.mock('axios', () => ({ get: jest.fn(), post: jest.fn() }));
+
+const cart = {
+    id: 1,
+    items: [{ id: 1, quantity: 1, product: { id: 7, name: 'Desk Lamp', price: '30.00', image: '' } }],
+    total_price: '30.00',
+};
+
+const batchOf = (quantity) => ['/account/cart/batch/', { operations: [{ op: 'update', product_id: 7, quantity }] }, expect.anything()];
+
+const renderCartPage = () => {
+    const store = createStore(allReducers, { userLoginReducer: { userInfo: { token: 'token' } } }, applyMiddleware(thunk));
+    return render(
+        <Provider store={store}>
+            <MemoryRouter initialEntries={['/cart']}>
+                <Route path="/cart" component={CartPage} />
+                <Route path="/cartcheckout" render={() => 'checkout page'} />
+            </MemoryRouter>
+        </Provider>
+    );
+};
+
+beforeEach(() => {
+    axios.get.mockResolvedValue({ data: cart });
+    axios.post.mockResolvedValue({ data: cart });
+});
+
+afterEach(() => {
+    jest.useRealTimers();
+    jest.clearAllMocks();
+});
+
+test('quantity changes are saved in one request once the clicking stops', async () => {
+    renderCartPage();
+    const increase = await screen.findByText('+');
+    jest.useFakeTimers();
+
+    fireEvent.click(increase);
+    fireEvent.click(increase);
+    expect(axios.post).not.toHaveBeenCalled();
+
+    await act(async () => {
+        jest.advanceTimersByTime(600);
+    });
+    expect(axios.post).toHaveBeenCalledTimes(1);
+    expect(axios.post).toHaveBeenCalledWith(...batchOf(3));
+});
+
+test('a change waiting for the timer is saved when the page is left', async () => {
+    const { unmount } = renderCartPage();
+    fireEvent.click(await screen.findByText('+'));
+    expect(axios.post).not.toHaveBeenCalled();
+
+    unmount();
+    expect(axios.post).toHaveBeenCalledTimes(1);
+    expect(axios.post).toHaveBeenCalledWith(...batchOf(2));
+});
+
+test('checkout waits for the pending changes to be saved', async () => {
+    renderCartPage();
+    fireEvent.click(await screen.findByText('+'));
+
+    fireEvent.click(screen.getByText('Proceed to Checkout'));
+    expect(axios.post).toHaveBeenCalledWith(...batchOf(2));
+    await screen.findByText('checkout page');
+    // nothing left to send when the cart page goes away
+    expect(axios.post).toHaveBeenCalledTimes(1);
+});
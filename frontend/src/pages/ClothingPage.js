@@ -13,7 +13,7 @@ function ClothingPage() {
     const { loading, error, products } = productsListReducer;
 
     useEffect(() => {
-        dispatch(getProductsList());
+        dispatch(getProductsList({ category: "clothing" }));
         dispatch({ type: CREATE_PRODUCT_RESET });
     }, [dispatch]);
 
@@ -13,7 +13,7 @@ function DecorPage() {
     const { loading, error, products } = productsListReducer;
 
     useEffect(() => {
-        dispatch(getProductsList());
+        dispatch(getProductsList({ category: "decor" }));
         dispatch({ type: CREATE_PRODUCT_RESET });
     }, [dispatch]);
 
@@ -14,7 +14,7 @@ function ElectronicsPage() {
     const { loading, error, products } = productsListReducer;
 
     useEffect(() => {
-        dispatch(getProductsList());
+        dispatch(getProductsList({ category: "electronics" }));
         dispatch({ type: CREATE_PRODUCT_RESET });
     }, [dispatch]);
 
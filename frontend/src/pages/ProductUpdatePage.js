@@ -79,7 +79,6 @@ const ProductUpdatePage = ({ match }) => {
         form_data.append('stock', stock)
         form_data.append('category', category)
         form_data.append('is_new', isNew)
-        form_data.append('is_popular', isPopular)
         
         // ONLY append image if a new one was selected
         if (image && image !== "") {
@@ -283,11 +282,11 @@ const ProductUpdatePage = ({ match }) => {
                                 label={
                                     <>
                                         <Badge bg="danger" className="me-2">Popular</Badge>
-                                        Mark as Popular Product
+                                        Popular Product (set automatically from wishlist, cart and purchase activity)
                                     </>
                                 }
                                 checked={isPopular}
-                                onChange={(e) => setIsPopular(e.target.checked)}
+                                disabled
                             />
                         </Form.Group>
                     </div>
@@ -11,6 +11,9 @@ import {
     CART_UPDATE_REQUEST,
     CART_UPDATE_SUCCESS,
     CART_UPDATE_FAIL,
+    CART_BATCH_REQUEST,
+    CART_BATCH_SUCCESS,
+    CART_BATCH_FAIL,
 } from '../constants/index'
 
 export const cartReducer = (state = { cart: { items: [] } }, action) => {
@@ -33,6 +36,16 @@ export const cartReducer = (state = { cart: { items: [] } }, action) => {
         case CART_UPDATE_FAIL:
             return { ...state, loading: false, error: action.payload }
 
+        // batched edits keep the cart on screen while they are saved
+        case CART_BATCH_REQUEST:
+            return { ...state, updating: true, error: null }
+
+        case CART_BATCH_SUCCESS:
+            return { ...state, updating: false, cart: action.payload, error: null }
+
+        case CART_BATCH_FAIL:
+            return { ...state, updating: false, error: action.payload }
+
         default:
             return state
     }
@@ -17,7 +17,7 @@ import {
 } from "./cardReducers";
 
 import { cartReducer } from './cartReducers'
-import { wishlistReducer } from './wishlistReducers'
+import { wishlistReducer, wishlistIdsReducer } from './wishlistReducers'
 
 import {
     userLoginReducer,
@@ -60,6 +60,7 @@ const reducer = combineReducers({
     deleteUserAccountReducer,
     cartReducer,
     wishlistReducer,
+    wishlistIdsReducer,
 })
 
 export default reducer
\ No newline at end of file
@@ -7,7 +7,11 @@ import {
     WISHLIST_REMOVE_FAIL,
     WISHLIST_GET_REQUEST,
     WISHLIST_GET_SUCCESS,
-    WISHLIST_GET_FAIL
+    WISHLIST_GET_FAIL,
+    WISHLIST_IDS_REQUEST,
+    WISHLIST_IDS_SUCCESS,
+    WISHLIST_IDS_FAIL,
+    USER_LOGOUT
 } from '../constants'
 
 export const wishlistReducer = (state = { wishlistItems: [] }, action) => {
@@ -46,4 +50,33 @@ export const wishlistReducer = (state = { wishlistItems: [] }, action) => {
         default:
             return state
     }
-}
\ No newline at end of file
+}
+
+// wishlisted product ids, merged into the products list by the Product card
+export const wishlistIdsReducer = (state = { productIds: [] }, action) => {
+    switch (action.type) {
+        case WISHLIST_IDS_REQUEST:
+            return { ...state, loading: true }
+
+        case WISHLIST_IDS_SUCCESS:
+            return { loading: false, productIds: action.payload }
+
+        case WISHLIST_ADD_SUCCESS:
+            return {
+                ...state,
+                productIds: action.payload.is_wishlisted
+                    ? [...state.productIds.filter(id => id !== action.payload.product_id), action.payload.product_id]
+                    : state.productIds.filter(id => id !== action.payload.product_id)
+            }
+
+        case WISHLIST_IDS_FAIL:
+            return { ...state, loading: false, error: action.payload }
+
+        // the next user must not see the previous user's hearts
+        case USER_LOGOUT:
+            return { productIds: [] }
+
+        default:
+            return state
+    }
+}